@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+"""Measure the peak memory of downloading many subtitles from a local OpenSubtitles server"""
+
+import argparse
+import base64
+import datetime
+import gzip
+import hashlib
+from pathlib import Path
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from xmlrpc.server import SimpleXMLRPCServer
+
+project_dir = Path(__file__).resolve().parents[2]
+
+sys.path += [str(project_dir)]
+
+from subdownloader.client import add_client_module_dependencies
+from subdownloader.client.internationalization import i18n_install
+
+WORDS = ['the', 'subtitle', 'movie', 'where', 'are', 'you', 'going', 'tonight', 'nothing', 'happened', 'again',
+         'remember', 'me', 'never', 'always', 'door', 'window', 'hello', 'goodbye', 'please']
+
+NB_PAYLOADS = 16
+
+
+def subtitle_contents(payload_i, size):
+    rnd = random.Random(payload_i)
+    lines = []
+    length = 0
+    line_i = 0
+    while length < size:
+        line = '{}\n00:00:{:02},000 --> 00:00:{:02},500\n{}\n\n'.format(
+            line_i, line_i % 60, line_i % 60, ' '.join(rnd.choice(WORDS) for _ in range(8)))
+        lines.append(line)
+        length += len(line)
+        line_i += 1
+    return ''.join(lines).encode()
+
+
+def run_server(size):
+    payloads = [base64.b64encode(gzip.compress(subtitle_contents(i, size))).decode() for i in range(NB_PAYLOADS)]
+
+    def DownloadSubtitles(token, ids):
+        return {
+            'status': '200 OK',
+            'data': [{'idsubtitlefile': id_online, 'data': payloads[int(id_online) % NB_PAYLOADS]}
+                     for id_online in ids],
+        }
+
+    server = SimpleXMLRPCServer(('127.0.0.1', 0), logRequests=False, allow_none=True)
+    server.register_function(lambda *args: {'status': '200 OK', 'token': 'token'}, 'LogIn')
+    server.register_function(lambda *args: {'status': '200 OK'}, 'LogOut')
+    server.register_function(lambda *args: {'status': '200 OK'}, 'NoOperation')
+    server.register_function(DownloadSubtitles, 'DownloadSubtitles')
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def download_legacy(provider, rsubs, directory):
+    """
+    Download like the original implementation: all payloads of all windows, then all decoded subtitles.
+    """
+    from subdownloader.provider import window_iterator
+    from subdownloader.util import unzip_bytes
+    map_id_data = {}
+    for rsub_window in window_iterator(rsubs, 20):
+        result = provider._xmlrpc.DownloadSubtitles(provider._token, [rsub.get_id_online() for rsub in rsub_window])
+        map_id_data.update({item['idsubtitlefile']: item['data'] for item in result['data']})
+    subtitles = [unzip_bytes(base64.b64decode(map_id_data[rsub.get_id_online()])).read() for rsub in rsubs]
+    for rsub, subtitle in zip(rsubs, subtitles):
+        (directory / '{}.srt'.format(rsub.get_id_online())).write_bytes(subtitle)
+
+
+def download_list(provider, rsubs, directory):
+    subtitles = provider.download_subtitles(rsubs)
+    for rsub, subtitle in zip(rsubs, subtitles):
+        (directory / '{}.srt'.format(rsub.get_id_online())).write_bytes(subtitle)
+
+
+def download_stream(provider, rsubs, directory):
+    provider.write_subtitles([(rsub, directory / '{}.srt'.format(rsub.get_id_online())) for rsub in rsubs])
+
+
+DOWNLOADERS = [
+    ('legacy', download_legacy),
+    ('list', download_list),
+    ('stream', download_stream),
+]
+
+
+def run_client(url, mode, nb_subtitles, size):
+    add_client_module_dependencies()
+    i18n_install()
+    from subdownloader.languages.language import Language
+    from subdownloader.provider.opensubtitles import OpenSubtitles, OpenSubtitlesSettings, OpenSubtitlesSubtitleFile
+
+    md5_hashes = [hashlib.md5(subtitle_contents(i, size)).hexdigest() for i in range(NB_PAYLOADS)]
+    rsubs = [OpenSubtitlesSubtitleFile(filename='{}.srt'.format(i), file_size=size,
+                                       md5_hash=md5_hashes[i % NB_PAYLOADS], id_online=str(i), download_link=None,
+                                       link='', uploader='', language=Language.from_xxx('eng'), rating=0.,
+                                       date=datetime.datetime(2019, 1, 1))
+             for i in range(nb_subtitles)]
+    provider = OpenSubtitles(OpenSubtitlesSettings(request_rate=0., download_quota=0))
+    provider.URL = url
+    provider.login()
+    downloader = dict(DOWNLOADERS)[mode]
+    rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    with tempfile.TemporaryDirectory() as tmpdir:
+        start = time.perf_counter()
+        downloader(provider, rsubs, Path(tmpdir))
+        elapsed = time.perf_counter() - start
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    provider.disconnect()
+    # ru_maxrss is in KiB on Linux
+    print('{mode:<8} {t:>8.3f} s  peak rss {peak:>8.1f} MiB  (+{delta:.1f} MiB)'.format(
+        mode=mode, t=elapsed, peak=rss_peak / 1024, delta=(rss_peak - rss_start) / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--subtitles', type=int, default=1000, help='number of subtitles')
+    parser.add_argument('--size', type=int, default=64 * 1024, help='size (in bytes) of a subtitle')
+    parser.add_argument('--client', metavar='MODE', choices=[name for name, _ in DOWNLOADERS], default=None,
+                        help='run one download in this process (internal)')
+    parser.add_argument('--url', default=None, help='url of the server (internal)')
+    ns = parser.parse_args()
+
+    if ns.client is not None:
+        run_client(ns.url, ns.client, ns.subtitles, ns.size)
+        return
+
+    server = run_server(ns.size)
+    url = 'http://{}:{}/RPC2'.format(*server.server_address)
+    print('{} subtitles of {} KiB'.format(ns.subtitles, ns.size // 1024))
+    # Every download runs in a fresh process, so the peak memory of one does not hide the other.
+    for name, _ in DOWNLOADERS:
+        subprocess.check_call([sys.executable, __file__, '--client', name, '--url', url,
+                               '--subtitles', str(ns.subtitles), '--size', str(ns.size)])
+    server.shutdown()
+    server.server_close()
+
+
+if __name__ == '__main__':
+    main()
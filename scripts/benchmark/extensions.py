@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+"""Measure the time to classify synthetic filenames by extension"""
+
+import argparse
+import os
+from pathlib import Path
+import random
+import sys
+import time
+
+project_dir = Path(__file__).resolve().parents[2]
+
+sys.path += [str(project_dir)]
+
+from subdownloader.filescan import ExtensionClassifier, filter_files_extensions
+from subdownloader.subtitle2 import SUBTITLES_EXT
+from subdownloader.video2 import VIDEOS_EXT
+
+OTHER_EXT = ['nfo', 'jpg', 'png', 'sfv', 'nzb', 'exe', 'html', 'md', '']
+
+
+def create_filenames(nb_files, seed):
+    rnd = random.Random(seed)
+    extensions = VIDEOS_EXT + SUBTITLES_EXT + OTHER_EXT * 10
+    return ['file{}.{}'.format(file_i, rnd.choice(extensions)) for file_i in range(nb_files)]
+
+
+def classify_lists(filenames, paths):
+    """
+    Classify like the original implementation: linear search in the extension lists.
+    """
+    result = [[], []]
+    for filename in filenames:
+        ext = os.path.splitext(filename)[1][1:].lower()
+        for ext_i, ext_list in enumerate((SUBTITLES_EXT, VIDEOS_EXT, )):
+            if ext in ext_list:
+                result[ext_i].append(filename)
+    return result
+
+
+def classify_classifier(filenames, paths):
+    classifier = ExtensionClassifier()
+    classify = classifier.classify
+    return [classify(filename) for filename in filenames]
+
+
+def filter_lists(filenames, paths):
+    """
+    The original filter_files_extensions.
+    """
+    extension_lists = [SUBTITLES_EXT, VIDEOS_EXT]
+    result = [[] for _ in extension_lists]
+    for file in paths:
+        ext = file.suffix[1:].lower()
+        for ext_i, ext_list in enumerate(extension_lists):
+            if ext in ext_list:
+                result[ext_i].append(file)
+    return result
+
+
+def filter_dict(filenames, paths):
+    return filter_files_extensions(paths, [SUBTITLES_EXT, VIDEOS_EXT])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=1000000, help='number of filenames')
+    parser.add_argument('--repeat', type=int, default=3, help='number of passes')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    ns = parser.parse_args()
+
+    filenames = create_filenames(ns.files, ns.seed)
+    paths = [Path(filename) for filename in filenames]
+    print('{} filenames'.format(len(filenames)))
+    for name, function in (('lists', classify_lists),
+                           ('classifier', classify_classifier),
+                           ('filter-lists', filter_lists),
+                           ('filter-dict', filter_dict), ):
+        times = []
+        for _ in range(ns.repeat):
+            start = time.perf_counter()
+            function(filenames, paths)
+            times.append(time.perf_counter() - start)
+        print('{name:<14} {t:>8.3f} s  {ns:>8.1f} ns/file'.format(
+            name=name, t=min(times), ns=min(times) * 1e9 / len(filenames)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+"""Measure the time to scan a large directory tree for videos and subtitles"""
+
+import argparse
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+project_dir = Path(__file__).resolve().parents[2]
+
+sys.path += [str(project_dir)]
+
+from subdownloader.filescan import filter_files_extensions, iter_scan_videopaths
+from subdownloader.subtitle2 import LocalSubtitleFile, SUBTITLES_EXT
+from subdownloader.video2 import VideoFile, VIDEOS_EXT
+
+EXTENSIONS = ['avi', 'mkv', 'srt', 'sub', 'txt', 'nfo', 'jpg', 'mp4', 'srt', 'txt']
+
+
+def create_tree(directory, nb_dirs, nb_files):
+    for dir_i in range(nb_dirs):
+        sub_dir = directory / 'dir{}'.format(dir_i // 10) / 'dir{}'.format(dir_i)
+        sub_dir.mkdir(parents=True)
+        for file_i in range(nb_files):
+            extension = EXTENSIONS[file_i % len(EXTENSIONS)]
+            with (sub_dir / 'file{}.{}'.format(file_i // len(EXTENSIONS), extension)).open('wb'):
+                pass
+
+
+def scan_legacy(directory):
+    """
+    Scan like the original implementation: os.walk, a Path per file and a stat per created object.
+    """
+    nb_videos = 0
+    for dir_path, _, files in os.walk(str(directory)):
+        files = [Path(dir_path) / file for file in files]
+        subs, vids = filter_files_extensions([file for file in files if file.is_file()], [SUBTITLES_EXT, VIDEOS_EXT])
+        subtitles = [LocalSubtitleFile(filepath=sub) for sub in subs]
+        for vid in vids:
+            video = VideoFile(vid)
+            for subtitle in subtitles:
+                if subtitle.matches_video_filename(video):
+                    video.add_subtitle(subtitle)
+            video.get_subtitles().add_candidates(subtitles)
+            video.get_size()
+            nb_videos += 1
+    return nb_videos
+
+
+def scan_scandir(directory):
+    nb_videos = 0
+    for video in iter_scan_videopaths([directory], recursive=True):
+        video.get_size()
+        nb_videos += 1
+    return nb_videos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dirs', type=int, default=1000, help='number of directories')
+    parser.add_argument('--files', type=int, default=100, help='number of files per directory')
+    parser.add_argument('--repeat', type=int, default=3, help='number of scans')
+    ns = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        directory = Path(tmpdir)
+        create_tree(directory, ns.dirs, ns.files)
+        print('{} files'.format(ns.dirs * ns.files))
+        for name, scanner in (('legacy', scan_legacy), ('scandir', scan_scandir), ):
+            times = []
+            for _ in range(ns.repeat):
+                start = time.perf_counter()
+                nb_videos = scanner(directory)
+                times.append(time.perf_counter() - start)
+            print('{name:<10} {t:>8.3f} s  videos={nb_videos}'.format(name=name, t=min(times), nb_videos=nb_videos))
+
+
+if __name__ == '__main__':
+    main()
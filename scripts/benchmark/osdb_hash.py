@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+"""Measure the CPU cost per file of the OSDB hash kernels"""
+
+import argparse
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+project_dir = Path(__file__).resolve().parents[2]
+
+sys.path += [str(project_dir)]
+
+from subdownloader import osdb_hash
+
+
+KERNELS = [
+    ('struct', osdb_hash.osdb_hash_struct),
+    ('readinto', osdb_hash.osdb_hash_readinto),
+    ('mmap', osdb_hash.osdb_hash_mmap),
+]
+
+
+def create_files(directory, nb_files, file_size):
+    paths = []
+    for file_i in range(nb_files):
+        path = directory / 'video{}.avi'.format(file_i)
+        with path.open('wb') as f:
+            f.write(os.urandom(osdb_hash.BLOCK_SIZE))
+            f.seek(file_size - osdb_hash.BLOCK_SIZE)
+            f.write(os.urandom(osdb_hash.BLOCK_SIZE))
+        paths.append(path)
+    return paths
+
+
+def run_kernel(kernel, paths, repeat):
+    hashes = []
+    cpu_start = time.process_time()
+    for _ in range(repeat):
+        hashes = []
+        for path in paths:
+            with path.open('rb') as f:
+                hashes.append(kernel(f, path.stat().st_size))
+    cpu_time = time.process_time() - cpu_start
+    return cpu_time / (repeat * len(paths)), hashes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--files', type=int, default=200, help='number of files')
+    parser.add_argument('--size', type=int, default=64 << 20, help='size of each (sparse) file')
+    parser.add_argument('--repeat', type=int, default=5, help='number of passes over all files')
+    ns = parser.parse_args()
+
+    print('sum_words: {}'.format('numpy' if osdb_hash.NUMPY_AVAILABLE else 'array'))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = create_files(Path(tmpdir), ns.files, ns.size)
+        reference = None
+        for name, kernel in KERNELS:
+            cpu_per_file, hashes = run_kernel(kernel, paths, ns.repeat)
+            if reference is None:
+                reference = hashes
+            identical = hashes == reference
+            print('{name:<10} {us:>10.1f} us/file  identical={identical}'.format(
+                name=name, us=cpu_per_file * 1e6, identical=identical))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+"""Compare parse time and peak memory of the minidom and the streaming parsers of search2 XML pages"""
+
+import argparse
+import datetime
+from pathlib import Path
+import random
+import sys
+import time
+import tracemalloc
+
+project_dir = Path(__file__).resolve().parents[2]
+
+sys.path += [str(project_dir)]
+
+from subdownloader.client import add_client_module_dependencies
+from subdownloader.client.internationalization import i18n_install
+
+WORDS = ['the', 'movie', 'return', 'night', 'of', 'last', 'dark', 'king', 'city', 'star', 'war', 'love']
+
+MOVIE_ENTRY = '''
+    <subtitle>
+      <MovieID Link="/en/search/sublanguageid-all/idmovie-{i}" LinkImdb="http://www.imdb.com/title/tt{i:07}/">{i}</MovieID>
+      <MovieThumb>http://static.opensubtitles.org/gfx/thumbs/{i}.jpg</MovieThumb>
+      <LinkUseNext>http://www.opensubtitles.org/en/search/idmovie-{i}/usenext-1</LinkUseNext>
+      <LinkZoozle>http://www.zoozle.net/search?q={name}</LinkZoozle>
+      <LinkBoardreader>http://boardreader.com/s/{name}.html</LinkBoardreader>
+      <MovieName><![CDATA[{name}]]></MovieName>
+      <MovieYear>{year}</MovieYear>
+      <MovieImdbRating Percent="{percent}">{rating}</MovieImdbRating>
+      <MovieImdbID>{i}</MovieImdbID>
+      <TotalSubs>{total}</TotalSubs>
+      <Newest>{date}</Newest>
+    </subtitle>'''
+
+SUBTITLE_ENTRY = '''
+    <subtitle>
+      <IDSubtitle Link="/en/subtitles/{i}/{slug}-en" uuid="{uuid}">{i}</IDSubtitle>
+      <IDSubtitleFile>{file_id}</IDSubtitleFile>
+      <UserID Link="/en/profile/iduser-{user}">{user}</UserID>
+      <UserNickName>user{user}</UserNickName>
+      <SubAuthorComment><![CDATA[Synced with {name} by user{user}]]></SubAuthorComment>
+      <ISO639 LinkSearch="/en/search/sublanguageid-eng/idmovie-1" flag="//static.opensubtitles.org/gfx/flags/en.gif">en</ISO639>
+      <LanguageName>English</LanguageName>
+      <SubFormat>srt</SubFormat>
+      <SubSumCD>1</SubSumCD>
+      <SubAddDate locale="{date}" rp="{date}">{date}</SubAddDate>
+      <SubBad>0</SubBad>
+      <SubRating>{rating}</SubRating>
+      <SubSize>{size}</SubSize>
+      <SubDownloadsCnt>{downloads}</SubDownloadsCnt>
+      <MovieReleaseName><![CDATA[{release}]]></MovieReleaseName>
+      <MovieName><![CDATA[{name}]]></MovieName>
+      <SubComments>0</SubComments>
+    </subtitle>'''
+
+PAGE = '''<?xml version="1.0" encoding="utf-8"?>
+<opensubtitles base="http://www.opensubtitles.org" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">
+  <search>
+    <results items="{items}" itemsfound="{found}" searchtime="0.093">{entries}
+    </results>
+  </search>
+</opensubtitles>
+'''
+
+
+def create_page(kind, nb_entries, seed):
+    rnd = random.Random(seed)
+    entries = []
+    for i in range(nb_entries):
+        name = ' '.join(rnd.choice(WORDS) for _ in range(3)).title()
+        date = '{:02}/{:02}/20{:02} 10:11:12'.format(rnd.randint(1, 28), rnd.randint(1, 12), rnd.randint(0, 19))
+        if kind == 'movies':
+            entries.append(MOVIE_ENTRY.format(i=seed * nb_entries + i, name=name, year=rnd.randint(1950, 2019),
+                                              percent=rnd.randint(10, 99), rating=rnd.randint(10, 99) / 10,
+                                              total=rnd.randint(1, 500), date=date))
+        else:
+            entries.append(SUBTITLE_ENTRY.format(i=seed * nb_entries + i, slug=name.lower().replace(' ', '-'),
+                                                 uuid='{:032x}'.format(rnd.getrandbits(128)),
+                                                 file_id=rnd.randint(1, 10 ** 9), user=rnd.randint(0, 10 ** 6),
+                                                 name=name, date=date, rating=rnd.randint(0, 100) / 10,
+                                                 size=rnd.randint(10 ** 4, 10 ** 5),
+                                                 downloads=rnd.randint(0, 10 ** 5),
+                                                 release=name.replace(' ', '.') + '.720p.BluRay'))
+    return PAGE.format(items=nb_entries, found=10 * nb_entries, entries=''.join(entries)).encode('utf-8')
+
+
+def legacy_extract_subtitle_entries(raw_xml):
+    """
+    Extract the entries like the original implementation: parse the whole page with minidom.
+    """
+    from xml.dom import minidom
+    entries = []
+    nb_so_far = 0
+    nb_total = 0
+    dom = minidom.parseString(raw_xml)
+    for opensubtitles_entry in dom.getElementsByTagName('opensubtitles'):
+        for results_entry in opensubtitles_entry.getElementsByTagName('results'):
+            try:
+                nb_so_far = int(results_entry.getAttribute('items'))
+                nb_total = int(results_entry.getAttribute('itemsfound'))
+                entries = results_entry.getElementsByTagName('subtitle')
+                break
+            except ValueError:
+                continue
+    return entries, nb_so_far, nb_total
+
+
+def legacy_xml_to_movies(query, raw_xml):
+    from subdownloader.identification import ImdbIdentity, ProviderIdentities, VideoIdentity
+    from subdownloader.movie import RemoteMovie
+    subtitle_entries, nb_so_far, nb_provider = legacy_extract_subtitle_entries(raw_xml)
+    movies = []
+    for subtitle_entry in subtitle_entries:
+        if subtitle_entry.getElementsByTagName('ads1'):
+            continue
+
+        def try_get_firstchild_data(key, default):
+            try:
+                return subtitle_entry.getElementsByTagName(key)[0].firstChild.data
+            except (AttributeError, IndexError):
+                return default
+        movie_id_entries = subtitle_entry.getElementsByTagName('MovieID')
+        movie_id = movie_id_entries[0].firstChild.data
+        movie_id_link = movie_id_entries[0].getAttribute('Link')
+        movie_name = try_get_firstchild_data('MovieName', None)
+        movie_year = try_get_firstchild_data('MovieYear', None)
+        movie_imdb_rating = float(
+            subtitle_entry.getElementsByTagName('MovieImdbRating')[0].getAttribute('Percent')) / 10
+        movie_imdb_id = try_get_firstchild_data('MovieImdbID', None)
+        subs_total = int(subtitle_entry.getElementsByTagName('TotalSubs')[0].firstChild.data)
+        identity = ProviderIdentities(video_identity=VideoIdentity(name=movie_name, year=movie_year),
+                                      imdb_identity=ImdbIdentity(imdb_id=movie_imdb_id, imdb_rating=movie_imdb_rating),
+                                      provider=query)
+        movies.append(RemoteMovie(subtitles_nb_total=subs_total, provider_link=movie_id_link, provider_id=movie_id,
+                                  identities=identity))
+    return movies, nb_so_far, nb_provider
+
+
+def legacy_xml_to_subtitles(query, raw_xml):
+    from subdownloader.languages.language import Language
+    from subdownloader.provider.opensubtitles import OpenSubtitlesSubtitleFile
+    subtitle_entries, nb_so_far, nb_provider = legacy_extract_subtitle_entries(raw_xml)
+    subtitles = []
+    for subtitle_entry in subtitle_entries:
+        if subtitle_entry.getElementsByTagName('ads1') or subtitle_entry.getElementsByTagName('ads2'):
+            continue
+
+        def try_get_first_child_data(key, default):
+            try:
+                return subtitle_entry.getElementsByTagName(key)[0].firstChild.data
+            except (AttributeError, IndexError):
+                return default
+        subtitle_id_entry = subtitle_entry.getElementsByTagName('IDSubtitle')[0]
+        subtitle_link = 'http://www.opensubtitles.org' + subtitle_id_entry.getAttribute('Link')
+        subtitle_uuid = subtitle_id_entry.getAttribute('uuid')
+        subtitlefile_id = subtitle_entry.getElementsByTagName('IDSubtitleFile')[0].firstChild.data
+        user_id = int(subtitle_entry.getElementsByTagName('UserID')[0].firstChild.data)
+        user_nickname = try_get_first_child_data('UserNickName', None)
+        language_iso639 = subtitle_entry.getElementsByTagName('ISO639')[0].firstChild.data
+        subtitle_format = try_get_first_child_data('SubFormat', 'srt')
+        subtitle_add_date = datetime.datetime.strptime(
+            subtitle_entry.getElementsByTagName('SubAddDate')[0].getAttribute('locale'), '%d/%m/%Y %H:%M:%S')
+        subtitle_rating = float(subtitle_entry.getElementsByTagName('SubRating')[0].firstChild.data)
+        subtitle_file_size = int(subtitle_entry.getElementsByTagName('SubSize')[0].firstChild.data)
+        movie_release_name = try_get_first_child_data('MovieReleaseName', None)
+        if movie_release_name is None:
+            movie_release_name = try_get_first_child_data('MovieName', None)
+        filename = '{}.{}'.format(query.cleanup_string(movie_release_name), subtitle_format)
+        uploader = user_nickname if user_nickname else (str(user_id) if user_id != 0 else None)
+        subtitles.append(OpenSubtitlesSubtitleFile(
+            filename=filename, file_size=subtitle_file_size, md5_hash=subtitle_uuid, id_online=subtitlefile_id,
+            download_link=None, link=subtitle_link, uploader=uploader, language=Language.from_xx(language_iso639),
+            rating=subtitle_rating, date=subtitle_add_date))
+    return subtitles, nb_so_far, nb_provider
+
+
+def parse_legacy(query, kind, raw_xml):
+    if kind == 'movies':
+        return legacy_xml_to_movies(query, raw_xml)
+    return legacy_xml_to_subtitles(query, raw_xml)
+
+
+def parse_stream(query, kind, raw_xml):
+    if kind == 'movies':
+        return query._xml_to_movies(raw_xml)
+    return query._xml_to_subtitles(raw_xml)
+
+
+PARSERS = [
+    ('minidom', parse_legacy),
+    ('iterparse', parse_stream),
+]
+
+
+def object_key(obj):
+    try:
+        return obj.get_provider_id(), obj.get_provider_link(), obj.get_nb_subs_total()
+    except AttributeError:
+        return obj.get_id_online(), obj.get_filename(), obj.get_uploader(), obj.get_link(), obj.get_file_size()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('pages', metavar='PAGE', nargs='*', type=Path,
+                        help='recorded XML pages (default: generate pages)')
+    parser.add_argument('--kind', choices=['movies', 'subtitles'], default='subtitles',
+                        help='kind of the pages: movie search or subtitle search')
+    parser.add_argument('--generate', type=int, default=20, help='number of pages to generate')
+    parser.add_argument('--entries', type=int, default=500, help='number of entries of a generated page')
+    parser.add_argument('--repeat', type=int, default=3, help='number of times to parse all pages')
+    ns = parser.parse_args()
+
+    add_client_module_dependencies()
+    i18n_install()
+    from subdownloader.provider.opensubtitles import OpenSubtitles
+
+    if ns.pages:
+        pages = [page.read_bytes() for page in ns.pages]
+    else:
+        pages = [create_page(ns.kind, ns.entries, seed) for seed in range(ns.generate)]
+    query = OpenSubtitles().query_text('benchmark')
+    print('{} {} pages, {:.1f} KiB on average'.format(
+        len(pages), ns.kind, sum(len(page) for page in pages) / len(pages) / 1024))
+
+    results = {}
+    for name, parse in PARSERS:
+        start = time.perf_counter()
+        for _ in range(ns.repeat):
+            for page in pages:
+                parse(query, ns.kind, page)
+        elapsed = (time.perf_counter() - start) / ns.repeat / len(pages)
+
+        # Peak memory of parsing one page, measured separately: tracing slows down parsing.
+        peak = 0
+        objects = []
+        for page in pages:
+            tracemalloc.start()
+            page_objects, nb_so_far, nb_total = parse(query, ns.kind, page)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            objects.extend(object_key(obj) for obj in page_objects)
+        results[name] = objects
+        print('{name:<10} {t:>8.2f} ms/page  peak {peak:>8.1f} KiB/page  {nb} objects'.format(
+            name=name, t=elapsed * 1000, peak=peak / 1024, nb=len(objects)))
+
+    if len(set(tuple(objects) for objects in results.values())) != 1:
+        print('The parsers return different objects!')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,721 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+
+from collections import namedtuple
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+
+log = logging.getLogger('subdownloader.cache')
+
+
+class FileIdentity(namedtuple('FileIdentity', ('device', 'inode', 'size', 'mtime_ns'))):
+    """
+    Identity of a file on disk. If one of these members changes, the contents are assumed to have changed.
+    """
+    @classmethod
+    def from_stat(cls, st):
+        """
+        Create a FileIdentity from the result of a stat call.
+        :param st: os.stat_result (or os.DirEntry.stat()) of the file
+        :return: FileIdentity instance
+        """
+        return cls(device=st.st_dev, inode=st.st_ino, size=st.st_size, mtime_ns=st.st_mtime_ns)
+
+
+class SqliteCache(object):
+    """
+    Base class of a small persistent cache, stored in a SQLite database.
+    The number of entries is bounded. When the bound is exceeded, the least recently used entries are evicted.
+    The access times of cache hits are kept in memory and written in batches, so lookups do not write.
+    """
+    TABLE = None
+    SCHEMA = None
+    KEY = None
+
+    DEFAULT_MAX_ENTRIES = 100000
+    # Number of accessed entries kept in memory before their access times are written.
+    ATIME_BATCH_SIZE = 1000
+
+    def __init__(self, path, max_entries=None):
+        """
+        Open (or create) a cache.
+        :param path: Path of the database file, use ':memory:' for a non-persistent cache
+        :param max_entries: maximum number of entries to keep (None for the default)
+        """
+        self._path = path
+        self._max_entries = self.DEFAULT_MAX_ENTRIES if max_entries is None else max_entries
+        self._lock = threading.Lock()
+        self._atimes = {}
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS {table} ({schema})'.format(table=self.TABLE, schema=self.SCHEMA))
+        self._db.execute('CREATE INDEX IF NOT EXISTS {table}_atime ON {table} (atime)'.format(table=self.TABLE))
+        self._db.commit()
+        self._nb_entries = self._db.execute('SELECT COUNT(*) FROM {table}'.format(table=self.TABLE)).fetchone()[0]
+        log.debug('Opened cache "{path}" ({nb} entries)'.format(path=path, nb=self._nb_entries))
+
+    def get_path(self):
+        return self._path
+
+    def get_max_entries(self):
+        return self._max_entries
+
+    def set_max_entries(self, max_entries):
+        with self._lock:
+            self._flush_atimes()
+            self._max_entries = max_entries
+            self._evict()
+            self._db.commit()
+
+    def __len__(self):
+        return self._nb_entries
+
+    def clear(self):
+        """
+        Remove all entries of this cache.
+        """
+        log.debug('clear() of "{path}"'.format(path=self._path))
+        with self._lock:
+            self._db.execute('DELETE FROM {table}'.format(table=self.TABLE))
+            self._db.commit()
+            self._nb_entries = 0
+            self._atimes = {}
+
+    def flush(self):
+        """
+        Write the access times of the entries used since the last write.
+        """
+        with self._lock:
+            self._flush_atimes()
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._flush_atimes()
+                self._db.commit()
+                self._db.close()
+                self._db = None
+
+    def _touch(self, key):
+        """
+        Record the access of an entry. The access times are written in batches, so a cache hit does not write.
+        Must be called with the lock held.
+        :param key: tuple of the values of the KEY columns of the entry
+        """
+        self._atimes[key] = self._now()
+        if len(self._atimes) >= self.ATIME_BATCH_SIZE:
+            self._flush_atimes()
+            self._db.commit()
+
+    def _flush_atimes(self):
+        """
+        Write the recorded access times. Writers call this first, so the eviction uses the access times.
+        Must be called with the lock held.
+        """
+        if not self._atimes:
+            return
+        self._db.executemany('UPDATE {table} SET atime=? WHERE {where}'.format(
+            table=self.TABLE, where=' AND '.join('{}=?'.format(column) for column in self.KEY)),
+            ((atime, ) + key for key, atime in self._atimes.items()))
+        self._atimes = {}
+
+    def _evict(self):
+        """
+        Remove the least recently used entries if the cache has grown too big.
+        Must be called with the lock held.
+        """
+        if self._nb_entries <= self._max_entries:
+            return
+        # Evict some slack to avoid doing this on every insert.
+        nb_evict = self._nb_entries - self._max_entries + self._max_entries // 10
+        log.debug('Evicting {nb} entries from "{path}"'.format(nb=nb_evict, path=self._path))
+        self._db.execute('DELETE FROM {table} WHERE rowid IN '
+                         '(SELECT rowid FROM {table} ORDER BY atime ASC LIMIT ?)'.format(table=self.TABLE),
+                         (nb_evict, ))
+        self._nb_entries = self._db.execute('SELECT COUNT(*) FROM {table}'.format(table=self.TABLE)).fetchone()[0]
+
+    @staticmethod
+    def _now():
+        return time.time()
+
+
+class FileHashCache(SqliteCache):
+    """
+    Cache of the hashes of local files, keyed by the identity of the file.
+    """
+    TABLE = 'file_hash'
+    KEY = ('device', 'inode')
+    SCHEMA = 'device INTEGER NOT NULL, inode INTEGER NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, ' \
+             'osdb_hash TEXT, md5_hash TEXT, atime REAL NOT NULL, PRIMARY KEY (device, inode)'
+
+    def __init__(self, path, max_entries=None):
+        SqliteCache.__init__(self, path, max_entries=max_entries)
+        # Databases created before md5 hashes were cached lack the md5_hash column.
+        columns = [row[1] for row in self._db.execute('PRAGMA table_info(file_hash)')]
+        if 'md5_hash' not in columns:
+            self._db.execute('ALTER TABLE file_hash ADD COLUMN md5_hash TEXT')
+            self._db.commit()
+
+    def _get_hash(self, identity, column):
+        with self._lock:
+            row = self._db.execute('SELECT size, mtime_ns, {column} FROM file_hash WHERE device=? AND inode=?'.format(
+                column=column), (identity.device, identity.inode)).fetchone()
+            if row is None:
+                return None
+            size, mtime_ns, hash_str = row
+            if size != identity.size or mtime_ns != identity.mtime_ns or hash_str is None:
+                return None
+            self._touch((identity.device, identity.inode))
+            return hash_str
+
+    def _set_hash(self, identity, column, hash_str):
+        with self._lock:
+            self._flush_atimes()
+            cursor = self._db.execute('UPDATE file_hash SET {column}=?, atime=? '
+                                      'WHERE device=? AND inode=? AND size=? AND mtime_ns=?'.format(column=column),
+                                      (hash_str, self._now(),
+                                       identity.device, identity.inode, identity.size, identity.mtime_ns))
+            if cursor.rowcount == 0:
+                # No entry, or an entry of a modified file: all of its hashes are stale.
+                cursor = self._db.execute('DELETE FROM file_hash WHERE device=? AND inode=?',
+                                          (identity.device, identity.inode))
+                self._nb_entries -= cursor.rowcount
+                self._db.execute('INSERT INTO file_hash (device, inode, size, mtime_ns, {column}, atime) '
+                                 'VALUES (?, ?, ?, ?, ?, ?)'.format(column=column),
+                                 (identity.device, identity.inode, identity.size, identity.mtime_ns, hash_str,
+                                  self._now()))
+                self._nb_entries += 1
+                self._evict()
+            self._db.commit()
+
+    def get_osdb_hash(self, identity):
+        """
+        Look up the OSDB hash of a file.
+        :param identity: FileIdentity of the file
+        :return: hash as string, None if not available
+        """
+        return self._get_hash(identity, 'osdb_hash')
+
+    def set_osdb_hash(self, identity, osdb_hash):
+        """
+        Store the OSDB hash of a file.
+        :param identity: FileIdentity of the file
+        :param osdb_hash: hash as string
+        """
+        self._set_hash(identity, 'osdb_hash', osdb_hash)
+
+    def get_md5_hash(self, identity):
+        """
+        Look up the md5 hash of a file.
+        :param identity: FileIdentity of the file
+        :return: hash as string, None if not available
+        """
+        return self._get_hash(identity, 'md5_hash')
+
+    def set_md5_hash(self, identity, md5_hash):
+        """
+        Store the md5 hash of a file.
+        :param identity: FileIdentity of the file
+        :param md5_hash: hash as string
+        """
+        self._set_hash(identity, 'md5_hash', md5_hash)
+
+    def invalidate(self, identities):
+        """
+        Remove the entries of multiple files.
+        :param identities: iterable of FileIdentity
+        """
+        with self._lock:
+            self._flush_atimes()
+            self._db.executemany('DELETE FROM file_hash WHERE device=? AND inode=?',
+                                 ((identity.device, identity.inode) for identity in identities))
+            self._db.commit()
+            self._nb_entries = self._db.execute('SELECT COUNT(*) FROM file_hash').fetchone()[0]
+
+
+VideoState = namedtuple('VideoState', ('languages', 'satisfied', 'last_search', 'nb_searches'))
+
+
+class VideoStateCache(SqliteCache):
+    """
+    Persistent state of the subtitle search of local videos, keyed by the identity of the video file.
+    Used to skip videos in incremental scans.
+    """
+    TABLE = 'video_state'
+    KEY = ('device', 'inode')
+    SCHEMA = 'device INTEGER NOT NULL, inode INTEGER NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, ' \
+             'languages TEXT NOT NULL, satisfied TEXT NOT NULL, last_search REAL NOT NULL, ' \
+             'nb_searches INTEGER NOT NULL, atime REAL NOT NULL, PRIMARY KEY (device, inode)'
+
+    def get_video_state(self, identity):
+        """
+        Look up the state of a video.
+        :param identity: FileIdentity of the video
+        :return: VideoState, None if not available or if the video has been modified
+        """
+        with self._lock:
+            row = self._db.execute('SELECT size, mtime_ns, languages, satisfied, last_search, nb_searches '
+                                   'FROM video_state WHERE device=? AND inode=?',
+                                   (identity.device, identity.inode)).fetchone()
+            if row is None:
+                return None
+            size, mtime_ns, languages, satisfied, last_search, nb_searches = row
+            if size != identity.size or mtime_ns != identity.mtime_ns:
+                return None
+            self._touch((identity.device, identity.inode))
+            return VideoState(languages=languages, satisfied=satisfied, last_search=last_search,
+                              nb_searches=nb_searches)
+
+    def set_video_state(self, identity, state):
+        """
+        Store the state of a video.
+        :param identity: FileIdentity of the video
+        :param state: VideoState
+        """
+        with self._lock:
+            self._flush_atimes()
+            cursor = self._db.execute('DELETE FROM video_state WHERE device=? AND inode=?',
+                                      (identity.device, identity.inode))
+            self._nb_entries -= cursor.rowcount
+            self._db.execute('INSERT INTO video_state (device, inode, size, mtime_ns, languages, satisfied, '
+                             'last_search, nb_searches, atime) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             (identity.device, identity.inode, identity.size, identity.mtime_ns, state.languages,
+                              state.satisfied, state.last_search, state.nb_searches, self._now()))
+            self._nb_entries += 1
+            self._evict()
+            self._db.commit()
+
+
+class DownloadCountCache(SqliteCache):
+    """
+    Number of subtitles downloaded from each provider today, shared between runs.
+    """
+    TABLE = 'download_count'
+    KEY = ('provider', )
+    SCHEMA = 'provider TEXT NOT NULL PRIMARY KEY, day TEXT NOT NULL, count INTEGER NOT NULL, atime REAL NOT NULL'
+
+    def get_download_count(self, provider, day):
+        """
+        Get the number of downloads of a provider on a day.
+        :param provider: name of the provider
+        :param day: day as string
+        :return: number of downloads
+        """
+        with self._lock:
+            row = self._db.execute('SELECT day, count FROM download_count WHERE provider=?', (provider, )).fetchone()
+        if row is None or row[0] != day:
+            return 0
+        return row[1]
+
+    def add_download_count(self, provider, day, count):
+        """
+        Add downloads of a provider on a day. The count of a previous day is discarded.
+        :param provider: name of the provider
+        :param day: day as string
+        :param count: number of downloads to add
+        :return: number of downloads of the provider on the day
+        """
+        with self._lock:
+            self._flush_atimes()
+            row = self._db.execute('SELECT day, count FROM download_count WHERE provider=?', (provider, )).fetchone()
+            if row is not None and row[0] == day:
+                count += row[1]
+            if row is None:
+                self._nb_entries += 1
+            self._db.execute('INSERT OR REPLACE INTO download_count (provider, day, count, atime) VALUES (?, ?, ?, ?)',
+                             (provider, day, count, self._now()))
+            self._evict()
+            self._db.commit()
+            return count
+
+
+class SearchResultCache(SqliteCache):
+    """
+    Results of subtitle searches of videos, keyed by provider, video hash, video size and languages.
+    A result is a list of dicts of strings, as returned by the provider.
+    Empty results expire sooner, so new subtitles of a video are found in a next search.
+    """
+    TABLE = 'search_result'
+    KEY = ('provider', 'moviehash', 'size', 'languages')
+    SCHEMA = 'provider TEXT NOT NULL, moviehash TEXT NOT NULL, size INTEGER NOT NULL, languages TEXT NOT NULL, ' \
+             'result TEXT NOT NULL, time REAL NOT NULL, atime REAL NOT NULL, ' \
+             'PRIMARY KEY (provider, moviehash, size, languages)'
+
+    # Results are much larger than hashes.
+    DEFAULT_MAX_ENTRIES = 10000
+    DEFAULT_TTL = 24 * 60 * 60.
+    DEFAULT_NEGATIVE_TTL = 3 * 60 * 60.
+
+    def __init__(self, path, max_entries=None, ttl=None, negative_ttl=None):
+        """
+        Open (or create) a search result cache.
+        :param path: Path of the database file, use ':memory:' for a non-persistent cache
+        :param max_entries: maximum number of entries to keep (None for the default)
+        :param ttl: time (in seconds) a result with subtitles is valid (None for the default)
+        :param negative_ttl: time (in seconds) a result without subtitles is valid (None for the default)
+        """
+        SqliteCache.__init__(self, path, max_entries=max_entries)
+        self._ttl = self.DEFAULT_TTL if ttl is None else ttl
+        self._negative_ttl = self.DEFAULT_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+
+    def get_ttl(self):
+        return self._ttl
+
+    def get_negative_ttl(self):
+        return self._negative_ttl
+
+    def get_search_result(self, provider, moviehash, size, languages):
+        """
+        Look up the result of a search.
+        :param provider: name of the provider
+        :param moviehash: hash of the video as string
+        :param size: size of the video
+        :param languages: languages of the search as string
+        :return: list of dicts, None if not available or expired
+        """
+        key = (provider, moviehash, size, languages)
+        with self._lock:
+            row = self._db.execute('SELECT result, time FROM search_result '
+                                   'WHERE provider=? AND moviehash=? AND size=? AND languages=?', key).fetchone()
+            if row is None:
+                return None
+            result = json.loads(row[0])
+            now = self._now()
+            if now - row[1] > (self._ttl if result else self._negative_ttl):
+                cursor = self._db.execute('DELETE FROM search_result '
+                                          'WHERE provider=? AND moviehash=? AND size=? AND languages=?', key)
+                self._nb_entries -= cursor.rowcount
+                self._db.commit()
+                return None
+            self._touch(key)
+            return result
+
+    def set_search_results(self, provider, languages, results):
+        """
+        Store the results of searches of multiple videos.
+        :param provider: name of the provider
+        :param languages: languages of the searches as string
+        :param results: iterable of tuples of hash of the video, size of the video and list of dicts
+        """
+        with self._lock:
+            self._flush_atimes()
+            now = self._now()
+            for moviehash, size, result in results:
+                cursor = self._db.execute('DELETE FROM search_result '
+                                          'WHERE provider=? AND moviehash=? AND size=? AND languages=?',
+                                          (provider, moviehash, size, languages))
+                self._nb_entries -= cursor.rowcount
+                self._db.execute('INSERT INTO search_result (provider, moviehash, size, languages, result, time, '
+                                 'atime) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                 (provider, moviehash, size, languages, json.dumps(result), now, now))
+                self._nb_entries += 1
+            self._evict()
+            self._db.commit()
+
+
+class SubtitleDownloadCache(SqliteCache):
+    """
+    Store of the compressed contents of downloaded subtitles, keyed by provider and id of the subtitle.
+    The md5 hash of the subtitle is stored to detect subtitles that were replaced by the provider.
+    Besides the number of entries, the total size of the contents is bounded.
+    """
+    TABLE = 'subtitle_download'
+    KEY = ('provider', 'id_online')
+    SCHEMA = 'provider TEXT NOT NULL, id_online TEXT NOT NULL, md5_hash TEXT NOT NULL, data BLOB NOT NULL, ' \
+             'size INTEGER NOT NULL, atime REAL NOT NULL, PRIMARY KEY (provider, id_online)'
+
+    DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, path, max_entries=None, max_size=None):
+        """
+        Open (or create) a subtitle download cache.
+        :param path: Path of the database file, use ':memory:' for a non-persistent cache
+        :param max_entries: maximum number of entries to keep (None for the default)
+        :param max_size: maximum total size (in bytes) of the contents to keep (None for the default)
+        """
+        SqliteCache.__init__(self, path, max_entries=max_entries)
+        self._max_size = self.DEFAULT_MAX_SIZE if max_size is None else max_size
+        self._total_size = int(self._db.execute('SELECT TOTAL(size) FROM subtitle_download').fetchone()[0])
+
+    def get_max_size(self):
+        return self._max_size
+
+    def set_max_size(self, max_size):
+        with self._lock:
+            self._flush_atimes()
+            self._max_size = max_size
+            self._evict()
+            self._db.commit()
+
+    def get_total_size(self):
+        return self._total_size
+
+    def clear(self):
+        SqliteCache.clear(self)
+        self._total_size = 0
+
+    def get_subtitle(self, provider, id_online, md5_hash):
+        """
+        Look up the contents of a subtitle.
+        :param provider: name of the provider
+        :param id_online: id of the subtitle at the provider
+        :param md5_hash: md5 hash of the subtitle as string
+        :return: compressed contents as bytes, None if not available or if the hash does not match
+        """
+        with self._lock:
+            row = self._db.execute('SELECT md5_hash, data FROM subtitle_download WHERE provider=? AND id_online=?',
+                                   (provider, id_online)).fetchone()
+            if row is None or row[0] != md5_hash:
+                return None
+            self._touch((provider, id_online))
+            return bytes(row[1])
+
+    def set_subtitle(self, provider, id_online, md5_hash, data):
+        """
+        Store the contents of a subtitle.
+        :param provider: name of the provider
+        :param id_online: id of the subtitle at the provider
+        :param md5_hash: md5 hash of the subtitle as string
+        :param data: compressed contents as bytes
+        """
+        with self._lock:
+            self._flush_atimes()
+            self._remove_subtitle(provider, id_online)
+            self._db.execute('INSERT INTO subtitle_download (provider, id_online, md5_hash, data, size, atime) '
+                             'VALUES (?, ?, ?, ?, ?, ?)',
+                             (provider, id_online, md5_hash, sqlite3.Binary(data), len(data), self._now()))
+            self._nb_entries += 1
+            self._total_size += len(data)
+            self._evict()
+            self._db.commit()
+
+    def remove_subtitle(self, provider, id_online):
+        """
+        Remove the contents of a subtitle.
+        :param provider: name of the provider
+        :param id_online: id of the subtitle at the provider
+        """
+        with self._lock:
+            self._flush_atimes()
+            self._remove_subtitle(provider, id_online)
+            self._db.commit()
+
+    def _remove_subtitle(self, provider, id_online):
+        row = self._db.execute('SELECT size FROM subtitle_download WHERE provider=? AND id_online=?',
+                               (provider, id_online)).fetchone()
+        if row is None:
+            return
+        self._db.execute('DELETE FROM subtitle_download WHERE provider=? AND id_online=?', (provider, id_online))
+        self._nb_entries -= 1
+        self._total_size -= row[0]
+
+    def _evict(self):
+        nb_entries = self._nb_entries
+        SqliteCache._evict(self)
+        if self._total_size > self._max_size:
+            # Evict some slack to avoid doing this on every insert.
+            size_evict = self._total_size - self._max_size + self._max_size // 10
+            rowids = []
+            for rowid, size in self._db.execute('SELECT rowid, size FROM subtitle_download ORDER BY atime ASC'):
+                if size_evict <= 0:
+                    break
+                rowids.append((rowid, ))
+                size_evict -= size
+            log.debug('Evicting {nb} subtitles from "{path}"'.format(nb=len(rowids), path=self._path))
+            self._db.executemany('DELETE FROM subtitle_download WHERE rowid=?', rowids)
+            self._nb_entries = self._db.execute('SELECT COUNT(*) FROM subtitle_download').fetchone()[0]
+        if self._nb_entries != nb_entries:
+            self._total_size = int(self._db.execute('SELECT TOTAL(size) FROM subtitle_download').fetchone()[0])
+
+
+class HttpResponse(namedtuple('HttpResponse', ('body', 'etag', 'last_modified', 'fresh'))):
+    """
+    Response stored in a HttpResponseCache.
+    The validators etag and last_modified are None if the server did not send them.
+    A response that is not fresh must be revalidated by the server before it is used.
+    """
+
+
+class HttpResponseCache(SqliteCache):
+    """
+    Cache of the bodies of http responses, keyed by url. The bodies are stored compressed.
+    A response is fresh during ttl seconds. Afterwards, it is kept until max_age seconds have passed,
+    so it can be revalidated with a conditional request.
+    """
+    TABLE = 'http_response'
+    KEY = ('url', )
+    SCHEMA = 'url TEXT NOT NULL PRIMARY KEY, body BLOB NOT NULL, etag TEXT, last_modified TEXT, ' \
+             'time REAL NOT NULL, atime REAL NOT NULL'
+
+    DEFAULT_MAX_ENTRIES = 2000
+    DEFAULT_TTL = 60 * 60.
+    DEFAULT_MAX_AGE = 7 * 24 * 60 * 60.
+
+    def __init__(self, path, max_entries=None, ttl=None, max_age=None):
+        """
+        Open (or create) a http response cache.
+        :param path: Path of the database file, use ':memory:' for a non-persistent cache
+        :param max_entries: maximum number of entries to keep (None for the default)
+        :param ttl: time (in seconds) a response can be used without revalidation (None for the default)
+        :param max_age: time (in seconds) a response is kept for revalidation (None for the default)
+        """
+        SqliteCache.__init__(self, path, max_entries=max_entries)
+        self._ttl = self.DEFAULT_TTL if ttl is None else ttl
+        self._max_age = self.DEFAULT_MAX_AGE if max_age is None else max_age
+
+    def get_ttl(self):
+        return self._ttl
+
+    def set_ttl(self, ttl):
+        self._ttl = ttl
+
+    def get_max_age(self):
+        return self._max_age
+
+    def set_max_age(self, max_age):
+        self._max_age = max_age
+
+    def get_response(self, url):
+        """
+        Look up the response of an url.
+        :param url: url as string
+        :return: HttpResponse, None if not available or too old
+        """
+        with self._lock:
+            row = self._db.execute('SELECT body, etag, last_modified, time FROM http_response WHERE url=?',
+                                   (url, )).fetchone()
+            if row is None:
+                return None
+            now = self._now()
+            age = now - row[3]
+            if age > self._max_age:
+                self._remove_response(url)
+                self._db.commit()
+                return None
+            self._touch((url, ))
+        return HttpResponse(body=zlib.decompress(row[0]), etag=row[1], last_modified=row[2], fresh=age <= self._ttl)
+
+    def set_response(self, url, body, etag=None, last_modified=None):
+        """
+        Store the response of an url.
+        :param url: url as string
+        :param body: body of the response as bytes
+        :param etag: value of the ETag header (None if not available)
+        :param last_modified: value of the Last-Modified header (None if not available)
+        """
+        data = zlib.compress(body)
+        with self._lock:
+            self._flush_atimes()
+            now = self._now()
+            self._remove_response(url)
+            self._db.execute('INSERT INTO http_response (url, body, etag, last_modified, time, atime) '
+                             'VALUES (?, ?, ?, ?, ?, ?)', (url, sqlite3.Binary(data), etag, last_modified, now, now))
+            self._nb_entries += 1
+            self._evict()
+            self._db.commit()
+
+    def refresh_response(self, url):
+        """
+        Mark the response of an url as fresh, after the server has told it is still valid.
+        :param url: url as string
+        """
+        with self._lock:
+            self._flush_atimes()
+            now = self._now()
+            self._db.execute('UPDATE http_response SET time=?, atime=? WHERE url=?', (now, now, url))
+            self._db.commit()
+
+    def remove_response(self, url):
+        """
+        Remove the response of an url.
+        :param url: url as string
+        """
+        with self._lock:
+            self._flush_atimes()
+            self._remove_response(url)
+            self._db.commit()
+
+    def _remove_response(self, url):
+        cursor = self._db.execute('DELETE FROM http_response WHERE url=?', (url, ))
+        self._nb_entries -= cursor.rowcount
+
+
+"""
+Cache used by VideoFile and LocalSubtitleFile to look up hashes. None if no caching should be done.
+"""
+DEFAULT_FILE_HASH_CACHE = None
+
+
+def get_default_file_hash_cache():
+    return DEFAULT_FILE_HASH_CACHE
+
+
+def set_default_file_hash_cache(cache):
+    global DEFAULT_FILE_HASH_CACHE
+    DEFAULT_FILE_HASH_CACHE = cache
+
+
+"""
+Cache used by the providers to count the downloads of the day. None if the downloads should only be counted in memory.
+"""
+DEFAULT_DOWNLOAD_COUNT_CACHE = None
+
+
+def get_default_download_count_cache():
+    return DEFAULT_DOWNLOAD_COUNT_CACHE
+
+
+def set_default_download_count_cache(cache):
+    global DEFAULT_DOWNLOAD_COUNT_CACHE
+    DEFAULT_DOWNLOAD_COUNT_CACHE = cache
+
+
+"""
+Cache used by the providers to look up the results of video searches. None if no caching should be done.
+"""
+DEFAULT_SEARCH_RESULT_CACHE = None
+
+
+def get_default_search_result_cache():
+    return DEFAULT_SEARCH_RESULT_CACHE
+
+
+def set_default_search_result_cache(cache):
+    global DEFAULT_SEARCH_RESULT_CACHE
+    DEFAULT_SEARCH_RESULT_CACHE = cache
+
+
+"""
+Cache used by the providers to look up the contents of downloaded subtitles. None if no caching should be done.
+"""
+DEFAULT_SUBTITLE_DOWNLOAD_CACHE = None
+
+
+def get_default_subtitle_download_cache():
+    return DEFAULT_SUBTITLE_DOWNLOAD_CACHE
+
+
+def set_default_subtitle_download_cache(cache):
+    global DEFAULT_SUBTITLE_DOWNLOAD_CACHE
+    DEFAULT_SUBTITLE_DOWNLOAD_CACHE = cache
+
+
+"""
+Cache used by the providers to look up the responses of web pages. None if no caching should be done.
+"""
+DEFAULT_HTTP_RESPONSE_CACHE = None
+
+
+def get_default_http_response_cache():
+    return DEFAULT_HTTP_RESPONSE_CACHE
+
+
+def set_default_http_response_cache(cache):
+    global DEFAULT_HTTP_RESPONSE_CACHE
+    DEFAULT_HTTP_RESPONSE_CACHE = cache
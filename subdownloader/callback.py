@@ -169,3 +169,10 @@ class SubProgressCallback(ProgressCallback):
         :return:
         """
         self._parent.cancel()
+
+    def canceled(self):
+        """
+        Return true when this SubProgressCallback or its parent has been canceled.
+        :return: Boolean value
+        """
+        return self._canceled or self._parent.canceled()
@@ -8,6 +8,7 @@ import subprocess
 import sys
 
 from subdownloader.client import ClientType, IllegalArgumentException, add_client_module_dependencies
+from subdownloader.client.cache import cache_init
 from subdownloader.client.state import BaseState, state_init
 from subdownloader.client.configuration import Settings
 from subdownloader.client.logger import logging_file_install, logging_install, logging_stream_install
@@ -59,6 +60,7 @@ def main(args=None):
     settings = Settings(BaseState.get_default_settings_path())
     logging_install(options.program.log.level, options.program.log.path)
     user_agent_init()
+    cache_init()
 
     if options.program.client.type == ClientType.GUI:
         try:
@@ -50,6 +50,9 @@ def parse_arguments(args=None):
                 console=ns.console,
                 interactive=ns.interactive,
                 list_languages=ns.list_languages,
+                incremental=ns.incremental,
+                incremental_backoff=ns.incremental_backoff,
+                search_cache=ns.search_cache,
             ),
             gui=ArgumentClientGuiSettings(
             ),
@@ -136,6 +139,9 @@ ArgumentClientCliSettings = namedtuple('ArgumentClientCliSettings', (
     'console',
     'interactive',
     'list_languages',
+    'incremental',
+    'incremental_backoff',
+    'search_cache',
 ))
 
 ArgumentClientGuiSettings = namedtuple('ArgumentClientGuiSettings', (
@@ -265,6 +271,16 @@ def get_argument_parser():
     cli_group.add_argument('--list-languages', dest='list_languages',
                            action='store_true', default=False,
                            help=_('List available languages and quit.'))
+    cli_group.add_argument('--incremental', dest='incremental',
+                           action='store_true', default=False,
+                           help=_('Skip videos that have subtitles or that were searched recently without result.'))
+    cli_group.add_argument('--incremental-backoff', dest='incremental_backoff', metavar='HOURS',
+                           type=float, default=None,
+                           help=_('Hours to wait before searching a video without subtitles again. '
+                                  'The time doubles after every unsuccessful search.'))
+    cli_group.add_argument('--no-search-cache', dest='search_cache',
+                           action='store_false', default=True,
+                           help=_('Search all videos online, ignoring the results of previous searches.'))
 
     operation_group = cli_group.add_mutually_exclusive_group()
     operation_group.add_argument('-D', '--download', dest='operation', action='store_const', const=CliAction.DOWNLOAD,
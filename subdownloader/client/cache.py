@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+
+import logging
+import sqlite3
+
+from subdownloader.client.state import BaseState
+
+log = logging.getLogger('subdownloader.client.cache')
+
+FILE_HASH_CACHE_FILENAME = 'hashes.sqlite'
+DOWNLOAD_COUNT_CACHE_FILENAME = 'downloads.sqlite'
+SEARCH_RESULT_CACHE_FILENAME = 'searches.sqlite'
+SUBTITLE_DOWNLOAD_CACHE_FILENAME = 'subtitles.sqlite'
+HTTP_RESPONSE_CACHE_FILENAME = 'http.sqlite'
+
+
+def cache_init():
+    from subdownloader import cache
+    path = BaseState.get_default_settings_folder() / FILE_HASH_CACHE_FILENAME
+    try:
+        cache.set_default_file_hash_cache(cache.FileHashCache(path))
+    except sqlite3.Error:
+        log.warning('Failed to open hash cache at "{}". Hashes will not be cached.'.format(path), exc_info=True)
+    path = BaseState.get_default_settings_folder() / DOWNLOAD_COUNT_CACHE_FILENAME
+    try:
+        cache.set_default_download_count_cache(cache.DownloadCountCache(path))
+    except sqlite3.Error:
+        log.warning('Failed to open download count at "{}". '
+                    'Downloads will only be counted during this run.'.format(path), exc_info=True)
+    path = BaseState.get_default_settings_folder() / SEARCH_RESULT_CACHE_FILENAME
+    try:
+        cache.set_default_search_result_cache(cache.SearchResultCache(path))
+    except sqlite3.Error:
+        log.warning('Failed to open search cache at "{}". Searches will not be cached.'.format(path), exc_info=True)
+    path = BaseState.get_default_settings_folder() / SUBTITLE_DOWNLOAD_CACHE_FILENAME
+    try:
+        cache.set_default_subtitle_download_cache(cache.SubtitleDownloadCache(path))
+    except sqlite3.Error:
+        log.warning('Failed to open subtitle cache at "{}". Subtitles will not be cached.'.format(path),
+                    exc_info=True)
+    path = BaseState.get_default_settings_folder() / HTTP_RESPONSE_CACHE_FILENAME
+    try:
+        cache.set_default_http_response_cache(cache.HttpResponseCache(path))
+    except sqlite3.Error:
+        log.warning('Failed to open http cache at "{}". Web pages will not be cached.'.format(path), exc_info=True)
@@ -14,6 +14,9 @@ def get_default_options():
                 console=False,
                 interactive=None,
                 list_languages=False,
+                incremental=False,
+                incremental_backoff=None,
+                search_cache=True,
             ),
             gui=None,
         )
@@ -7,9 +7,13 @@ from os import linesep
 from pathlib import Path
 import re
 import shlex
+import sqlite3
 
+from subdownloader.cache import set_default_search_result_cache, VideoStateCache
 from subdownloader.client.cli.callback import ProgressBarCallback
 from subdownloader.client.cli.state import CliState
+from subdownloader.client.incremental import IncrementalScan, INCREMENTAL_STATE_FILENAME
+from subdownloader.client.pipeline import SubtitlePipeline
 from subdownloader.client.state import SubtitleNamingStrategy
 from subdownloader.util import IllegalPathException
 from subdownloader.filescan import scan_videopaths
@@ -19,6 +23,7 @@ from subdownloader.languages.language import Language, NotALanguageException, Un
 from subdownloader.languages.language import LANGUAGES as ALL_LANGUAGES
 from subdownloader.subtitle2 import RemoteSubtitleFile
 from subdownloader.movie import LocalMovie, VideoSubtitle
+from subdownloader.video2 import hash_videos
 
 log = logging.getLogger(__name__)
 
@@ -34,6 +39,9 @@ class CliCmd(Cmd):
         self._settings = settings
         self._state.load_options(options)
         self._state.load_settings(settings)
+        if not self._state.get_search_cache():
+            log.debug('Search cache disabled')
+            set_default_search_result_cache(None)
 
         self._return_code = 1
         self.prompt = '>>> '
@@ -81,9 +89,28 @@ class CliCmd(Cmd):
         return result
 
     def run_headless(self):
+        if not self._state.get_interactive():
+            return self.run_headless_pipeline()
+        incremental_cache, incremental = self._open_incremental()
+        try:
+            return self.run_headless_interactive(incremental)
+        finally:
+            if incremental_cache is not None:
+                incremental_cache.close()
+
+    def run_headless_interactive(self, incremental=None):
+        """
+        Scan, hash and search, then ask the user which subtitle to download for each video.
+        :param incremental: IncrementalScan to skip videos handled by previous runs (None to process all videos)
+        """
         self.onecmd('login')
         self.onecmd('filescan')
+        if incremental is not None:
+            videos = [video for video in self._videos if not incremental.should_skip(video)]
+            self.echo(_('{} videos skipped').format(len(self._videos) - len(videos)))
+            self.set_videos(videos)
         self.onecmd('vidsearch')
+        video_rsubs = []
         for video in self._videos:
             self._print_videos([video])
             nb, nb_total = self.get_number_remote_subtitles(video)
@@ -92,18 +119,15 @@ class CliCmd(Cmd):
                     print(_('Video has no subtitles that match your filter. Skipping.'))
                 else:
                     print(_('Video has no subtitles. Skipping.'))
+                if incremental is not None:
+                    incremental.record_unsatisfied(video)
                 continue
 
-            if self._state.get_interactive():
-                try:
-                    sub_i = int(input('{} [0-{}) '.format(_('What subtitle would you like to download?'), nb)).strip())
-                except (IndexError, ValueError):
-                    self.echo(_('Invalid index.'))
-                    return 1
-            else:
-                self.echo('{} ({})'.format(_('Auto-selecting first subtitle.'),
-                                            _('Use interactive mode to select another subtitle.')))
-                sub_i = 0
+            try:
+                sub_i = int(input('{} [0-{}) '.format(_('What subtitle would you like to download?'), nb)).strip())
+            except (IndexError, ValueError):
+                self.echo(_('Invalid index.'))
+                return 1
             try:
                 subtitle = self.get_videos_subtitle(sub_i, [video])
             except IndexError:
@@ -114,7 +138,81 @@ class CliCmd(Cmd):
                 self.echo(_('Cannot select local subtitles.'))
                 continue
             self._video_rsubs.update({subtitle})
+            video_rsubs.append((video, subtitle))
         self.onecmd('viddownload')
+        if incremental is not None:
+            for video, rsub in video_rsubs:
+                # viddownload keeps the subtitles that were not downloaded.
+                if rsub not in self._video_rsubs:
+                    incremental.record_satisfied(video, [rsub.get_language()])
+
+    def run_headless_pipeline(self):
+        """
+        Scan, hash, search and download without user interaction.
+        The stages run concurrently, so downloading starts before all videos have been scanned.
+        """
+        self.onecmd('login')
+
+        def select_subtitle(video):
+            self._print_videos([video])
+            nb, nb_total = self.get_number_remote_subtitles(video)
+            if not nb:
+                if nb_total:
+                    self.echo(_('Video has no subtitles that match your filter. Skipping.'))
+                else:
+                    self.echo(_('Video has no subtitles. Skipping.'))
+                return None
+            self.echo('{} ({})'.format(_('Auto-selecting first subtitle.'),
+                                        _('Use interactive mode to select another subtitle.')))
+            try:
+                subtitle = self.get_videos_subtitle(0, [video])
+            except IndexError:
+                self.echo(_('Video has no subtitles that match the filter.'))
+                return None
+            self.echo(_('Selected subtitle:'), self.subtitle_to_long_string(subtitle))
+            if subtitle.is_local():
+                self.echo(_('Cannot select local subtitles.'))
+                return None
+            return subtitle
+
+        incremental_cache, incremental = self._open_incremental()
+        pipeline = SubtitlePipeline(self._state, select_subtitle, self.get_file_save_as_cb(), incremental=incremental)
+        try:
+            statistics = pipeline.run()
+        except IllegalPathException as e:
+            self.echo(_('The video path "{}" does not exist').format(e.path()))
+            return
+        finally:
+            if incremental_cache is not None:
+                incremental_cache.close()
+        self.set_videos(pipeline.get_videos())
+        if incremental is not None:
+            self.echo(_('{} videos skipped').format(statistics.get('skipped')))
+        if statistics.get('deferred'):
+            self.echo(_('Daily download limit reached: {} subtitles not downloaded').format(
+                statistics.get('deferred')))
+        self.echo(_('{nb_videos} videos processed, {nb_downloaded} subtitles downloaded in {time:.1f}s '
+                    '({speed:.2f} videos/s)').format(nb_videos=statistics.get('scanned'),
+                                                     nb_downloaded=statistics.get('downloaded'),
+                                                     time=statistics.get_elapsed(),
+                                                     speed=statistics.get_videos_per_second()))
+
+    def _open_incremental(self):
+        """
+        Open the state of previous runs, if incremental processing is enabled.
+        :return: tuple of VideoStateCache and IncrementalScan, tuple of None if not enabled or not available
+        """
+        if not self._state.get_incremental():
+            return None, None
+        path = self._state.get_default_settings_folder() / INCREMENTAL_STATE_FILENAME
+        try:
+            incremental_cache = VideoStateCache(path)
+        except sqlite3.Error:
+            log.warning('Failed to open incremental state at "{}".'.format(path), exc_info=True)
+            self.echo(_('Incremental state not available: processing all videos.'))
+            return None, None
+        return incremental_cache, IncrementalScan(incremental_cache, self._state.get_download_languages(),
+                                                  backoff=self._state.get_incremental_backoff())
 
     def cleanup(self):
         self._state.providers.logout()
@@ -357,6 +455,17 @@ class CliCmd(Cmd):
 
         callback.finish()
 
+        callback = self.get_callback()
+        callback.set_title_text(_('Hashing...'))
+        callback.set_label_text(_('Hashing files'))
+        callback.set_finished_text(_('Hashing finished'))
+        callback.set_block(True)
+        callback.show()
+
+        if not hash_videos(local_videos, callback):
+            self.echo(_('Hashing canceled'))
+            return
+
         self.set_videos(local_videos)
         self.echo(_('{}/{} videos/subtitles have been found').format(len(local_videos), len(local_subs)))
 
@@ -723,22 +832,45 @@ class CliCmd(Cmd):
             return
         subs_to_download = {rsub for rsub in self._video_rsubs if self.download_filter_language_object(rsub)}
         self.echo(_('Number of subs to download: {}'.format(len(subs_to_download))))
-        for rsub in subs_to_download:
+        downloaded = self._download_subtitles(subs_to_download, self.state.calculate_download_path)
+        self._video_rsubs.difference_update(downloaded)
+
+    def _download_subtitles(self, rsubs, calculate_download_path):
+        """
+        Download subtitles in batches per provider.
+        :param rsubs: iterable of RemoteSubtitleFile
+        :param calculate_download_path: callable receiving a subtitle and a save-as callback, returning its target path
+        :return: set of the downloaded RemoteSubtitleFile objects
+        """
+        rsub_paths = []
+        reserved_paths = set()
+        for rsub in rsubs:
             self.echo('- {}'.format(self.subtitle_to_long_string(rsub)))
-            provider_type = rsub.get_provider()
-            try:
-                providerState = self.state.providers.get(provider_type)
-            except IndexError:
-                self.echo(_('Provider "{}" not available.').format(provider_type.get_name()))
-                return
-            target_path = self.state.calculate_download_path(rsub, self.get_file_save_as_cb())
-            callback = self.get_callback()
-            try:
-                rsub.download(target_path=target_path, provider_instance=providerState.provider, callback=callback)
-            except ProviderConnectionError:
-                self.echo(_('An error happened during download'))
-                return
-            self._video_rsubs.remove(rsub)
+            target_path = calculate_download_path(rsub, self.get_file_save_as_cb())
+            if target_path is None:
+                continue
+            # Reserve the path, so the next subtitles pick another one.
+            if not target_path.exists():
+                target_path.touch()
+                reserved_paths.add(target_path)
+            rsub_paths.append((rsub, target_path))
+
+        downloaded = set()
+        try:
+            for rsub, local_sub in self.state.providers.iter_write_subtitles(rsub_paths):
+                if local_sub is None:
+                    self.echo(_('Provider of subtitle "{}" is not available').format(rsub.get_filename()))
+                    continue
+                downloaded.add(rsub)
+        except ProviderConnectionError:
+            self.echo(_('An error happened during download'))
+        finally:
+            for rsub, target_path in rsub_paths:
+                if rsub not in downloaded and target_path in reserved_paths:
+                    target_path.unlink()
+        if len(downloaded) < len(rsub_paths):
+            self.echo(_('{} subtitles not downloaded').format(len(rsub_paths) - len(downloaded)))
+        return downloaded
 
     # FIXME: merge these..
 
@@ -790,8 +922,7 @@ class CliCmd(Cmd):
 
         try:
             if fetch_all:
-                while self._text_query.more_movies_available():
-                    self._text_query.search_more_movies()
+                self._text_query.search_all_movies()
             else:
                 self._text_query.search_more_movies()
         except ProviderConnectionError:
@@ -987,22 +1118,8 @@ class CliCmd(Cmd):
             return
         subs_to_download = {rsub for rsub in self._query_rsubs if self.download_filter_language_object(rsub)}
         self.echo(_('Number of subs to download: {}'.format(len(subs_to_download))))
-        for rsub in subs_to_download:
-            self.echo('- {}'.format(self.subtitle_to_long_string(rsub)))
-            provider_type = rsub.get_provider()
-            try:
-                providerState = self.state.providers.get(provider_type)
-            except IndexError:
-                self.echo(_('Provider not available.'))
-                return
-            target_path = self.state.calculate_download_query_path(rsub, self.get_file_save_as_cb())
-            callback = self.get_callback()
-            try:
-                rsub.download(target_path=target_path, provider_instance=providerState.provider, callback=callback)
-            except ProviderConnectionError:
-                self.echo(_('An error happened during download'))
-                return
-            self._query_rsubs.remove(rsub)
+        downloaded = self._download_subtitles(subs_to_download, self.state.calculate_download_query_path)
+        self._query_rsubs.difference_update(downloaded)
 
     def do_upload_reset(self, arg):
         if arg:
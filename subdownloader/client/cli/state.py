@@ -12,6 +12,9 @@ class CliState(BaseState):
         self._interactive = False
         self._console = False
         self._recursive = False
+        self._incremental = False
+        self._incremental_backoff = None
+        self._search_cache = True
 
         self.set_subtitle_download_path_strategy(SubtitlePathStrategy.SAME)
 
@@ -28,6 +31,10 @@ class CliState(BaseState):
         self._console = options.program.client.cli.console
         self._interactive = options.program.client.cli.interactive
         self._list_languages = options.program.client.cli.list_languages
+        self._incremental = options.program.client.cli.incremental
+        if options.program.client.cli.incremental_backoff is not None:
+            self._incremental_backoff = options.program.client.cli.incremental_backoff * 60 * 60
+        self._search_cache = options.program.client.cli.search_cache
 
         self._recursive = options.search.recursive
 
@@ -44,6 +51,15 @@ class CliState(BaseState):
     def get_list_languages(self):
         return self._list_languages
 
+    def get_incremental(self):
+        return self._incremental
+
+    def get_incremental_backoff(self):
+        return self._incremental_backoff
+
+    def get_search_cache(self):
+        return self._search_cache
+
     def get_recursive(self):
         return self._recursive
 
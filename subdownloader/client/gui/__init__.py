@@ -8,8 +8,7 @@ import sys
 from PyQt5.QtCore import QCoreApplication
 from PyQt5.QtWidgets import QApplication
 
-from subdownloader.subtitle2 import SUBTITLES_EXT
-from subdownloader.video2 import VIDEOS_EXT
+from subdownloader.filescan import FileCategory, get_default_extension_classifier
 from subdownloader.client.gui.widgets.splashScreen import SplashScreen
 from subdownloader.project import PROJECT_TITLE
 
@@ -32,11 +31,13 @@ def get_default_options():
 
 
 def get_select_subtitles():
-    return _("Subtitle Files (*.%s)") % " *.".join(SUBTITLES_EXT)
+    extensions = sorted(get_default_extension_classifier().get_extensions(FileCategory.SUBTITLE))
+    return _("Subtitle Files (*.%s)") % " *.".join(extensions)
 
 
 def get_select_videos():
-    return _("Video Files (*.%s)") % " *.".join(VIDEOS_EXT)
+    extensions = sorted(get_default_extension_classifier().get_extensions(FileCategory.VIDEO))
+    return _("Video Files (*.%s)") % " *.".join(extensions)
 
 
 def run(options, settings):
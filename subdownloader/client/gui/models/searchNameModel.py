@@ -221,6 +221,8 @@ class VideoTreeModel(QAbstractItemModel):
 
         if self._query.more_movies_available():
             self._all_root.add_child(SearchMoreMovies(text=_('More movies ...')))
+            # Fetch the next page while the user looks at the current one.
+            self._query.prefetch_more_movies()
 
         self._apply_filters()
 
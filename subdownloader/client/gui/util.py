@@ -9,7 +9,6 @@ import sys
 from PyQt5.QtWidgets import QFileDialog, QMessageBox
 
 from subdownloader.provider.provider import ProviderConnectionError
-from subdownloader.client.callback import ProgressCallback
 from subdownloader.client.gui.callback import ProgressCallbackWidget
 from subdownloader.video2 import VideoFile
 
@@ -64,23 +63,27 @@ class SubtitleDownloadProcess(object):
     def info(self, title, msg):
         QMessageBox.information(self._parent, title, msg)
 
-    def _download_current_subtitle(self):
+    def _resolve_current_subtitle_path(self, pending_paths):
+        """
+        Ask the user where to save the current subtitle, if needed.
+        :param pending_paths: set of paths chosen for the previous subtitles, not downloaded yet
+        :return: path where to save the subtitle, None to skip the subtitle
+        """
         if self.finished():
-            return
+            return None
         rsub = self._rsubtitles[self._curr_sub_i]
         destinationPath = self._state.calculate_download_path(rsub, self._create_choose_target_subtitle_path_cb(),
                                                               conflict_free=False)
         if not destinationPath:
             self._callback.cancel()
             self.info(_('Download canceled'), _('Downloading has been canceled'))
-            return
+            return None
 
         log.debug('Trying to download subtitle "{}"'.format(destinationPath))
 
         while True:
-            self._callback.update(self._curr_sub_i, destinationPath, self._curr_sub_i + 1, len(self._rsubtitles))
             if self.finished():
-                break
+                return None
 
             # Check for write access for file and folder
             if not os.access(str(destinationPath), os.W_OK) and not os.access(str(destinationPath.parent), os.W_OK):
@@ -95,26 +98,26 @@ class SubtitleDownloadProcess(object):
                 if boxExecResult == QMessageBox.Retry:
                     continue
                 elif boxExecResult == QMessageBox.Abort:
-                    return
+                    return None
                 else:
                     clickedButton = warningBox.clickedButton()
                     if clickedButton is None:
-                        return
+                        return None
                     elif clickedButton == saveAsButton:
                         newFilePath, t = QFileDialog.getSaveFileName(
                             self._parent, _('Save subtitle as...'), str(destinationPath), 'All (*.*)')
                         if not newFilePath:
                             self._callback.cancel()
-                            return
+                            return None
                         destinationPath = Path(newFilePath)
                         continue
                     else:
                         log.debug('Unknown button clicked: result={}, button={}, role: {}'.format(boxExecResult, clickedButton, warningBox.buttonRole(clickedButton)))
-                        return
+                        return None
 
-            if destinationPath.exists():
+            if destinationPath.exists() or destinationPath in pending_paths:
                 if self._skip_all:
-                    return
+                    return None
                 elif self._replace_all:
                     pass
                 else:
@@ -136,10 +139,10 @@ class SubtitleDownloadProcess(object):
 
                     clickedButton = fileExistsBox.clickedButton()
                     if clickedButton == skipButton:
-                        return
+                        return None
                     elif clickedButton == skipAllButton:
                         self._skip_all = True
-                        return
+                        return None
                     elif clickedButton == replaceButton:
                         pass
                     elif clickedButton == replaceAllButton:
@@ -149,40 +152,62 @@ class SubtitleDownloadProcess(object):
                         fileName, t = QFileDialog.getSaveFileName(
                             None, _('Save subtitle as...'), str(suggestedDestinationPath), 'All (*.*)')
                         if not fileName:
-                            return
+                            return None
                         destinationPath = Path(fileName)
                         continue
                     elif clickedButton == cancelButton:
                         self._callback.cancel()
-                        return
+                        return None
                     else:
                         log.debug('Unknown button clicked: result={}, button={}, role: {}'.format(
                             fileExecResult, clickedButton, fileExistsBox.buttonRole(clickedButton)))
-                        return
+                        return None
             break
+        return destinationPath
 
+    def _download_subtitles(self, rsub_paths):
+        log.debug('Downloading {} subtitles'.format(len(rsub_paths)))
+        unavailable_subs = []
         try:
-            log.debug('Downloading subtitle to "{}"'.format(destinationPath))
-            download_callback = ProgressCallback()  # FIXME
-            local_sub = rsub.download(destinationPath,
-                                      self._state.providers.get(rsub.get_provider()).provider, download_callback)
+            for sub_i, (rsub, local_sub) in enumerate(self._state.providers.iter_write_subtitles(rsub_paths)):
+                if local_sub is None:
+                    # The provider of the subtitle is not available.
+                    unavailable_subs.append(rsub)
+                    continue
+                self._callback.update(sub_i, local_sub.get_filepath(), sub_i + 1, len(rsub_paths))
 
-            if self._parent_add:
-                super_parent = rsub.get_super_parent(VideoFile)
-                if super_parent:
-                    super_parent.add_subtitle(local_sub, priority=True)
+                if self._parent_add:
+                    super_parent = rsub.get_super_parent(VideoFile)
+                    if super_parent:
+                        super_parent.add_subtitle(local_sub, priority=True)
 
-            self._downloaded_subtitles.append(rsub)
+                self._downloaded_subtitles.append(rsub)
         except ProviderConnectionError:
-            log.debug('Unable to download subtitle "{}"'.format(rsub.get_filename()), exc_info=sys.exc_info())
+            failed_subs = [rsub for rsub, _ in rsub_paths if rsub not in self._downloaded_subtitles]
+            log.debug('Unable to download {} subtitles'.format(len(failed_subs)), exc_info=sys.exc_info())
             QMessageBox.about(self._parent, _('Error'), _('Unable to download subtitle "{subtitle}"').format(
-                subtitle=rsub.get_filename()))
+                subtitle=', '.join(rsub.get_filename() for rsub in failed_subs)))
             self._callback.finish()
+            return
+        if unavailable_subs:
+            log.debug('Provider not available for {} subtitles'.format(len(unavailable_subs)))
+            QMessageBox.about(self._parent, _('Error'), _('Unable to download subtitle "{subtitle}"').format(
+                subtitle=', '.join(rsub.get_filename() for rsub in unavailable_subs)))
 
     def download_all(self):
+        # Ask for all paths first, so the subtitles of each provider can be downloaded in batches.
+        rsub_paths = []
         while not self.finished():
-            self._download_current_subtitle()
+            destination_path = self._resolve_current_subtitle_path({path for rsub, path in rsub_paths})
+            if destination_path is not None:
+                # When the user chose to replace a subtitle of this batch, that subtitle is not downloaded.
+                rsub_paths = [(rsub, path) for rsub, path in rsub_paths if path != destination_path]
+                rsub_paths.append((self._rsubtitles[self._curr_sub_i], destination_path))
             self._curr_sub_i += 1
+        if self._callback.canceled():
+            log.debug('Download canceled: {} subtitles not downloaded'.format(len(rsub_paths)))
+            return
+        self._download_subtitles(rsub_paths)
         if not self._callback.finished():
             self._callback.finish(len(self._rsubtitles), len(self._rsubtitles))
 
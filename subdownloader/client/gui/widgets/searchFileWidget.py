@@ -14,7 +14,7 @@ from PyQt5.QtWidgets import QAction, QFileDialog, QFileIconProvider, QFileSystem
 from subdownloader.filescan import scan_videopaths
 from subdownloader.languages.language import Language, UnknownLanguage
 from subdownloader.project import PROJECT_TITLE
-from subdownloader.video2 import VideoFile
+from subdownloader.video2 import VideoFile, hash_videos
 from subdownloader.subtitle2 import LocalSubtitleFile, RemoteSubtitleFile, SubtitleFile, SubtitleFileNetwork
 from subdownloader.provider.provider import ProviderConnectionError  # FIXME: move to provider
 
@@ -330,6 +330,14 @@ class SearchFileWidget(QWidget):
             QMessageBox.information(self, _('Scan Results'), _('No video has been found.'))
             return
 
+        callback.set_label_text(_('Hashing files'))
+        callback.show()
+
+        hash_videos(local_videos, callback=callback)
+
+        if callback.canceled():
+            return
+
         total = len(local_videos)
 
         # FIXME: must pass mainwindow as argument to ProgressCallbackWidget
@@ -338,6 +346,7 @@ class SearchFileWidget(QWidget):
         # callback.set_label_text(_('Searching subtitles...'))
         # callback.set_updated_text(_('Searching subtitles ( %d / %d )'))
         # callback.set_finished_text(_('Search finished'))
+        callback.set_label_text(_('Searching subtitles...'))
         callback.set_block(True)
         callback.set_range(0, total)
 
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+
+import logging
+import time
+
+from subdownloader.cache import FileIdentity, VideoState
+
+log = logging.getLogger('subdownloader.client.incremental')
+
+INCREMENTAL_STATE_FILENAME = 'incremental.sqlite'
+
+
+class IncrementalScan(object):
+    """
+    Decide which videos need a subtitle search, using the state of previous runs.
+    A video is satisfied when it has a subtitle of one of the requested languages.
+    Satisfied videos are skipped for as long as the video file is unchanged.
+    Unsatisfied videos are searched again after a backoff, that doubles after every unsuccessful search.
+    """
+
+    DEFAULT_BACKOFF = 24 * 60 * 60
+    DEFAULT_MAX_BACKOFF = 30 * 24 * 60 * 60
+
+    def __init__(self, cache, languages, backoff=None, max_backoff=None):
+        """
+        Create a new IncrementalScan.
+        :param cache: VideoStateCache storing the state of the videos
+        :param languages: list of requested languages (empty list for any language)
+        :param backoff: time (in seconds) to wait before searching an unsatisfied video again (None for the default)
+        :param max_backoff: maximum time (in seconds) between two searches (None for the default)
+        """
+        self._cache = cache
+        self._languages = list(languages)
+        self._languages_key = self.languages_to_key(self._languages)
+        self._backoff = self.DEFAULT_BACKOFF if backoff is None else backoff
+        self._max_backoff = self.DEFAULT_MAX_BACKOFF if max_backoff is None else max_backoff
+
+    @staticmethod
+    def languages_to_key(languages):
+        return ','.join(sorted(language.xxx() for language in languages if not language.is_generic()))
+
+    def get_backoff(self, nb_searches):
+        """
+        Get the time to wait after a number of unsuccessful searches.
+        :param nb_searches: number of unsuccessful searches
+        :return: time in seconds
+        """
+        if nb_searches <= 0:
+            return 0
+        return min(self._backoff * (2 ** (nb_searches - 1)), self._max_backoff)
+
+    def _matches_languages(self, language):
+        # Same semantics as the download language filter: generic languages always match.
+        if not self._languages or language.is_generic():
+            return True
+        return language in self._languages
+
+    def should_skip(self, video):
+        """
+        Check whether the subtitle search of a video can be skipped.
+        A video that has a local subtitle of a requested language is recorded as satisfied.
+        :param video: VideoFile, with its local subtitles added
+        :return: True if the video does not need to be searched
+        """
+        try:
+            identity = FileIdentity.from_stat(video.get_stat())
+        except (OSError, IOError):
+            return False
+        state = self._cache.get_video_state(identity)
+        if state is not None and state.languages != self._languages_key:
+            state = None
+
+        local_languages = [subtitle.get_language() for subtitle in video.get_subtitles().iter_local_subtitles()
+                           if self._matches_languages(subtitle.get_language())]
+        if local_languages:
+            if state is None or not state.satisfied:
+                self._cache.set_video_state(identity, VideoState(
+                    languages=self._languages_key, satisfied=self.languages_to_key(local_languages) or '*',
+                    last_search=0. if state is None else state.last_search,
+                    nb_searches=0 if state is None else state.nb_searches))
+            log.debug('"{}" has local subtitles -> skip'.format(video.get_filepath()))
+            return True
+
+        if state is None:
+            return False
+        if state.satisfied:
+            log.debug('"{}" was satisfied before -> skip'.format(video.get_filepath()))
+            return True
+        retry_time = state.last_search + self.get_backoff(state.nb_searches)
+        if self._now() < retry_time:
+            log.debug('"{}" searched {} times without result -> skip until {}'.format(
+                video.get_filepath(), state.nb_searches, time.ctime(retry_time)))
+            return True
+        return False
+
+    def _record(self, video, satisfied_languages):
+        try:
+            identity = FileIdentity.from_stat(video.get_stat())
+        except (OSError, IOError):
+            return
+        state = self._cache.get_video_state(identity)
+        nb_searches = 0
+        if state is not None and state.languages == self._languages_key:
+            nb_searches = state.nb_searches
+        if satisfied_languages is None:
+            satisfied = ''
+            nb_searches += 1
+        else:
+            satisfied = self.languages_to_key(satisfied_languages) or '*'
+        self._cache.set_video_state(identity, VideoState(languages=self._languages_key, satisfied=satisfied,
+                                                         last_search=self._now(), nb_searches=nb_searches))
+
+    def record_satisfied(self, video, languages):
+        """
+        Record that subtitles have been downloaded for a video.
+        :param video: VideoFile
+        :param languages: list of languages of the downloaded subtitles
+        """
+        self._record(video, languages)
+
+    def record_unsatisfied(self, video):
+        """
+        Record that no subtitle was found for a video.
+        :param video: VideoFile
+        """
+        self._record(video, None)
+
+    @staticmethod
+    def _now():
+        return time.time()
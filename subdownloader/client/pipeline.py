@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+
+import logging
+import queue
+import threading
+import time
+
+from subdownloader.callback import ProgressCallback
+from subdownloader.filescan import iter_scan_videopaths
+from subdownloader.provider.provider import ProviderQuotaExceededError
+from subdownloader.util import IllegalPathException
+from subdownloader.video2 import DEFAULT_HASH_WORKERS
+
+log = logging.getLogger('subdownloader.client.pipeline')
+
+
+class PipelineStatistics(object):
+    """
+    Counters of a pipeline run. Updated by the worker threads, read after the run.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {
+            'scanned': 0,
+            'hashed': 0,
+            'searched': 0,
+            'selected': 0,
+            'downloaded': 0,
+            'skipped': 0,
+            'deferred': 0,
+            'failed': 0,
+        }
+        self._time_start = None
+        self._time_end = None
+
+    def increment(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] += amount
+
+    def get(self, counter):
+        return self._counters[counter]
+
+    def start(self):
+        self._time_start = time.perf_counter()
+
+    def stop(self):
+        self._time_end = time.perf_counter()
+
+    def get_elapsed(self):
+        """
+        Get the duration of the run.
+        :return: duration in seconds
+        """
+        if self._time_start is None:
+            return 0.
+        end = self._time_end if self._time_end is not None else time.perf_counter()
+        return end - self._time_start
+
+    def get_videos_per_second(self):
+        """
+        Get the end-to-end throughput of the run.
+        :return: number of scanned videos per second
+        """
+        elapsed = self.get_elapsed()
+        if not elapsed:
+            return 0.
+        return self.get('scanned') / elapsed
+
+    def __repr__(self):
+        return '<PipelineStatistics:{counters},elapsed={elapsed:.3f}s>'.format(
+            counters=','.join('{}={}'.format(k, v) for k, v in sorted(self._counters.items())),
+            elapsed=self.get_elapsed())
+
+
+class SubtitlePipeline(object):
+    """
+    Scan, hash, search and download subtitles for videos, with all stages running concurrently.
+    The stages are connected through bounded queues:
+        scanner --> hash workers --> searcher --> download workers
+    The searcher batches the hashed videos, so one search request covers multiple videos.
+    """
+
+    DEFAULT_QUEUE_SIZE = 64
+    DEFAULT_SEARCH_BATCH = 20
+    DEFAULT_SEARCH_BATCH_TIMEOUT = 0.5
+    DEFAULT_DOWNLOAD_WORKERS = 2
+
+    _STOP = object()
+
+    def __init__(self, state, select_subtitle, file_save_as_cb, queue_size=None, hash_workers=None,
+                 search_batch=None, download_workers=None, incremental=None):
+        """
+        Create a new pipeline.
+        :param state: BaseState instance providing the video paths, the providers and the download paths
+        :param select_subtitle: callable receiving a searched VideoFile, returning the RemoteSubtitleFile to download
+            or None to download nothing. Called from the search thread.
+        :param file_save_as_cb: callback passed to BaseState.calculate_download_path
+        :param queue_size: maximum number of items waiting between two stages (None for the default)
+        :param hash_workers: number of videos hashed at the same time (None for the default)
+        :param search_batch: maximum number of videos per search (None for the default)
+        :param download_workers: number of subtitles downloaded at the same time (None for the default)
+        :param incremental: IncrementalScan to skip videos handled by previous runs (None to process all videos)
+        """
+        self._state = state
+        self._select_subtitle = select_subtitle
+        self._file_save_as_cb = file_save_as_cb
+        self._queue_size = self.DEFAULT_QUEUE_SIZE if queue_size is None else queue_size
+        self._hash_workers = DEFAULT_HASH_WORKERS if hash_workers is None else hash_workers
+        self._search_batch = self.DEFAULT_SEARCH_BATCH if search_batch is None else search_batch
+        self._download_workers = self.DEFAULT_DOWNLOAD_WORKERS if download_workers is None else download_workers
+        self._incremental = incremental
+
+        self._hash_queue = None
+        self._search_queue = None
+        self._download_queue = None
+        # Calculating a conflict free download path and creating the file must happen atomically.
+        self._download_path_lock = threading.Lock()
+
+        self._videos = []
+        self._downloaded = []
+        self._statistics = PipelineStatistics()
+        self._illegal_path = None
+
+    def get_videos(self):
+        """
+        Get the videos found during the last run.
+        :return: list of VideoFile objects
+        """
+        return self._videos
+
+    def get_downloaded(self):
+        """
+        Get the subtitles downloaded during the last run.
+        :return: list of LocalSubtitleFile objects
+        """
+        return self._downloaded
+
+    def get_statistics(self):
+        return self._statistics
+
+    def run(self):
+        """
+        Run all stages until all videos of the video paths of the state have been processed.
+        :return: PipelineStatistics of this run
+        """
+        log.debug('run(queue_size={}, hash_workers={}, search_batch={}, download_workers={})'.format(
+            self._queue_size, self._hash_workers, self._search_batch, self._download_workers))
+        self._hash_queue = queue.Queue(maxsize=self._queue_size)
+        self._search_queue = queue.Queue(maxsize=self._queue_size)
+        self._download_queue = queue.Queue(maxsize=self._queue_size)
+        self._videos = []
+        self._downloaded = []
+        self._statistics = PipelineStatistics()
+        self._illegal_path = None
+
+        self._statistics.start()
+        scan_thread = self._start_thread('scan', self._run_scan)
+        hash_threads = [self._start_thread('hash-{}'.format(i), self._run_hash)
+                        for i in range(max(1, self._hash_workers))]
+        search_thread = self._start_thread('search', self._run_search)
+        download_threads = [self._start_thread('download-{}'.format(i), self._run_download)
+                            for i in range(max(1, self._download_workers))]
+
+        # Shut down the stages in order: a stage stops when all of its producers have finished.
+        scan_thread.join()
+        self._stop_stage(self._hash_queue, hash_threads)
+        self._stop_stage(self._search_queue, [search_thread])
+        self._stop_stage(self._download_queue, download_threads)
+
+        self._statistics.stop()
+        log.debug('run finished: {}'.format(self._statistics))
+        if self._illegal_path is not None:
+            raise self._illegal_path
+        return self._statistics
+
+    @staticmethod
+    def _start_thread(name, target):
+        thread = threading.Thread(target=target, name='pipeline-{}'.format(name))
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _stop_stage(self, stage_queue, threads):
+        for _ in threads:
+            stage_queue.put(self._STOP)
+        for thread in threads:
+            thread.join()
+
+    def _run_scan(self):
+        try:
+            for video in iter_scan_videopaths(self._state.get_video_paths(), recursive=self._state.get_recursive()):
+                self._videos.append(video)
+                self._statistics.increment('scanned')
+                if self._incremental is not None and self._incremental.should_skip(video):
+                    self._statistics.increment('skipped')
+                    continue
+                self._hash_queue.put(video)
+        except IllegalPathException as e:
+            log.warning('Scanning failed: path "{}" does not exist'.format(e.path()))
+            self._illegal_path = e
+        except OSError:
+            log.warning('Scanning failed', exc_info=True)
+
+    def _run_hash(self):
+        while True:
+            video = self._hash_queue.get()
+            if video is self._STOP:
+                return
+            try:
+                video.get_size()
+                video.get_osdb_hash()
+                self._statistics.increment('hashed')
+            except (OSError, IOError):
+                log.info('Error hashing {}'.format(video.get_filepath()), exc_info=True)
+                self._statistics.increment('failed')
+                continue
+            self._search_queue.put(video)
+
+    def _next_search_batch(self):
+        """
+        Wait for the next batch of hashed videos. A batch is sent as soon as it is full,
+        or when no new video arrived for a while.
+        :return: tuple of list of videos and True if the search stage should stop afterwards
+        """
+        video = self._search_queue.get()
+        if video is self._STOP:
+            return [], True
+        batch = [video]
+        while len(batch) < self._search_batch:
+            try:
+                video = self._search_queue.get(timeout=self.DEFAULT_SEARCH_BATCH_TIMEOUT)
+            except queue.Empty:
+                break
+            if video is self._STOP:
+                return batch, True
+            batch.append(video)
+        return batch, False
+
+    def _run_search(self):
+        stop = False
+        try:
+            while not stop:
+                batch, stop = self._next_search_batch()
+                if batch:
+                    self._search_batch_videos(batch)
+        finally:
+            if not stop:
+                # Keep consuming hashed videos, so the hash workers never block on a full queue.
+                while self._search_queue.get() is not self._STOP:
+                    self._statistics.increment('failed')
+
+    def _search_batch_videos(self, batch):
+        """
+        Search a batch of videos and queue the selected subtitles for download.
+        :param batch: list of VideoFile objects
+        """
+        log.debug('Searching {} videos'.format(len(batch)))
+        try:
+            self._state.search_videos(batch, ProgressCallback())
+        except Exception:
+            log.warning('Search failed for {} videos'.format(len(batch)), exc_info=True)
+            self._statistics.increment('failed', len(batch))
+            return
+        self._statistics.increment('searched', len(batch))
+        for video in batch:
+            try:
+                rsub = self._select_subtitle(video)
+            except Exception:
+                log.warning('Selecting a subtitle for {} failed'.format(video.get_filepath()), exc_info=True)
+                self._statistics.increment('failed')
+                continue
+            if rsub is None:
+                if self._incremental is not None:
+                    self._incremental.record_unsatisfied(video)
+                continue
+            self._statistics.increment('selected')
+            self._download_queue.put((video, rsub))
+
+    def _run_download(self):
+        while True:
+            item = self._download_queue.get()
+            if item is self._STOP:
+                return
+            video, rsub = item
+            try:
+                downloaded = self._download(rsub)
+            except ProviderQuotaExceededError:
+                # The video is not recorded as satisfied: a later run downloads its subtitle.
+                log.debug('Download of {} deferred: quota exceeded'.format(rsub))
+                self._statistics.increment('deferred')
+                continue
+            except Exception:
+                log.warning('Download of {} failed'.format(rsub), exc_info=True)
+                self._statistics.increment('failed')
+                continue
+            if downloaded and self._incremental is not None:
+                self._incremental.record_satisfied(video, [rsub.get_language()])
+
+    def _download(self, rsub):
+        """
+        Download a remote subtitle to the path calculated by the state.
+        :param rsub: RemoteSubtitleFile
+        :return: True if the subtitle has been downloaded
+        """
+        provider_state = self._state.providers.get(rsub.get_provider())
+        if provider_state is None:
+            log.warning('Provider "{}" not available.'.format(rsub.get_provider().get_name()))
+            self._statistics.increment('failed')
+            return False
+        with self._download_path_lock:
+            target_path = self._state.calculate_download_path(rsub, self._file_save_as_cb)
+            if target_path is None:
+                return False
+            # Reserve the path, so other download workers pick another one.
+            reserved = not target_path.exists()
+            if reserved:
+                target_path.touch()
+        try:
+            local_sub = rsub.download(target_path=target_path, provider_instance=provider_state.provider,
+                                      callback=ProgressCallback())
+        except Exception:
+            if reserved:
+                target_path.unlink()
+            raise
+        log.debug('Downloaded "{}"'.format(target_path))
+        self._downloaded.append(local_sub)
+        self._statistics.increment('downloaded')
+        return True
@@ -1,19 +1,25 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
 
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from enum import Enum
 import logging
 import os.path
 from pathlib import Path
 import platform
+import threading
+import time
 
+from subdownloader.callback import ProgressCallback
+from subdownloader.cache import FileHashCache, get_default_file_hash_cache, get_default_subtitle_download_cache, \
+    SubtitleDownloadCache
 from subdownloader.client.player import VideoPlayer
 from subdownloader.client import ClientType, IllegalArgumentException
+from subdownloader.filescan import ExtensionClassifier, FileCategory, set_default_extension_classifier
 from subdownloader.client.internationalization import i18n_system_locale, i18n_locale_fallbacks_calculate
 from subdownloader.project import PROJECT_TITLE
 from subdownloader.provider.imdb import ImdbHistory
-from subdownloader.provider.provider import ProviderConnectionError
+from subdownloader.provider.provider import ProviderConnectionError, ProviderTimeoutError
 from subdownloader.languages.language import Language, NotALanguageException, UnknownLanguage
 from subdownloader.provider.factory import NoProviderException, ProviderFactory
 from subdownloader.provider.provider import ProviderSettingsType, SubtitleProvider
@@ -75,6 +81,10 @@ class StateConfigKey(Enum):
     SUBTITLE_NAMING_STRATEGY = ('options', 'subtitleName',)
     DOWNLOAD_PATH = ('options', 'whereToDownloadFolder', )
     INTERFACE_LANGUAGE = ('options', 'interfaceLang', )
+    HASH_CACHE_SIZE = ('cache', 'hashCacheSize', )
+    SUBTITLE_CACHE_SIZE = ('cache', 'subtitleCacheSize', )
+    EXTRA_SUBTITLE_EXTENSIONS = ('options', 'extraSubtitleExtensions', )
+    EXTRA_VIDEO_EXTENSIONS = ('options', 'extraVideoExtensions', )
 
 
 class ProviderState(object):
@@ -123,11 +133,15 @@ class ProviderState(object):
             data[key] = d
         settings_new = provider_settings.load(**data)
         self._provider.set_settings(settings_new)
+        for window in self._provider.get_adaptive_windows():
+            window.set_size(settings.get_int((section, '_window_{}'.format(window.get_name())), window.get_size()))
         self._callback.on_change()
 
     def save_settings(self, settings):
         section = self._settings_section
         settings.set_bool((section, '_enabled'), self.getEnabled())
+        for window in self._provider.get_adaptive_windows():
+            settings.set_int((section, '_window_{}'.format(window.get_name())), window.get_size())
         provider_settings = self._provider.get_settings()
         data = provider_settings.as_dict()
         for key, key_type in provider_settings.key_types().items():
@@ -213,11 +227,166 @@ class ProvidersStateCallbackCollector(object):
             callback.on_change()
 
 
+class _RelayProgressCallback(ProgressCallback):
+    """
+    ProgressCallback of an operation running in a worker thread.
+    Progress is stored and forwarded to the target ProgressCallback by the thread owning the target.
+    Only that thread accesses the target: it also copies the cancellation of the target, for the worker thread to read.
+    """
+    def __init__(self, target):
+        ProgressCallback.__init__(self)
+        self._target = target
+        self._target_canceled = threading.Event()
+        self._lock = threading.Lock()
+        self._pending_range = None
+        self._pending_update = None
+
+    def on_rangeChange(self, minimum, maximum):
+        with self._lock:
+            self._pending_range = minimum, maximum
+
+    def on_update(self, value, *args, **kwargs):
+        with self._lock:
+            self._pending_update = value, args, kwargs
+
+    def canceled(self):
+        return self._canceled or self._target_canceled.is_set()
+
+    def forward(self):
+        """
+        Forward the pending progress to the target ProgressCallback, and read whether the target has been canceled.
+        Must be called from the thread owning the target.
+        """
+        with self._lock:
+            pending_range, self._pending_range = self._pending_range, None
+            pending_update, self._pending_update = self._pending_update, None
+        if pending_range is not None:
+            self._target.set_range(*pending_range)
+        if pending_update is not None:
+            value, args, kwargs = pending_update
+            self._target.update(value, *args, **kwargs)
+        if self._target.canceled():
+            self._target_canceled.set()
+
+
+class ProviderFanOut(object):
+    """
+    Run an operation on multiple providers at the same time, every provider in its own thread.
+    Failures are isolated: a provider raising an exception or exceeding the timeout does not affect the others.
+    A provider exceeding the timeout is abandoned: its thread is left running in the background.
+    A single provider runs in the calling thread, without timeout.
+    """
+    POLL_INTERVAL = .1
+
+    def __init__(self, timeout=None):
+        """
+        Create a new ProviderFanOut.
+        :param timeout: maximum time (in seconds) to wait for the providers (None to wait forever)
+        """
+        self._timeout = timeout
+
+    def get_timeout(self):
+        return self._timeout
+
+    def set_timeout(self, timeout):
+        self._timeout = timeout
+
+    def run(self, provider_states, operation, callback=None):
+        """
+        Run an operation for all provider states.
+        :param provider_states: list of ProviderState
+        :param operation: callable accepting a ProviderState and a ProgressCallback, called from a worker thread
+        :param callback: ProgressCallback receiving the progress of all providers (None to ignore progress).
+            The callback is only used from the calling thread.
+        :return: tuple of a list of tuples of ProviderState and result, in order of provider_states,
+            and a list of tuples of ProviderState and exception
+        """
+        if callback is not None:
+            callback.set_range(0, len(provider_states))
+            child_callbacks = [callback.get_child_progress(state_i, state_i + 1)
+                               for state_i in range(len(provider_states))]
+        else:
+            child_callbacks = [ProgressCallback() for _ in provider_states]
+
+        if len(provider_states) == 1:
+            # No need for a thread: run in the calling thread, which can use the callback directly.
+            outcomes = [self._run_operation(operation, provider_states[0], child_callbacks[0])]
+        else:
+            outcomes = self._run_threads(provider_states, operation, child_callbacks)
+
+        results = []
+        failures = []
+        for provider_state, (result, exception) in zip(provider_states, outcomes):
+            if exception is None:
+                results.append((provider_state, result))
+                continue
+            if isinstance(exception, ProviderConnectionError):
+                log.warning('Provider "{}" failed: {}'.format(provider_state.provider.get_name(), exception.get_msg()))
+            else:
+                log.warning('Provider "{}" failed'.format(provider_state.provider.get_name()),
+                            exc_info=(type(exception), exception, exception.__traceback__))
+            failures.append((provider_state, exception))
+        return results, failures
+
+    @staticmethod
+    def _run_operation(operation, provider_state, callback):
+        try:
+            return operation(provider_state, callback), None
+        except Exception as e:
+            return None, e
+
+    def _run_threads(self, provider_states, operation, child_callbacks):
+        relays = [_RelayProgressCallback(child_callback) for child_callback in child_callbacks]
+        outcomes = [None] * len(provider_states)
+
+        def run_provider(state_i):
+            outcomes[state_i] = self._run_operation(operation, provider_states[state_i], relays[state_i])
+
+        threads = []
+        for state_i, provider_state in enumerate(provider_states):
+            thread = threading.Thread(target=run_provider, args=(state_i, ),
+                                      name='provider-{}'.format(provider_state.provider.get_name()))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        deadline = None if self._timeout is None else self._now() + self._timeout
+        for thread in threads:
+            while thread.is_alive():
+                wait = self.POLL_INTERVAL
+                if deadline is not None:
+                    wait = min(wait, deadline - self._now())
+                    if wait <= 0:
+                        break
+                thread.join(wait)
+                for relay in relays:
+                    relay.forward()
+        for relay in relays:
+            relay.forward()
+
+        # Copy the outcomes: an abandoned thread may still store its outcome later.
+        outcomes = list(outcomes)
+        for state_i, outcome in enumerate(outcomes):
+            if outcome is None:
+                # Ask the abandoned operation to stop at its next check.
+                relays[state_i].cancel()
+                outcomes[state_i] = None, ProviderTimeoutError(self._timeout)
+        return outcomes
+
+    @staticmethod
+    def _now():
+        return time.monotonic()
+
+
 class ProvidersState(object):
+    # Larger than the retry deadline of the providers, so a retrying provider is not abandoned too early.
+    DEFAULT_TIMEOUT = 150.
+
     def __init__(self, callback=None):
         providers_cls = ProviderFactory.list()
         self._callback = ProvidersStateCallbackCollector()
         self._providerStates = list(ProviderState(provider_cls(), self._callback) for provider_cls in providers_cls)
+        self._fan_out = ProviderFanOut(timeout=self.DEFAULT_TIMEOUT)
         self.add_callback(callback)
 
     def add_callback(self, callback):
@@ -310,17 +479,39 @@ class ProvidersState(object):
                 return providerState
         return None
 
+    def get_timeout(self):
+        return self._fan_out.get_timeout()
+
+    def set_timeout(self, timeout):
+        """
+        Set the maximum time to wait for a provider to connect, login, logout or ping.
+        :param timeout: time in seconds (None to wait forever)
+        """
+        log.debug('set_timeout({})'.format(timeout))
+        self._fan_out.set_timeout(timeout)
+
+    def _fan_out_enabled(self, item, operation):
+        """
+        Run an operation on all enabled providers of item in parallel.
+        Exceptions that are no ProviderConnectionError are raised after all providers have finished.
+        :param item: item to select the providers, see get
+        :param operation: callable accepting a provider
+        :return: tuple of a list of tuples of ProviderState and result,
+            and a list of tuples of ProviderState and ProviderConnectionError
+        """
+        provider_states = [providerState for providerState in self._item_to_providers(item)
+                           if providerState.getEnabled()]
+        results, failures = self._fan_out.run(provider_states,
+                                              lambda providerState, callback: operation(providerState.provider))
+        for failed_state, exception in failures:
+            if not isinstance(exception, ProviderConnectionError):
+                raise exception
+        return results, failures
+
     def connect(self, item=None):
-        nb = 0
         self._callback.on_connect(ProviderStateCallback.Stage.Busy)
-        for providerState in self._item_to_providers(item):
-            if providerState.getEnabled():
-                try:
-                    providerState.provider.connect()
-                    nb += 1
-                except ProviderConnectionError:
-                    pass
-        if nb:
+        results, failures = self._fan_out_enabled(item, lambda provider: provider.connect())
+        if results:
             self._callback.on_connect(ProviderStateCallback.Stage.Finished)
 
     def disconnect(self, item=None):
@@ -341,27 +532,22 @@ class ProvidersState(object):
         return False
 
     def login(self, item=None):
-        nb = 0
         self._callback.on_login(ProviderStateCallback.Stage.Busy)
-        for providerState in self._item_to_providers(item):
-            if providerState.getEnabled():
-                try:
-                    providerState.provider.login()
-                    nb += 1
-                except ProviderConnectionError:
-                    pass
-        if nb:
+        results, failures = self._fan_out_enabled(item, lambda provider: provider.login())
+        if results:
             self._callback.on_login(ProviderStateCallback.Stage.Finished)
 
     def logout(self, item=None):
-        nb = 0
+        """
+        Logout all enabled providers of item in parallel.
+        :raise ProviderConnectionError: first failure, after all providers have logged out
+        """
         self._callback.on_logout(ProviderStateCallback.Stage.Busy)
-        for providerState in self._item_to_providers(item):
-            if providerState.getEnabled():
-                providerState.provider.logout()
-                nb += 1
-        if nb:
+        results, failures = self._fan_out_enabled(item, lambda provider: provider.logout())
+        if results:
             self._callback.on_logout(ProviderStateCallback.Stage.Finished)
+        if failures:
+            raise failures[0][1]
 
     def get_providers(self, item=None):
         for providerState in self._item_to_providers(item):
@@ -387,9 +573,37 @@ class ProvidersState(object):
         return False
 
     def ping(self, item=None):
-        for providerState in self._item_to_providers(item):
-            if providerState.getEnabled():
-                providerState.provider.ping()
+        """
+        Ping all enabled providers of item in parallel.
+        :raise ProviderConnectionError: first failure, after all providers have been pinged
+        """
+        results, failures = self._fan_out_enabled(item, lambda provider: provider.ping())
+        if failures:
+            raise failures[0][1]
+
+    def iter_write_subtitles(self, rsub_paths):
+        """
+        Download subtitles and write them to their target paths.
+        The subtitles are grouped by provider, so each provider can download them in batches.
+        Subtitles of providers that are not available are not downloaded: they are yielded without LocalSubtitleFile.
+        :param rsub_paths: iterable of tuples of RemoteSubtitleFile and target path
+        :return: generator of tuples of RemoteSubtitleFile and LocalSubtitleFile, yielded when written.
+            The LocalSubtitleFile is None when the provider of the subtitle is not available.
+        :raise ProviderConnectionError: when a download fails. The subtitles yielded before have been written.
+        """
+        providers_rsub_paths = OrderedDict()
+        for rsub, target_path in rsub_paths:
+            providers_rsub_paths.setdefault(rsub.get_provider(), []).append((rsub, target_path))
+        for provider_type, provider_rsub_paths in providers_rsub_paths.items():
+            provider_state = self.get(provider_type)
+            if provider_state is None:
+                log.warning('Provider "{}" not available: {} subtitles not downloaded'.format(
+                    provider_type.get_name(), len(provider_rsub_paths)))
+                for rsub, target_path in provider_rsub_paths:
+                    yield rsub, None
+                continue
+            for rsub, local_sub in provider_state.provider.iter_write_subtitles(provider_rsub_paths):
+                yield rsub, local_sub
 
     def query_text(self, text):
         query = SubtitlesTextQuery(text=text)
@@ -398,8 +612,12 @@ class ProvidersState(object):
 
 
 class BaseState(object):
+    # Searching many videos needs many calls: wait longer than for the other operations.
+    DEFAULT_SEARCH_TIMEOUT = 600.
+
     def __init__(self, callback=None):
         self._providersState = ProvidersState(callback)
+        self._search_fan_out = ProviderFanOut(timeout=self.DEFAULT_SEARCH_TIMEOUT)
 
         self._recursive = False
         self._video_paths = []
@@ -417,6 +635,11 @@ class BaseState(object):
 
         self._imdb_history = ImdbHistory()
 
+        self._extra_extensions = {
+            FileCategory.SUBTITLE: [],
+            FileCategory.VIDEO: [],
+        }
+
     @property
     def providers(self):
         return self._providersState
@@ -476,6 +699,21 @@ class BaseState(object):
 
         self._imdb_history = ImdbHistory.from_settings(settings)
 
+        hash_cache = get_default_file_hash_cache()
+        if hash_cache is not None:
+            hash_cache.set_max_entries(settings.get_int(StateConfigKey.HASH_CACHE_SIZE.value,
+                                                        FileHashCache.DEFAULT_MAX_ENTRIES))
+
+        subtitle_cache = get_default_subtitle_download_cache()
+        if subtitle_cache is not None:
+            subtitle_cache.set_max_size(settings.get_int(StateConfigKey.SUBTITLE_CACHE_SIZE.value,
+                                                         SubtitleDownloadCache.DEFAULT_MAX_SIZE))
+
+        self.set_extra_extensions(FileCategory.SUBTITLE,
+                                  settings.get_list(StateConfigKey.EXTRA_SUBTITLE_EXTENSIONS.value, []))
+        self.set_extra_extensions(FileCategory.VIDEO,
+                                  settings.get_list(StateConfigKey.EXTRA_VIDEO_EXTENSIONS.value, []))
+
     def save_settings(self, settings):
         self._providersState.save_settings(settings)
 
@@ -498,15 +736,58 @@ class BaseState(object):
 
         settings.set_language(StateConfigKey.INTERFACE_LANGUAGE.value, self.get_interface_language())
 
+        hash_cache = get_default_file_hash_cache()
+        if hash_cache is not None:
+            settings.set_int(StateConfigKey.HASH_CACHE_SIZE.value, hash_cache.get_max_entries())
+
+        subtitle_cache = get_default_subtitle_download_cache()
+        if subtitle_cache is not None:
+            settings.set_int(StateConfigKey.SUBTITLE_CACHE_SIZE.value, subtitle_cache.get_max_size())
+
+        settings.set_list(StateConfigKey.EXTRA_SUBTITLE_EXTENSIONS.value,
+                          self.get_extra_extensions(FileCategory.SUBTITLE))
+        settings.set_list(StateConfigKey.EXTRA_VIDEO_EXTENSIONS.value,
+                          self.get_extra_extensions(FileCategory.VIDEO))
+
         settings.write()
 
+    def get_search_timeout(self):
+        return self._search_fan_out.get_timeout()
+
+    def set_search_timeout(self, timeout):
+        """
+        Set the maximum time to wait for a provider to search videos.
+        :param timeout: time in seconds (None to wait forever)
+        """
+        log.debug('set_search_timeout({})'.format(timeout))
+        self._search_fan_out.set_timeout(timeout)
+
     def search_videos(self, videos, callback):
+        """
+        Search subtitles for videos on all enabled providers in parallel.
+        A failing provider does not affect the results of the other providers.
+        Every provider searches its own copies of the videos. Only the results of the providers finishing in time
+        are added to the videos: a provider abandoned after the timeout cannot modify them anymore.
+        :param videos: list of VideoFile
+        :param callback: ProgressCallback
+        :return: dictionary mapping provider to list of RemoteSubtitleFile
+        :raise ProviderConnectionError: first failure, when no provider succeeded
+        """
         providerStates = list(self._providersState.get_providers())
-        callback.set_range(0, len(providerStates))
+        state_videos = {providerState: [video.create_search_copy() for video in videos]
+                        for providerState in providerStates}
+        results, failures = self._search_fan_out.run(
+            providerStates,
+            lambda providerState, child_callback: providerState.provider.search_videos(
+                videos=state_videos[providerState], callback=child_callback),
+            callback=callback)
+        if failures and not results:
+            raise failures[0][1]
         prov_rsubs = {}
-        for provider_i, providerState in enumerate(providerStates):
-            download_callback = callback.get_child_progress(provider_i, provider_i+1)
-            prov_rsubs[providerState.provider] = providerState.provider.search_videos(videos=videos, callback=download_callback)
+        for providerState, rsubs in results:
+            for video, video_copy in zip(videos, state_videos[providerState]):
+                video.merge_search_copy(video_copy)
+            prov_rsubs[providerState.provider] = rsubs
         return prov_rsubs
 
     def get_recursive(self):
@@ -516,6 +797,23 @@ class BaseState(object):
         log.debug('set_recursive({})'.format(recursive))
         self._recursive = recursive
 
+    def get_extra_extensions(self, category):
+        return self._extra_extensions[category]
+
+    def set_extra_extensions(self, category, extensions):
+        """
+        Set the user configured extensions of a category, on top of the built-in extensions.
+        The extension classifier used while scanning is rebuilt.
+        :param category: FileCategory
+        :param extensions: list of extensions
+        """
+        log.debug('set_extra_extensions({}, {})'.format(category, extensions))
+        self._extra_extensions[category] = list(extensions)
+        classifier = ExtensionClassifier()
+        for extra_category, extra_extensions in self._extra_extensions.items():
+            classifier.add_extensions(extra_category, extra_extensions)
+        set_default_extension_classifier(classifier)
+
     def get_video_paths(self):
         if self._video_paths is None:
             return []
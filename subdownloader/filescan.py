@@ -1,16 +1,113 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
 
+from collections import namedtuple
+from enum import Enum
 import logging
 import os
 
 from pathlib import Path
-from subdownloader.subtitle2 import LocalSubtitleFile, SubtitleFileNetwork, SUBTITLES_EXT
+from subdownloader.subtitle2 import LocalSubtitleFile, SubtitleFileNetwork, SubtitleFilenameIndex, SUBTITLES_EXT
 from subdownloader.util import IllegalPathException
 from subdownloader.video2 import NotAVideoException, VideoFile, VIDEOS_EXT
 
 log = logging.getLogger('subdownloader.filescan')
 
+"""
+A file found while scanning: its Path and the result of its (only) stat call.
+"""
+ScanEntry = namedtuple('ScanEntry', ('path', 'stat'))
+
+
+class FileCategory(Enum):
+    SUBTITLE = 'subtitle'
+    VIDEO = 'video'
+
+
+class ExtensionClassifier(object):
+    """
+    Map file extensions to a FileCategory using a single dict lookup.
+    Extensions are stored lower case and without leading dot.
+    """
+    def __init__(self, subtitle_extensions=None, video_extensions=None):
+        """
+        Create a new ExtensionClassifier.
+        :param subtitle_extensions: iterable of subtitle extensions (default: SUBTITLES_EXT)
+        :param video_extensions: iterable of video extensions (default: VIDEOS_EXT)
+        """
+        self._extensions = {
+            FileCategory.SUBTITLE: frozenset(),
+            FileCategory.VIDEO: frozenset(),
+        }
+        self._lookup = {}
+        if subtitle_extensions is None:
+            subtitle_extensions = SUBTITLES_EXT
+        if video_extensions is None:
+            video_extensions = VIDEOS_EXT
+        self.add_extensions(FileCategory.SUBTITLE, subtitle_extensions)
+        self.add_extensions(FileCategory.VIDEO, video_extensions)
+
+    @staticmethod
+    def _normalize_extension(extension):
+        return extension.strip().lstrip('.').lower()
+
+    def add_extensions(self, category, extensions):
+        """
+        Add extensions to a category. An extension already known to another category is moved to this category.
+        :param category: FileCategory
+        :param extensions: iterable of extensions (e.g. 'avi' or '.avi')
+        """
+        new_extensions = frozenset(self._normalize_extension(extension) for extension in extensions) - {''}
+        for other_category in self._extensions:
+            if other_category != category:
+                self._extensions[other_category] = self._extensions[other_category] - new_extensions
+        self._extensions[category] = self._extensions[category] | new_extensions
+        self._lookup.update((extension, category) for extension in new_extensions)
+
+    def get_extensions(self, category):
+        """
+        Get the extensions of a category.
+        :param category: FileCategory
+        :return: frozenset of extensions
+        """
+        return self._extensions[category]
+
+    def classify_extension(self, extension):
+        """
+        Classify a lower case extension without leading dot.
+        :param extension: extension as string
+        :return: FileCategory or None
+        """
+        return self._lookup.get(extension)
+
+    def classify(self, filename):
+        """
+        Classify a filename by its extension.
+        :param filename: file name as string
+        :return: FileCategory or None
+        """
+        return self._lookup.get(os.path.splitext(filename)[1][1:].lower())
+
+
+DEFAULT_EXTENSION_CLASSIFIER = ExtensionClassifier()
+
+
+def get_default_extension_classifier():
+    """
+    Get the ExtensionClassifier used while scanning.
+    :return: ExtensionClassifier
+    """
+    return DEFAULT_EXTENSION_CLASSIFIER
+
+
+def set_default_extension_classifier(classifier):
+    """
+    Set the ExtensionClassifier used while scanning.
+    :param classifier: ExtensionClassifier
+    """
+    global DEFAULT_EXTENSION_CLASSIFIER
+    DEFAULT_EXTENSION_CLASSIFIER = classifier
+
 
 # FIXME: convert to class structure
 
@@ -27,6 +124,21 @@ def scan_videopaths(videopaths, callback, recursive=False):
     return all_videos, all_subtitles
 
 
+def iter_scan_videopaths(videopaths, recursive=False):
+    """
+    Scan the videopaths for video files, directory by directory.
+    Unlike scan_videopaths, the videos of a directory are yielded as soon as that directory has been scanned.
+    :param videopaths: list of Path objects
+    :param recursive: True if the scanning should happen recursive
+    :return: generator of VideoFile objects (with matched subtitles)
+    """
+    for videopath in videopaths:
+        for _, (subs_path, vids_path) in __iter_videopath(videopath, recursive=recursive):
+            subtitles = [LocalSubtitleFile(filepath=sub.path, stat=sub.stat) for sub in subs_path]
+            for video in __merge_subvideo(subtitles, vids_path):
+                yield video
+
+
 def scan_videopath(videopath, callback, recursive=False):
     """
     Scan the videopath string for video files.
@@ -35,6 +147,17 @@ def scan_videopath(videopath, callback, recursive=False):
     :param recursive: True if the scanning should happen recursive
     :return: tuple with list of videos and list of subtitles (videos have matched subtitles)
     """
+    path_subvideos = dict(__iter_videopath(videopath, recursive=recursive))
+    return merge_path_subvideo(path_subvideos, callback)
+
+
+def __iter_videopath(videopath, recursive=False):
+    """
+    Scan the videopath for videos and subtitles, directory by directory.
+    :param videopath: Path object
+    :param recursive: True if the scanning should happen recursive
+    :return: generator of tuples with a directory and a list of lists of subtitles and videos
+    """
     log.debug('scan_videopath(videopath="{videopath}", recursive={recursive})'.format(
         videopath=videopath, recursive=recursive))
     if not videopath.exists():
@@ -42,49 +165,82 @@ def scan_videopath(videopath, callback, recursive=False):
         raise IllegalPathException(path=videopath)
     if videopath.is_dir():
         log.debug('"{videopath}" is a directory'.format(videopath=videopath))
-        return __scan_folder(videopath, callback=callback, recursive=recursive)
+        yield from __iter_folder(videopath, recursive=recursive)
     elif videopath.is_file():
         log.debug('"{videopath}" is a file'.format(videopath=videopath))
         videopath_dir = videopath.parent
-        [all_subs, _] = filter_files_extensions(videopath_dir.iterdir(), [SUBTITLES_EXT, VIDEOS_EXT])
-        [_, video] = filter_files_extensions([videopath], [SUBTITLES_EXT, VIDEOS_EXT])
-        sub_videos = [all_subs, video]
-        path_subvideos = {videopath_dir: sub_videos}
-        return merge_path_subvideo(path_subvideos, callback)
+        all_subs, _, _ = __scan_directory(videopath_dir)
+        if DEFAULT_EXTENSION_CLASSIFIER.classify(videopath.name) == FileCategory.VIDEO:
+            video = [ScanEntry(videopath, videopath.stat())]
+        else:
+            video = []
+        yield videopath_dir, [all_subs, video]
     else:
         log.debug('"{videopath}" is of unknown type'.format(videopath=videopath))
-        return [], []
 
 
-def __scan_folder(folder_path, callback, recursive=False):
+def __iter_folder(folder_path, recursive=False):
     """
     Scan a folder for videos and subtitles
     :param folder_path: String of a directory
-    :param callback: Instance of ProgressCallback
     :param recursive: True if the scanning should happen recursive
-    :return: tuple with list of videos and list of subtitles (videos have matched subtitles)
+    :return: generator of tuples with a directory and a list of lists of subtitles and videos
     """
-    log.debug('__scan_folder(folder_path="{folder_path}", recursive={recursive})'.format(folder_path=folder_path,
+    log.debug('__iter_folder(folder_path="{folder_path}", recursive={recursive})'.format(folder_path=folder_path,
                                                                                          recursive=recursive))
-    path_subvideos = {}
-    # FIXME: a folder named 'movie.avi' is also considered a movie. Fix this.
-    if recursive:
-        for dir_path, _, files in os.walk(str(folder_path)):
-            log.debug('walking current directory:"{}"'.format(dir_path))
-            path_files = [Path(dir_path) / file for file in files]
-            sub_videos = filter_files_extensions(path_files, [SUBTITLES_EXT, VIDEOS_EXT])
-            path_subvideos[dir_path] = sub_videos
-    else:
-        files = [folder_path / f for f in folder_path.iterdir() if f.is_file()]  # filter(lambda f: (folder_path / f).is_file(), folder_path.iterdir())
-        sub_videos = filter_files_extensions(files, [SUBTITLES_EXT, VIDEOS_EXT])
-        path_subvideos[folder_path] = sub_videos
-    return merge_path_subvideo(path_subvideos, callback)
+    dir_paths = [str(folder_path)]
+    while dir_paths:
+        dir_path = dir_paths.pop()
+        log.debug('walking current directory:"{}"'.format(dir_path))
+        try:
+            subs, vids, sub_dir_paths = __scan_directory(dir_path)
+        except OSError:
+            if not recursive:
+                raise
+            # Like os.walk, ignore directories that cannot be read.
+            log.debug('Cannot scan directory "{}"'.format(dir_path), exc_info=True)
+            continue
+        yield dir_path, [subs, vids]
+        if recursive:
+            dir_paths.extend(reversed(sub_dir_paths))
+
+
+def __scan_directory(dir_path):
+    """
+    List the subtitles, videos and sub-directories of a directory.
+    Only the subtitles and the videos are stat'ed, at most once.
+    :param dir_path: directory as string or Path
+    :return: tuple with list of subtitle ScanEntry's, list of video ScanEntry's and list of sub-directories
+    """
+    subs = []
+    vids = []
+    sub_dir_paths = []
+    category_entries = {
+        FileCategory.SUBTITLE: subs,
+        FileCategory.VIDEO: vids,
+    }
+    classify = DEFAULT_EXTENSION_CLASSIFIER.classify
+    for entry in os.scandir(str(dir_path)):
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                sub_dir_paths.append(entry.path)
+                continue
+            category = classify(entry.name)
+            if category is None:
+                continue
+            entries = category_entries[category]
+            if not entry.is_file():
+                continue
+            entries.append(ScanEntry(Path(entry.path), entry.stat()))
+        except OSError:
+            log.debug('Cannot stat "{}"'.format(entry.path), exc_info=True)
+    return subs, vids, sub_dir_paths
 
 
 def merge_path_subvideo(path_subvideos, callback):
     """
     Merge subtitles into videos.
-    :param path_subvideos: a dict with paths as key and a list of lists of videos and subtitles
+    :param path_subvideos: a dict with paths as key and a list of lists of subtitle and video ScanEntry's
     :param callback: Instance of ProgressCallback
     :return: tuple with list of videos and list of subtitles (videos have matched subtitles)
     """
@@ -101,26 +257,37 @@ def merge_path_subvideo(path_subvideos, callback):
     callback.update(vid_i)
     for path, subvideos in path_subvideos.items():
         [subs_path, vids_path] = subvideos
-        subtitles = [LocalSubtitleFile(filepath=sub_path) for sub_path in subs_path]
+        subtitles = [LocalSubtitleFile(filepath=sub.path, stat=sub.stat) for sub in subs_path]
         all_subtitles.extend(subtitles)
-        for vid_path in vids_path:
-            try:
-                video = VideoFile(vid_path)
-            except NotAVideoException:
-                continue
+        for video in __merge_subvideo(subtitles, vids_path):
             all_videos.append(video)
 
-            for subtitle in subtitles:
-                if subtitle.matches_video_filename(video):
-                    video.add_subtitle(subtitle)
-            video.get_subtitles().add_candidates(subtitles)
-
             vid_i += 1
             callback.update(vid_i)
     callback.finish(True)
     return all_videos, all_subtitles
 
 
+def __merge_subvideo(subtitles, vids_path):
+    """
+    Create the videos of one directory and add the matching subtitles.
+    :param subtitles: list of LocalSubtitleFile objects of the directory
+    :param vids_path: list of ScanEntry's of videos of the directory
+    :return: generator of VideoFile objects
+    """
+    index = SubtitleFilenameIndex(subtitles)
+    for vid in vids_path:
+        try:
+            video = VideoFile(vid.path, stat=vid.stat)
+        except NotAVideoException:
+            continue
+
+        for subtitle in index.find_matches(video):
+            video.add_subtitle(subtitle)
+        video.get_subtitles().add_candidates(subtitles)
+        yield video
+
+
 def filter_files_extensions(files, extension_lists):
     """
     Put the files in buckets according to extension_lists
@@ -129,12 +296,17 @@ def filter_files_extensions(files, extension_lists):
     :param extension_lists: A list of list of extensions
     :return: The files filtered and sorted according to extension_lists
     """
-    log.debug('filter_files_extensions: files="{}"'.format(files))
+    debug = log.isEnabledFor(logging.DEBUG)
+    if debug:
+        log.debug('filter_files_extensions: files="{}"'.format(files))
+    ext_buckets = {}
+    for ext_i, ext_list in enumerate(extension_lists):
+        for ext in ext_list:
+            ext_buckets.setdefault(ext, []).append(ext_i)
     result = [[] for _ in extension_lists]
     for file in files:
-        ext = file.suffix[1:].lower()
-        for ext_i, ext_list in enumerate(extension_lists):
-            if ext in ext_list:
-                result[ext_i].append(file)
-    log.debug('filter_files_extensions result:{}'.format(result))
+        for ext_i in ext_buckets.get(file.suffix[1:].lower(), ()):
+            result[ext_i].append(file)
+    if debug:
+        log.debug('filter_files_extensions result:{}'.format(result))
     return result
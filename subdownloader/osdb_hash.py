@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+
+"""
+Kernels to calculate the OSDB (OpenSubtitleDataBase) hash of a file.
+The hash is the file size plus the sum of the first and last 64kiB of the file,
+interpreted as little endian unsigned 64-bit integers, modulo 2**64.
+"""
+
+from array import array
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+
+log = logging.getLogger('subdownloader.osdb_hash')
+
+BLOCK_SIZE = 64 << 10  # 64kiB
+WORD_SIZE = 8
+HASH_MASK = (1 << 64) - 1
+
+_thread_data = threading.local()
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NUMPY_AVAILABLE = numpy is not None
+
+
+def _block_size(file_size):
+    """
+    Return the number of bytes of the head and tail blocks of a file (a multiple of the word size).
+    :param file_size: size of the file
+    :return: block size as integer
+    """
+    return min(file_size, BLOCK_SIZE) & ~(WORD_SIZE - 1)
+
+
+def _get_buffer():
+    """
+    Get the preallocated buffer of the current thread.
+    :return: bytearray of BLOCK_SIZE bytes
+    """
+    buffer = getattr(_thread_data, 'buffer', None)
+    if buffer is None:
+        buffer = bytearray(BLOCK_SIZE)
+        _thread_data.buffer = buffer
+    return buffer
+
+
+def _sum_words_numpy(data):
+    return int(numpy.frombuffer(data, dtype='<u8').sum(dtype=numpy.uint64))
+
+
+def _sum_words_array(data):
+    if sys.byteorder == 'little' and array('Q').itemsize == WORD_SIZE:
+        # Zero-copy view on the data
+        with memoryview(data) as view, view.cast('B') as bytes_view, bytes_view.cast('Q') as words:
+            return sum(words)
+    words = array('Q')
+    words.frombytes(data)
+    if sys.byteorder != 'little':
+        words.byteswap()
+    return sum(words)
+
+
+"""
+Function used to sum the words of a block. Prefer NumPy if available.
+"""
+sum_words = _sum_words_numpy if NUMPY_AVAILABLE else _sum_words_array
+
+
+def _format_hash(hash_int):
+    return '{:016x}'.format(hash_int & HASH_MASK)
+
+
+def osdb_hash_struct(f, file_size):
+    """
+    Calculate the OSDB hash by unpacking the blocks with struct.
+    This is the reference implementation.
+    :param f: file object opened in binary mode
+    :param file_size: size of the file
+    :return: hash as string
+    """
+    block_size = _block_size(file_size)
+    fmt = '<{}Q'.format(block_size // WORD_SIZE)
+
+    hash_int = file_size
+
+    buffer = f.read(block_size)
+    hash_int += sum(struct.unpack(fmt, buffer))
+
+    f.seek(-block_size, os.SEEK_END)
+    buffer = f.read(block_size)
+    hash_int += sum(struct.unpack(fmt, buffer))
+
+    return _format_hash(hash_int)
+
+
+def osdb_hash_readinto(f, file_size):
+    """
+    Calculate the OSDB hash by reading the blocks into a preallocated per-thread buffer.
+    :param f: file object opened in binary mode
+    :param file_size: size of the file
+    :return: hash as string
+    """
+    block_size = _block_size(file_size)
+
+    hash_int = file_size
+
+    with memoryview(_get_buffer()) as buffer_view, buffer_view[:block_size] as view:
+        if f.readinto(view) != block_size:
+            raise IOError('Short read at start of file')
+        hash_int += sum_words(view)
+
+        f.seek(-block_size, os.SEEK_END)
+        if f.readinto(view) != block_size:
+            raise IOError('Short read at end of file')
+        hash_int += sum_words(view)
+
+    return _format_hash(hash_int)
+
+
+def osdb_hash_mmap(f, file_size):
+    """
+    Calculate the OSDB hash by memory mapping the file.
+    This avoids copying the data, but page faults on network file systems cannot be interrupted.
+    :param f: file object opened in binary mode
+    :param file_size: size of the file
+    :return: hash as string
+    """
+    block_size = _block_size(file_size)
+    if block_size == 0:
+        return _format_hash(file_size)
+
+    hash_int = file_size
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with memoryview(mapped) as view:
+            with view[:block_size] as head:
+                hash_int += sum_words(head)
+            with view[file_size - block_size:file_size] as tail:
+                hash_int += sum_words(tail)
+
+    return _format_hash(hash_int)
+
+
+"""
+Kernel used to calculate the OSDB hash of a VideoFile.
+"""
+osdb_hash = osdb_hash_readinto
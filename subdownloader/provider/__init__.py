@@ -1,15 +1,273 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
 
+from collections import deque, namedtuple
+import datetime
+import logging
+import threading
+import time
+
+from subdownloader.cache import get_default_download_count_cache
+from subdownloader.provider.provider import ProviderQuotaExceededError
+
+log = logging.getLogger('subdownloader.provider')
+
 
 def window_iterator(data, width):
     """
     Instead of iterating element by element, get a number of elements at each iteration step.
     :param data: data to iterate on
-    :param width: maximum number of elements to get in each iteration step
+    :param width: maximum number of elements to get in each iteration step,
+        or a callable returning the width before each step
     :return:
     """
     start = 0
     while start < len(data):
-        yield data[start:start+width]
-        start += width
+        step = width() if callable(width) else width
+        yield data[start:start+step]
+        start += step
+
+
+WindowStatistic = namedtuple('WindowStatistic', ('size', 'latency', 'success'))
+
+
+class AdaptiveWindow(object):
+    """
+    Number of items sent in one batched request, adapting to the response times of the server.
+    The size grows by one after every full window answered within the target latency,
+    decreases by one after a slow answer and is halved after a failure or timeout.
+    Pass get_size as width to window_iterator to iterate on adaptive windows.
+    """
+    STATISTICS_LENGTH = 64
+
+    def __init__(self, name, initial, maximum, minimum=1, target_latency=2.):
+        """
+        Create a new AdaptiveWindow.
+        :param name: name of the request, used as key when persisting the size
+        :param initial: initial size
+        :param maximum: maximum size, as accepted by the server
+        :param minimum: minimum size
+        :param target_latency: maximum time (in seconds) of a request that lets the window grow
+        """
+        self._name = name
+        self._minimum = minimum
+        self._maximum = maximum
+        self._target_latency = target_latency
+        self._size = self._clamp(initial)
+        self._statistics = deque(maxlen=self.STATISTICS_LENGTH)
+        self._lock = threading.Lock()
+
+    def _clamp(self, size):
+        return max(self._minimum, min(self._maximum, size))
+
+    def get_name(self):
+        return self._name
+
+    def get_size(self):
+        return self._size
+
+    def set_size(self, size):
+        self._size = self._clamp(size)
+
+    def record_success(self, size, latency):
+        """
+        Record a successful request.
+        :param size: number of items of the request
+        :param latency: duration of the request in seconds
+        """
+        with self._lock:
+            if latency > self._target_latency:
+                self._size = self._clamp(min(self._size, size) - 1)
+            elif size >= self._size:
+                self._size = self._clamp(self._size + 1)
+            self._record(WindowStatistic(size=size, latency=latency, success=True))
+
+    def record_failure(self, size, latency):
+        """
+        Record a failed or timed out request.
+        :param size: number of items of the request
+        :param latency: duration of the request in seconds
+        """
+        with self._lock:
+            self._size = self._clamp(min(self._size, size) // 2)
+            self._record(WindowStatistic(size=size, latency=latency, success=False))
+
+    def _record(self, statistic):
+        self._statistics.append(statistic)
+        log.debug('window {name}: size={s.size} latency={s.latency:.3f}s success={s.success} -> size={size}'.format(
+            name=self._name, s=statistic, size=self._size))
+
+    def get_statistics(self):
+        """
+        Get the most recent requests.
+        :return: list of WindowStatistic, oldest first
+        """
+        with self._lock:
+            return list(self._statistics)
+
+    def __repr__(self):
+        return '<AdaptiveWindow:name={},size={}>'.format(self._name, self._size)
+
+
+class AttemptTimer(object):
+    """
+    Duration of the last attempt of a request, to pass to an AdaptiveWindow.
+    Waiting for the rate limiter and the backoff between retries are excluded,
+    so the window only follows the response times of the server.
+    """
+    def __init__(self):
+        self._latency = 0.
+
+    def get_latency(self):
+        return self._latency
+
+    def record(self, latency):
+        self._latency = latency
+
+    def wrap(self, call):
+        """
+        Wrap a callable, so every call of it is timed.
+        :param call: callable doing one attempt of the request
+        :return: callable with the same arguments and result
+        """
+        def timed_call(*args, **kwargs):
+            time_start = time.perf_counter()
+            try:
+                return call(*args, **kwargs)
+            finally:
+                self._latency = time.perf_counter() - time_start
+        return timed_call
+
+
+class RateLimiter(object):
+    """
+    Token bucket limiting the number of requests per second.
+    The bucket holds at most burst tokens and is refilled at rate tokens per second.
+    Every request takes one token. Thread-safe.
+    """
+    def __init__(self, rate, burst=1):
+        """
+        Create a new RateLimiter.
+        :param rate: number of requests per second, None or 0 for no limit
+        :param burst: maximum number of requests that can be done without waiting
+        """
+        self._rate = rate
+        self._burst = max(1, burst)
+        self._tokens = float(self._burst)
+        self._time_last = self._now()
+        self._lock = threading.Lock()
+
+    def get_rate(self):
+        return self._rate
+
+    def acquire(self):
+        """
+        Take one token from the bucket, sleep until one is available.
+        :return: time slept in seconds
+        """
+        wait = self.reserve()
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def reserve(self):
+        """
+        Take one token from the bucket without sleeping.
+        The caller must wait the returned time before doing the request, e.g. with asyncio.sleep.
+        :return: time to wait in seconds
+        """
+        if not self._rate:
+            return 0.
+        with self._lock:
+            now = self._now()
+            self._tokens = min(self._burst, self._tokens + (now - self._time_last) * self._rate)
+            self._time_last = now
+            self._tokens -= 1.
+            return -self._tokens / self._rate if self._tokens < 0 else 0.
+
+    @staticmethod
+    def _now():
+        return time.monotonic()
+
+    @staticmethod
+    def _sleep(duration):
+        time.sleep(duration)
+
+
+class DownloadQuota(object):
+    """
+    Number of subtitles a provider allows to download per day, counted locally.
+    The count is stored in the default download count cache (if available), so it is shared between runs.
+    Days start at midnight UTC. Thread-safe.
+    """
+    def __init__(self, provider, limit):
+        """
+        Create a new DownloadQuota.
+        :param provider: name of the provider
+        :param limit: maximum number of downloads per day, None or 0 for no limit
+        """
+        self._provider = provider
+        self._limit = limit
+        self._day = None
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def get_limit(self):
+        return self._limit
+
+    def _get_count(self, day):
+        cache = get_default_download_count_cache()
+        if cache is not None:
+            return cache.get_download_count(self._provider, day)
+        if self._day != day:
+            return 0
+        return self._count
+
+    def get_count(self):
+        """
+        Get the number of downloads of today.
+        :return: number of downloads
+        """
+        with self._lock:
+            return self._get_count(self._today())
+
+    def get_remaining(self):
+        """
+        Get the number of downloads left today.
+        :return: number of downloads, None if there is no limit
+        """
+        if not self._limit:
+            return None
+        return max(0, self._limit - self.get_count())
+
+    def check(self, count=1):
+        """
+        Check whether a number of subtitles can be downloaded, before downloading them.
+        :param count: number of subtitles
+        :raise ProviderQuotaExceededError: when the downloads would exceed the limit
+        """
+        remaining = self.get_remaining()
+        if remaining is not None and count > remaining:
+            log.warning('Download quota of {} exceeded: {} downloads left, {} requested'.format(
+                self._provider, remaining, count))
+            raise ProviderQuotaExceededError(self._limit)
+
+    def add(self, count=1):
+        """
+        Count downloaded subtitles.
+        :param count: number of subtitles
+        """
+        with self._lock:
+            day = self._today()
+            cache = get_default_download_count_cache()
+            if cache is not None:
+                total = cache.add_download_count(self._provider, day, count)
+            else:
+                self._count = self._get_count(day) + count
+                self._day = day
+                total = self._count
+        log.debug('{} downloads from {} today (limit={})'.format(total, self._provider, self._limit))
+
+    @staticmethod
+    def _today():
+        return datetime.datetime.utcnow().date().isoformat()
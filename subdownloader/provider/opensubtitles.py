@@ -1,31 +1,45 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
 
+import asyncio
 import base64
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 import datetime
+import hashlib
 from http.client import CannotSendRequest
 import io
 import logging
 import re
+import shutil
 from socket import error as SocketError
 import string
+import threading
 import time
+import weakref
 from urllib.error import HTTPError
 from urllib.parse import quote
-from urllib.request import urlopen
 from xmlrpc.client import ProtocolError, ServerProxy
+from xml.etree import ElementTree
 from xml.parsers.expat import ExpatError
 import zlib
 
+from subdownloader.cache import get_default_http_response_cache, get_default_search_result_cache, \
+    get_default_subtitle_download_cache
+from subdownloader.callback import ProgressCallback
 from subdownloader.languages.language import Language, NotALanguageException, UnknownLanguage
 from subdownloader.identification import ImdbIdentity, ProviderIdentities, SeriesIdentity, VideoIdentity
 from subdownloader.movie import RemoteMovie
 from subdownloader.provider.imdb import ImdbMovieMatch
-from subdownloader.provider import window_iterator
-from subdownloader.provider.provider import ProviderConnectionError, ProviderNotConnectedError, \
-    ProviderSettings, ProviderSettingsType, SubtitleProvider, SubtitleTextQuery, UploadResult
-from subdownloader.subtitle2 import LocalSubtitleFile, RemoteSubtitleFile
-from subdownloader.util import unzip_bytes, unzip_stream, write_stream
+from subdownloader.provider import AdaptiveWindow, AttemptTimer, DownloadQuota, RateLimiter, window_iterator
+from subdownloader.provider.provider import AsyncSubtitleProvider, AsyncSubtitleTextQuery, ProviderConnectionError, \
+    ProviderNotConnectedError, ProviderSettings, ProviderSettingsType, SubtitleProvider, SubtitleTextQuery, \
+    UploadResult
+from subdownloader.provider.retry import CircuitBreaker, CircuitOpenError, is_retryable_http_code, \
+    RetryableError, RetryPolicy, urlopen_retry
+from subdownloader.provider.transport import AsyncXmlRpcClient, create_transport, fetch_url
+from subdownloader.subtitle2 import hash_subtitles, LocalSubtitleFile, RemoteSubtitleFile
+from subdownloader.util import iter_unzip_base64, unzip_bytes, unzip_stream, write_stream
 
 
 log = logging.getLogger('subdownloader.provider.opensubtitles')
@@ -75,16 +89,38 @@ class OpenSubtitlesProviderConnectionError(ProviderConnectionError):
 
 class OpenSubtitles(SubtitleProvider):
     URL = 'http://api.opensubtitles.org/xml-rpc'
+    CONNECT_TIMEOUT = 10.
+    READ_TIMEOUT = 60.
 
     def __init__(self, settings=None):
         SubtitleProvider.__init__(self)
         self._xmlrpc = None
         self._token = None
+        # Time of the last successful call: the server ends a session after SESSION_TTL seconds of inactivity.
         self._last_time = None
+        self._keep_alive_stop = None
+        # A ServerProxy uses one connection: serialize the queries of multiple threads.
+        self._xmlrpc_lock = threading.RLock()
 
         if settings is None:
             settings = OpenSubtitlesSettings()
         self._settings = settings
+        self._rate_limiter = self._create_rate_limiter(settings)
+        self._download_quota = DownloadQuota(self.get_name(), settings.get_download_quota())
+        self._search_window = AdaptiveWindow('search', initial=5, maximum=self.SEARCH_WINDOW_MAX,
+                                             target_latency=self.SEARCH_TARGET_LATENCY)
+        self._download_window = AdaptiveWindow('download', initial=20, maximum=self.DOWNLOAD_WINDOW_MAX,
+                                               target_latency=self.DOWNLOAD_TARGET_LATENCY)
+        self._retry_policy = RetryPolicy()
+        # The XML-RPC api and the website are different servers.
+        self._circuit_breaker = CircuitBreaker()
+        self._http_circuit_breaker = CircuitBreaker()
+
+    def get_retry_policy(self):
+        return self._retry_policy
+
+    def set_retry_policy(self, retry_policy):
+        self._retry_policy = retry_policy
 
     def get_settings(self):
         return self._settings
@@ -93,20 +129,37 @@ class OpenSubtitles(SubtitleProvider):
         if self.connected():
             raise RuntimeError('Cannot set settings while connected')  # FIXME: change error
         self._settings = settings
+        self._rate_limiter = self._create_rate_limiter(settings)
+        self._download_quota = DownloadQuota(self.get_name(), settings.get_download_quota())
+
+    @staticmethod
+    def _create_rate_limiter(settings):
+        rate = settings.get_request_rate()
+        # The server counts the requests of a time window: allow short bursts.
+        return RateLimiter(rate, burst=max(1, int(rate)))
+
+    def get_download_quota(self):
+        return self._download_quota
 
     def connect(self):
         log.debug('connect()')
         if self.connected():
             return
-        self._xmlrpc = ServerProxy(self.URL, allow_none=False)
-        self._last_time = time.time()
+        self._xmlrpc = self._create_server_proxy()
+
+    def _create_server_proxy(self):
+        # Requests are not gzip encoded: the only large requests are uploads, whose content is compressed already.
+        transport = create_transport(self.URL, connect_timeout=self.CONNECT_TIMEOUT, read_timeout=self.READ_TIMEOUT)
+        return ServerProxy(self.URL, transport=transport, allow_none=False)
 
     def disconnect(self):
         log.debug('disconnect()')
         if self.logged_in():
             self.logout()
         if self.connected():
-            self._xmlrpc = None
+            with self._xmlrpc_lock:
+                self._xmlrpc('close')()
+                self._xmlrpc = None
 
     def connected(self):
         return self._xmlrpc is not None
@@ -122,17 +175,19 @@ class OpenSubtitles(SubtitleProvider):
             # FIXME: 'en' language ok??? or '' as in the original
             return self._xmlrpc.LogIn(str(self._settings.username), str(self._settings.password),
                                       'en', str(self._settings.get_user_agent()))
-        result = self._safe_exec(login_query, None)
+        result = self._safe_exec(login_query, None, relogin=False)
         self.check_result(result)
         self._token = result['token']
+        self._start_keep_alive()
 
     def logout(self):
         log.debug('logout()')
+        self._stop_keep_alive()
         if self.logged_in():
             def logout_query():
                 return self._xmlrpc.LogOut(self._token)
             # Do no check result of this call. Assume connection closed.
-            self._safe_exec(logout_query, None)
+            self._safe_exec(logout_query, None, relogin=False)
         self._token = None
 
     def logged_in(self):
@@ -148,15 +203,89 @@ class OpenSubtitles(SubtitleProvider):
         if logged_in:
             self.login()
 
-    _TIMEOUT_MS = 60000
+    SESSION_TTL = 15 * 60
+    KEEP_ALIVE_IDLE = 10 * 60
+    KEEP_ALIVE_CHECK_INTERVAL = 30.
+    AUTH_ERROR_CODES = (401, 406, )
 
     def _ensure_connection(self):
-        now = time.time()
-        if now - time.time() > self._TIMEOUT_MS:
-            self.reestablish()
-            self._last_time = now
+        if self._token is None or self._last_time is None:
+            return
+        idle = self._now() - self._last_time
+        if idle > self.SESSION_TTL:
+            log.info('Session idle for {:.0f} seconds: expired'.format(idle))
+            self._relogin(self._token)
+
+    def _relogin(self, expired_token):
+        """
+        Log in again after the session of a token has ended.
+        :param expired_token: token of the ended session
+        """
+        with self._xmlrpc_lock:
+            if self._token != expired_token:
+                # Another thread has logged in already.
+                return
+            log.info('Logging in again')
+            self._stop_keep_alive()
+            self._token = None
+            self.login()
+
+    def _touch_session(self):
+        self._last_time = self._now()
+
+    def _start_keep_alive(self):
+        """
+        Start a thread that pings the server before the session expires while no other calls are done.
+        """
+        self._stop_keep_alive()
+        self._keep_alive_stop = threading.Event()
+        thread = threading.Thread(target=self._run_keep_alive, args=(weakref.ref(self), self._keep_alive_stop, ),
+                                  name='opensubtitles-keep-alive')
+        thread.daemon = True
+        thread.start()
+
+    def _stop_keep_alive(self):
+        if self._keep_alive_stop is not None:
+            self._keep_alive_stop.set()
+            self._keep_alive_stop = None
+
+    @staticmethod
+    def _run_keep_alive(provider_ref, stop):
+        # Only keep a weak reference, so the provider can be garbage collected.
+        while True:
+            provider = provider_ref()
+            if provider is None:
+                return
+            interval = provider.KEEP_ALIVE_CHECK_INTERVAL
+            del provider
+            if stop.wait(interval):
+                return
+            provider = provider_ref()
+            if provider is None or stop.is_set() or not provider.logged_in():
+                return
+            if provider._now() - provider._last_time >= provider.KEEP_ALIVE_IDLE:
+                log.debug('Session idle: keep alive')
+                try:
+                    provider.ping()
+                except ProviderConnectionError:
+                    log.warning('Keep alive failed', exc_info=True)
+            del provider
+
+    @staticmethod
+    def _now():
+        return time.monotonic()
 
     SEARCH_LIMIT = 500
+    SEARCH_WINDOW_MAX = 20
+    SEARCH_TARGET_LATENCY = 3.
+    DOWNLOAD_WINDOW_MAX = 20
+    DOWNLOAD_TARGET_LATENCY = 5.
+
+    def get_adaptive_windows(self):
+        return [self._search_window, self._download_window]
+
+    def create_async_provider(self, executor=None):
+        return AsyncOpenSubtitles(self, executor=executor)
 
     def search_videos(self, videos, callback, languages=None):
         log.debug('search_videos(#videos={})'.format(len(videos)))
@@ -165,128 +294,513 @@ class OpenSubtitles(SubtitleProvider):
 
         lang_str = self._languages_to_str(languages)
 
-        window_size = 5
-        callback.set_range(0, (len(videos) + (window_size - 1)) // window_size)
-
         remote_subtitles = []
-        for window_i, video_window in enumerate(window_iterator(videos, window_size)):
-            callback.update(window_i)
-            if callback.canceled():
-                break
+        search_cache = get_default_search_result_cache()
+        if search_cache is not None:
+            videos = self._search_videos_cached(videos, lang_str, search_cache, remote_subtitles)
 
-            queries = []
-            hash_video = {}
-            for video in video_window:
-                query = {
-                    'sublanguageid': lang_str,
-                    'moviehash': video.get_osdb_hash(),
-                    'moviebytesize': str(video.get_size()),
-                }
-                if video.get_osdb_hash() is None:
-                    log.debug('osdb hash of "{}" is empty -> skip'.format(video.get_filepath()))
-                    self._signal_connection_failed()  # FIXME: other name + general signaling
-                    continue
-                queries.append(query)
-                hash_video[video.get_osdb_hash()] = video
+        callback.set_range(0, len(videos))
 
-            def run_query():
-                return self._xmlrpc.SearchSubtitles(self._token, queries, {'limit': self.SEARCH_LIMIT})
-            result = self._safe_exec(run_query, None)
-            self.check_result(result)
+        workers = self._settings.get_search_workers()
+        if workers > 1 and len(videos) > self._search_window.get_size():
+            window_results = self._search_windows_concurrent(videos, lang_str, workers, callback)
+        else:
+            window_results = self._search_windows_serial(videos, lang_str, callback)
+
+        try:
+            for (queries, hash_video), result, latency in window_results:
+                try:
+                    self.check_result(result)
+                except ProviderConnectionError:
+                    self._search_window.record_failure(len(queries), latency)
+                    raise
+                self._search_window.record_success(len(queries), latency)
+                self._add_search_result(result, queries, hash_video, remote_subtitles)
+                if search_cache is not None:
+                    self._store_search_result(search_cache, lang_str, queries, result)
+        finally:
+            window_results.close()
+
+        callback.finish()
+        return remote_subtitles
+
+    # Keys of the result of SearchSubtitles used by _add_search_result.
+    SEARCH_RESULT_KEYS = (
+        'SubFileName', 'SubSize', 'IDSubtitleFile', 'SubHash', 'SubDownloadLink', 'SubtitlesLink', 'UserNickName',
+        'SubLanguageID', 'SubRating', 'SubAddDate', 'MovieHash', 'IDMovieImdb', 'MovieImdbRating', 'MovieName',
+        'MovieYear', 'SeriesSeason', 'SeriesEpisode',
+    )
+
+    @staticmethod
+    def _search_cache_languages(lang_str):
+        return ','.join(sorted(lang_str.split(',')))
+
+    def _search_videos_cached(self, videos, lang_str, search_cache, remote_subtitles):
+        """
+        Add the cached search results to the videos.
+        :param videos: list of VideoFile objects
+        :param lang_str: languages as accepted by the server
+        :param search_cache: SearchResultCache
+        :param remote_subtitles: list to which the remote subtitles are appended
+        :return: list of VideoFile objects without cached search result
+        """
+        cache_languages = self._search_cache_languages(lang_str)
+        videos_uncached = []
+        for video in videos:
+            osdb_hash = video.get_osdb_hash()
+            result = None
+            if osdb_hash is not None:
+                result = search_cache.get_search_result(self.get_name(), osdb_hash, video.get_size(), cache_languages)
             if result is None:
+                videos_uncached.append(video)
+                continue
+            self._add_search_result({'data': result}, [], {osdb_hash: video}, remote_subtitles)
+        log.debug('{} of {} search results cached'.format(len(videos) - len(videos_uncached), len(videos)))
+        return videos_uncached
+
+    def _store_search_result(self, search_cache, lang_str, queries, result):
+        """
+        Store the result of a SearchSubtitles call per video. Videos without subtitles get an empty result.
+        :param search_cache: SearchResultCache
+        :param lang_str: languages as accepted by the server
+        :param queries: queries of the call
+        :param result: result of the call
+        """
+        rsubs_raw = result['data'] or []
+        if len(rsubs_raw) >= self.SEARCH_LIMIT:
+            # The result is truncated: the subtitles of some videos may be missing.
+            return
+        hash_result = {query['moviehash']: [] for query in queries}
+        for rsub_raw in rsubs_raw:
+            try:
+                movie_hash = '{:>016}'.format(rsub_raw['MovieHash'])
+            except KeyError:
                 continue
+            if movie_hash in hash_result:
+                hash_result[movie_hash].append({key: rsub_raw[key] for key in self.SEARCH_RESULT_KEYS
+                                                if key in rsub_raw})
+        search_cache.set_search_results(self.get_name(), self._search_cache_languages(lang_str),
+                                        ((query['moviehash'], int(query['moviebytesize']),
+                                          hash_result[query['moviehash']]) for query in queries))
+
+    def _search_window_queries(self, video_window, lang_str):
+        """
+        Build the queries of one SearchSubtitles call.
+        :param video_window: list of VideoFile objects
+        :param lang_str: languages as accepted by the server
+        :return: tuple of list of queries and dict mapping osdb hash to video
+        """
+        queries = []
+        hash_video = {}
+        for video in video_window:
+            query = {
+                'sublanguageid': lang_str,
+                'moviehash': video.get_osdb_hash(),
+                'moviebytesize': str(video.get_size()),
+            }
+            if video.get_osdb_hash() is None:
+                log.debug('osdb hash of "{}" is empty -> skip'.format(video.get_filepath()))
+                self._signal_connection_failed()  # FIXME: other name + general signaling
+                continue
+            queries.append(query)
+            hash_video[video.get_osdb_hash()] = video
+        return queries, hash_video
+
+    def _search_windows_serial(self, videos, lang_str, callback):
+        """
+        Send the SearchSubtitles calls one after another over the connection of this provider.
+        Each window takes the size of the search window when its call is sent.
+        :param videos: list of VideoFile objects
+        :param lang_str: languages as accepted by the server
+        :param callback: ProgressCallback, updated with the number of searched videos before every call
+        :return: generator of tuples of window, result and latency
+        """
+        nb_searched = 0
+        for video_window in window_iterator(videos, self._search_window.get_size):
+            callback.update(nb_searched)
+            if callback.canceled():
+                break
+            window = self._search_window_queries(video_window, lang_str)
+            queries = window[0]
+            timer = AttemptTimer()
+            result = self._safe_exec(timer.wrap(
+                lambda: self._xmlrpc.SearchSubtitles(self._token, queries, {'limit': self.SEARCH_LIMIT})), None)
+            nb_searched += len(video_window)
+            yield window, result, timer.get_latency()
+
+    def _search_windows_concurrent(self, videos, lang_str, workers, callback):
+        """
+        Send the SearchSubtitles calls from a pool of workers, each worker using its own connection.
+        At most workers calls are in flight. A window is cut when its call is sent,
+        so it takes the size of the search window learned from the results so far.
+        The results are yielded in the order of the windows, so they are merged into the videos
+        exactly as the serial search does.
+        :param videos: list of VideoFile objects
+        :param lang_str: languages as accepted by the server
+        :param workers: number of workers
+        :param callback: ProgressCallback, updated with the number of searched videos when a result is available
+        :return: generator of tuples of window, result and latency
+        """
+        log.debug('_search_windows_concurrent(#videos={}, workers={})'.format(len(videos), workers))
+        self._ensure_connection()
+        thread_data = threading.local()
+        proxies = []
+        proxies_lock = threading.Lock()
+
+        def run_query(queries):
+            proxy = getattr(thread_data, 'xmlrpc', None)
+            if proxy is None:
+                proxy = self._create_server_proxy()
+                thread_data.xmlrpc = proxy
+                with proxies_lock:
+                    proxies.append(proxy)
+            with self._xmlrpc_lock:
+                # Wait for a login of another thread to finish.
+                token = self._token
+            timer = AttemptTimer()
+            try:
+                result = self._execute(timer.wrap(
+                    lambda: proxy.SearchSubtitles(token, queries, {'limit': self.SEARCH_LIMIT})))
+            except RetryableError as e:
+                result = e.get_result()
+            except (CircuitOpenError, ProtocolError) as e:
+                log.debug('Query failed: {} {}'.format(type(e), e.args))
+                result = None
+            if result is None:
+                self._signal_connection_failed()
+            return result, timer.get_latency(), token
+
+        callback.update(0)
+        executor = ThreadPoolExecutor(max_workers=workers)
+        # Tuples of window, number of videos and future of the call, in order of the windows.
+        pending = deque()
+        nb_sent = 0
+        nb_searched = 0
+        try:
+            while True:
+                while nb_sent < len(videos) and len(pending) < workers:
+                    video_window = videos[nb_sent:nb_sent + self._search_window.get_size()]
+                    nb_sent += len(video_window)
+                    window = self._search_window_queries(video_window, lang_str)
+                    pending.append((window, len(video_window), executor.submit(run_query, window[0])))
+                if not pending:
+                    break
+                window, nb_videos, future = pending.popleft()
+                result, latency, token = future.result()
+                if self._is_auth_error(result):
+                    log.info('Session ended by server: {}'.format(result['status']))
+                    self._relogin(token)
+                    queries = window[0]
+                    timer = AttemptTimer()
+                    result = self._safe_exec(timer.wrap(
+                        lambda: self._xmlrpc.SearchSubtitles(self._token, queries, {'limit': self.SEARCH_LIMIT})),
+                        None, relogin=False)
+                    latency = timer.get_latency()
+                elif result is not None:
+                    self._touch_session()
+                nb_searched += nb_videos
+                callback.update(nb_searched)
+                yield window, result, latency
+                if callback.canceled():
+                    break
+        finally:
+            for window, nb_videos, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            for proxy in proxies:
+                proxy('close')()
+
+    def _add_search_result(self, result, queries, hash_video, remote_subtitles):
+        """
+        Add the remote subtitles of the result of a SearchSubtitles call to the videos.
+        :param result: result of the call
+        :param queries: queries of the call
+        :param hash_video: dict mapping osdb hash to video
+        :param remote_subtitles: list to which the remote subtitles are appended
+        """
+        if result is None or not result.get('data'):
+            return
+
+        for rsub_raw in result['data']:
+            try:
+                remote_filename = rsub_raw['SubFileName']
+                remote_file_size = int(rsub_raw['SubSize'])
+                remote_id = rsub_raw['IDSubtitleFile']
+                remote_md5_hash = rsub_raw['SubHash']
+                remote_download_link = rsub_raw['SubDownloadLink']
+                remote_link = rsub_raw['SubtitlesLink']
+                remote_uploader = rsub_raw['UserNickName'].strip()
+                remote_language_raw = rsub_raw['SubLanguageID']
+                try:
+                    remote_language = Language.from_unknown(remote_language_raw,
+                                                            xx=True, xxx=True)
+                except NotALanguageException:
+                    remote_language = UnknownLanguage(remote_language_raw)
+                remote_rating = float(rsub_raw['SubRating'])
+                remote_date = datetime.datetime.strptime(rsub_raw['SubAddDate'], '%Y-%m-%d %H:%M:%S')
+                remote_subtitle = OpenSubtitlesSubtitleFile(
+                    filename=remote_filename,
+                    file_size=remote_file_size,
+                    md5_hash=remote_md5_hash,
+                    id_online=remote_id,
+                    download_link=remote_download_link,
+                    link=remote_link,
+                    uploader=remote_uploader,
+                    language=remote_language,
+                    rating=remote_rating,
+                    date=remote_date,
+                )
+                movie_hash = '{:>016}'.format(rsub_raw['MovieHash'])
+                video = hash_video[movie_hash]
+
+                imdb_id = rsub_raw['IDMovieImdb']
+                try:
+                    imdb_rating = float(rsub_raw['MovieImdbRating'])
+                except (ValueError, KeyError):
+                    imdb_rating = None
+                imdb_identity = ImdbIdentity(imdb_id=imdb_id, imdb_rating=imdb_rating)
+
+                video_name = rsub_raw['MovieName']
+                try:
+                    video_year = int(rsub_raw['MovieYear'])
+                except (ValueError, KeyError):
+                    video_year = None
+                video_identity = VideoIdentity(name=video_name, year=video_year)
 
-            for rsub_raw in result['data']:
                 try:
-                    remote_filename = rsub_raw['SubFileName']
-                    remote_file_size = int(rsub_raw['SubSize'])
-                    remote_id = rsub_raw['IDSubtitleFile']
-                    remote_md5_hash = rsub_raw['SubHash']
-                    remote_download_link = rsub_raw['SubDownloadLink']
-                    remote_link = rsub_raw['SubtitlesLink']
-                    remote_uploader = rsub_raw['UserNickName'].strip()
-                    remote_language_raw = rsub_raw['SubLanguageID']
-                    try:
-                        remote_language = Language.from_unknown(remote_language_raw,
-                                                                xx=True, xxx=True)
-                    except NotALanguageException:
-                        remote_language = UnknownLanguage(remote_language_raw)
-                    remote_rating = float(rsub_raw['SubRating'])
-                    remote_date = datetime.datetime.strptime(rsub_raw['SubAddDate'], '%Y-%m-%d %H:%M:%S')
-                    remote_subtitle = OpenSubtitlesSubtitleFile(
-                        filename=remote_filename,
-                        file_size=remote_file_size,
-                        md5_hash=remote_md5_hash,
-                        id_online=remote_id,
-                        download_link=remote_download_link,
-                        link=remote_link,
-                        uploader=remote_uploader,
-                        language=remote_language,
-                        rating=remote_rating,
-                        date=remote_date,
-                    )
-                    movie_hash = '{:>016}'.format(rsub_raw['MovieHash'])
-                    video = hash_video[movie_hash]
-
-                    imdb_id = rsub_raw['IDMovieImdb']
-                    try:
-                        imdb_rating = float(rsub_raw['MovieImdbRating'])
-                    except (ValueError, KeyError):
-                        imdb_rating = None
-                    imdb_identity = ImdbIdentity(imdb_id=imdb_id, imdb_rating=imdb_rating)
-
-                    video_name = rsub_raw['MovieName']
-                    try:
-                        video_year = int(rsub_raw['MovieYear'])
-                    except (ValueError, KeyError):
-                        video_year = None
-                    video_identity = VideoIdentity(name=video_name, year=video_year)
-
-                    try:
-                        series_season = int(rsub_raw['SeriesSeason'])
-                    except (KeyError, ValueError):
-                        series_season = None
-                    try:
-                        series_episode = int(rsub_raw['SeriesEpisode'])
-                    except (KeyError, ValueError):
-                        series_episode = None
-                    series_identity = SeriesIdentity(season=series_season, episode=series_episode)
-
-                    identity = ProviderIdentities(video_identity=video_identity, imdb_identity=imdb_identity,
-                                                  episode_identity=series_identity, provider=self)
-                    video.add_subtitle(remote_subtitle)
-                    video.add_identity(identity)
-
-                    remote_subtitles.append(remote_subtitle)
+                    series_season = int(rsub_raw['SeriesSeason'])
                 except (KeyError, ValueError):
-                    log.exception('Error parsing result of SearchSubtitles(...)')
-                    log.error('Offending query is: {queries}'.format(queries=queries))
-                    log.error('Offending result is: {remote_sub}'.format(remote_sub=rsub_raw))
+                    series_season = None
+                try:
+                    series_episode = int(rsub_raw['SeriesEpisode'])
+                except (KeyError, ValueError):
+                    series_episode = None
+                series_identity = SeriesIdentity(season=series_season, episode=series_episode)
 
-        callback.finish()
-        return remote_subtitles
+                identity = ProviderIdentities(video_identity=video_identity, imdb_identity=imdb_identity,
+                                              episode_identity=series_identity, provider=self)
+                video.add_subtitle(remote_subtitle)
+                video.add_identity(identity)
+
+                remote_subtitles.append(remote_subtitle)
+            except (KeyError, ValueError):
+                log.exception('Error parsing result of SearchSubtitles(...)')
+                log.error('Offending query is: {queries}'.format(queries=queries))
+                log.error('Offending result is: {remote_sub}'.format(remote_sub=rsub_raw))
 
     def query_text(self, query):
-        return OpenSubtitlesTextQuery(query=query)
+        return OpenSubtitlesTextQuery(query=query, retry_policy=self._retry_policy,
+                                      circuit_breaker=self._http_circuit_breaker, rate_limiter=self._rate_limiter)
 
     def download_subtitles(self, os_rsubs):
         log.debug('download_subtitles()')
+        map_id_contents = {os_rsub.get_id_online(): contents
+                           for os_rsub, contents in self.iter_download_subtitles(os_rsubs)}
+        subtitles = [map_id_contents[os_rsub.get_id_online()] for os_rsub in os_rsubs]
+        return subtitles
+
+    def iter_download_subtitles(self, os_rsubs):
+        """
+        Download subtitles, yielding each subtitle as soon as its window has arrived.
+        Cached subtitles are yielded first.
+        :param os_rsubs: list of OpenSubtitlesSubtitleFile
+        :return: generator of tuples of OpenSubtitlesSubtitleFile and its contents as bytes
+        """
+        log.debug('iter_download_subtitles()')
+        for os_rsub, chunks in self._iter_download_subtitle_chunks(os_rsubs):
+            yield os_rsub, b''.join(chunks)
+
+    def write_subtitles(self, os_rsub_paths):
+        """
+        Download subtitles and write them to their target paths.
+        The subtitles are decoded in chunks: only one window is held in memory at a time.
+        :param os_rsub_paths: list of tuples of OpenSubtitlesSubtitleFile and target path
+        """
+        log.debug('write_subtitles()')
+        os_rsubs, map_id_targets = self._group_subtitle_targets(os_rsub_paths)
+        for os_rsub, chunks in self._iter_download_subtitle_chunks(os_rsubs):
+            self._write_subtitle_targets(chunks, map_id_targets[os_rsub.get_id_online()])
+
+    @staticmethod
+    def _group_subtitle_targets(os_rsub_paths):
+        """
+        Group the target paths per subtitle id, so a subtitle picked by multiple targets is downloaded once.
+        :param os_rsub_paths: list of tuples of OpenSubtitlesSubtitleFile and target path
+        :return: tuple of list of OpenSubtitlesSubtitleFile with unique ids
+            and dict mapping an id to its list of tuples of OpenSubtitlesSubtitleFile and target path
+        """
+        os_rsubs = []
+        map_id_targets = {}
+        for os_rsub, target_path in os_rsub_paths:
+            targets = map_id_targets.setdefault(os_rsub.get_id_online(), [])
+            if not targets:
+                os_rsubs.append(os_rsub)
+            targets.append((os_rsub, target_path))
+        return os_rsubs, map_id_targets
+
+    @staticmethod
+    def _write_subtitle_targets(chunks, targets):
+        """
+        Write the chunks of a subtitle to the path of the first target and copy that file to the other targets.
+        :param chunks: iterable of chunks of the contents
+        :param targets: list of tuples of OpenSubtitlesSubtitleFile and target path
+        """
+        first_path = targets[0][1]
+        with open(str(first_path), 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        for target_os_rsub, target_path in targets[1:]:
+            if target_path != first_path:
+                shutil.copyfile(str(first_path), str(target_path))
+
+    WRITE_WORKERS = 4
+
+    def iter_write_subtitles(self, os_rsub_paths):
+        """
+        Download subtitles and write them to their target paths.
+        All subtitles are fetched in windows through DownloadSubtitles, also the ones having a download link.
+        The subtitles are decoded and written by a pool of workers, while the next window is downloaded.
+        A subtitle picked by multiple targets is downloaded once and written to all of them.
+        :param os_rsub_paths: list of tuples of OpenSubtitlesSubtitleFile and target path
+        :return: generator of tuples of OpenSubtitlesSubtitleFile and LocalSubtitleFile, one per target,
+            yielded when written
+        """
+        log.debug('iter_write_subtitles(#subtitles={})'.format(len(os_rsub_paths)))
+        os_rsubs, map_id_targets = self._group_subtitle_targets(os_rsub_paths)
+
+        def write_chunks(os_rsub, chunks):
+            targets = map_id_targets[os_rsub.get_id_online()]
+            self._write_subtitle_targets(chunks, targets)
+            return [(target_os_rsub, LocalSubtitleFile(filepath=target_path))
+                    for target_os_rsub, target_path in targets]
+
+        executor = ThreadPoolExecutor(max_workers=self.WRITE_WORKERS)
+        # Bound the number of pending subtitles: each one holds its payload.
+        futures = deque()
+        try:
+            for os_rsub, chunks in self._iter_download_subtitle_chunks(os_rsubs):
+                futures.append(executor.submit(write_chunks, os_rsub, chunks))
+                while len(futures) > 2 * self.WRITE_WORKERS:
+                    yield from futures.popleft().result()
+            while futures:
+                yield from futures.popleft().result()
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def _iter_download_subtitle_chunks(self, os_rsubs):
+        """
+        Download subtitles in windows.
+        Every iterable of chunks holds the payload of its own subtitle only: it does not depend on the progress of
+        the generator, so it can be consumed later or in another thread. It holds its payload until consumed.
+        :param os_rsubs: list of OpenSubtitlesSubtitleFile
+        :return: generator of tuples of OpenSubtitlesSubtitleFile and iterable of chunks of its contents
+        """
         if not self.logged_in():
             raise ProviderNotConnectedError()
 
-        window_size = 20
-        map_id_data = {}
-        for window_i, os_rsub_window in enumerate(window_iterator(os_rsubs, window_size)):
+        os_rsubs_download = []
+        ids_download = set()
+        nb_cached = 0
+        download_cache = get_default_subtitle_download_cache()
+        for os_rsub in os_rsubs:
+            if os_rsub.get_id_online() in ids_download:
+                continue
+            contents = None
+            if download_cache is not None:
+                contents = self._load_cached_subtitle(download_cache, os_rsub)
+            if contents is None:
+                os_rsubs_download.append(os_rsub)
+                ids_download.add(os_rsub.get_id_online())
+            else:
+                nb_cached += 1
+                yield os_rsub, (contents, )
+        log.debug('{} of {} subtitles cached'.format(nb_cached, len(os_rsubs)))
+        self._download_quota.check(len(os_rsubs_download))
+
+        for os_rsub_window in window_iterator(os_rsubs_download, self._download_window.get_size):
             query = [subtitle.get_id_online() for subtitle in os_rsub_window]
 
-            def run_query():
-                return self._xmlrpc.DownloadSubtitles(self._token, query)
-            result = self._safe_exec(run_query, None)
+            timer = AttemptTimer()
+            result = self._safe_exec(timer.wrap(lambda: self._xmlrpc.DownloadSubtitles(self._token, query)), None)
+            latency = timer.get_latency()
 
-            self.check_result(result)
-            map_id_data.update({item['idsubtitlefile']: item['data'] for item in result['data']})
-        subtitles = [unzip_bytes(base64.b64decode(map_id_data[os_rsub.get_id_online()])).read() for os_rsub in os_rsubs]
-        return subtitles
+            try:
+                self.check_result(result)
+            except ProviderConnectionError:
+                self._download_window.record_failure(len(query), latency)
+                raise
+            self._download_window.record_success(len(query), latency)
+            self._download_quota.add(len(query))
+            map_id_data = {item['idsubtitlefile']: item['data'] for item in result['data']}
+            # Only keep the payloads of the subtitles that have not been yielded yet.
+            result = None
+            for os_rsub in os_rsub_window:
+                data = map_id_data.pop(os_rsub.get_id_online())
+                yield os_rsub, self._iter_subtitle_chunks(download_cache, os_rsub, data)
+
+    def _iter_subtitle_chunks(self, download_cache, os_rsub, data):
+        """
+        Decode the payload of a subtitle in chunks, and store it in the cache once all chunks are decoded.
+        :param download_cache: SubtitleDownloadCache (None to not cache)
+        :param os_rsub: OpenSubtitlesSubtitleFile
+        :param data: base64 encoded gzip contents as string
+        :return: generator of chunks of the contents
+        """
+        compressed_chunks = []
+        md5 = hashlib.md5()
+        for compressed_chunk, chunk in iter_unzip_base64(data):
+            if download_cache is not None:
+                compressed_chunks.append(compressed_chunk)
+                md5.update(chunk)
+            yield chunk
+        if download_cache is not None:
+            self._store_cached_subtitle(download_cache, os_rsub, b''.join(compressed_chunks), md5.hexdigest())
+
+    @staticmethod
+    def _subtitle_verified(os_rsub, contents_md5_hash):
+        """
+        Check whether the contents of a subtitle match its md5 hash.
+        :param os_rsub: OpenSubtitlesSubtitleFile
+        :param contents_md5_hash: md5 hash of the uncompressed contents as string
+        :return: True if the contents match
+        """
+        md5_hash = os_rsub.get_md5_hash()
+        return md5_hash is not None and contents_md5_hash == md5_hash.lower()
+
+    def _load_cached_subtitle(self, download_cache, os_rsub):
+        """
+        Look up the contents of a subtitle in the cache, and check them against the md5 hash of the subtitle.
+        :param download_cache: SubtitleDownloadCache
+        :param os_rsub: OpenSubtitlesSubtitleFile
+        :return: uncompressed contents as bytes, None if not available
+        """
+        data = download_cache.get_subtitle(self.get_name(), os_rsub.get_id_online(), os_rsub.get_md5_hash())
+        if data is None:
+            return None
+        try:
+            contents = unzip_bytes(data).read()
+        except (EOFError, OSError, zlib.error):
+            contents = None
+        if contents is None or not self._subtitle_verified(os_rsub, hashlib.md5(contents).hexdigest()):
+            log.warning('Cached subtitle {} is corrupt: removing'.format(os_rsub.get_id_online()))
+            download_cache.remove_subtitle(self.get_name(), os_rsub.get_id_online())
+            return None
+        return contents
+
+    def _store_cached_subtitle(self, download_cache, os_rsub, data, contents_md5_hash):
+        """
+        Store the contents of a subtitle in the cache, if they match the md5 hash of the subtitle.
+        :param download_cache: SubtitleDownloadCache
+        :param os_rsub: OpenSubtitlesSubtitleFile
+        :param data: gzip compressed contents as bytes
+        :param contents_md5_hash: md5 hash of the uncompressed contents as string
+        """
+        if not self._subtitle_verified(os_rsub, contents_md5_hash):
+            log.debug('Subtitle {} does not match its hash: not cached'.format(os_rsub.get_id_online()))
+            return
+        download_cache.set_subtitle(self.get_name(), os_rsub.get_id_online(), os_rsub.get_md5_hash(), data)
 
     def upload_subtitles(self, local_movie):
         log.debug('upload_subtitles()')
@@ -296,6 +810,8 @@ class OpenSubtitles(SubtitleProvider):
         if not video_subtitles:
             return UploadResult(type=UploadResult.Type.MISSINGDATA, reason=_('Need at least one subtitle to upload'))
 
+        hash_subtitles([subtitle for _, subtitle in video_subtitles if subtitle], ProgressCallback())
+
         query_try = dict()
         for sub_i, (video, subtitle) in enumerate(video_subtitles):
             if not video:
@@ -479,15 +995,101 @@ class OpenSubtitles(SubtitleProvider):
         # FIXME: set flag/... to signal users that the connection has failed
         pass
 
-    def _safe_exec(self, query, default):
+    def _safe_exec(self, query, default, relogin=True):
+        """
+        Execute a query, returning default when the connection fails.
+        When the server tells the session has ended, log in again and execute the query again.
+        :param query: callable calling the server
+        :param default: value to return when the connection fails
+        :param relogin: True to log in again when the session has ended
+        :return: result of the query or default
+        """
         self._ensure_connection()
+        token = self._token
+
+        def locked_query():
+            nonlocal token
+            with self._xmlrpc_lock:
+                if self._xmlrpc is None:
+                    raise ProviderNotConnectedError()
+                token = self._token
+                return query()
         try:
-            result = query()
-            return result
-        except (ProtocolError, CannotSendRequest, SocketError, ExpatError) as e:
+            result = self._execute(locked_query)
+        except RetryableError as e:
+            result = e.get_result()
+            if result is None:
+                self._signal_connection_failed()
+                return default
+        except (CircuitOpenError, ProtocolError) as e:
             self._signal_connection_failed()
             log.debug('Query failed: {} {}'.format(type(e), e.args))
             return default
+        if relogin and token is not None and self._is_auth_error(result):
+            log.info('Session ended by server: {}'.format(result['status']))
+            self._relogin(token)
+            return self._safe_exec(query, default, relogin=False)
+        self._touch_session()
+        return result
+
+    RETRYABLE_STATUS_CODES = (429, 503, 506, )
+
+    def _execute(self, query):
+        """
+        Execute a query, trying again after connection errors and when the server is busy.
+        :param query: callable calling the server
+        :return: result of the query
+        :raise RetryableError: when all attempts have failed, with the last result if the server answered
+        :raise CircuitOpenError: when the server has failed too often recently
+        :raise ProtocolError: on a http error that is not transient
+        """
+        def attempt():
+            self._rate_limiter.acquire()
+            try:
+                result = query()
+            except ProtocolError as e:
+                if is_retryable_http_code(e.errcode):
+                    raise RetryableError(e)
+                raise
+            except (CannotSendRequest, SocketError, ExpatError) as e:
+                raise RetryableError(e)
+            if self._get_status_code(result) in self.RETRYABLE_STATUS_CODES:
+                raise RetryableError(result['status'], result=result)
+            return result
+        return self._retry_policy.execute(attempt, self._circuit_breaker)
+
+    def _urlopen(self, url):
+        """
+        Open an url of the website, trying again after transient failures.
+        :param url: url to open
+        :return: response of urlopen
+        :raise ProviderConnectionError: when the url cannot be opened
+        """
+        try:
+            return urlopen_retry(url, self._retry_policy, self._http_circuit_breaker, rate_limiter=self._rate_limiter)
+        except (HTTPError, RetryableError) as e:
+            raise OpenSubtitlesProviderConnectionError(None, 'Failed to fetch url {url}: {e}'.format(url=url, e=e))
+
+    @classmethod
+    def _get_status_code(cls, data):
+        """
+        Get the status code of the result of a call.
+        :param data: result of a call
+        :return: status code as int or None if the result has no valid status
+        """
+        try:
+            return int(cls.STATUS_CODE_RE.match(data['status']).group(1))
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return None
+
+    @classmethod
+    def _is_auth_error(cls, data):
+        """
+        Check whether the result of a call tells the session is not valid.
+        :param data: result of a call
+        :return: True if the session is not valid
+        """
+        return cls._get_status_code(data) in cls.AUTH_ERROR_CODES
 
     STATUS_CODE_RE = re.compile(r'(\d+) (.+)')
 
@@ -529,6 +1131,298 @@ class OpenSubtitles(SubtitleProvider):
         log.debug('check_result() finished (data is ok)')
 
 
+class AsyncOpenSubtitles(AsyncSubtitleProvider):
+    """
+    OpenSubtitles for asyncio, calling the XML-RPC api over an AsyncXmlRpcClient.
+    Settings, rate limiter, retry policy, adaptive windows, download quota and caches
+    are shared with the OpenSubtitles provider it is created from. The session is not:
+    an AsyncOpenSubtitles logs in by itself. No keep alive pings are sent:
+    an expired session is replaced by a new one when needed.
+    Only the XML-RPC calls run natively on the event loop. Hashing videos, the caches, decoding subtitles,
+    uploads and text queries block, so they run in the executor. Text queries are not native.
+    """
+    def __init__(self, provider, executor=None):
+        """
+        Create a new AsyncOpenSubtitles.
+        :param provider: OpenSubtitles
+        :param executor: concurrent.futures.Executor running the blocking work (None for the default executor)
+        """
+        AsyncSubtitleProvider.__init__(self, provider)
+        self._executor = executor
+        self._client = None
+        self._token = None
+        self._last_time = None
+        self._login_lock = None
+
+    async def connect(self):
+        log.debug('async connect()')
+        if self.connected():
+            return
+        self._client = AsyncXmlRpcClient(self._provider.URL, connect_timeout=self._provider.CONNECT_TIMEOUT,
+                                         read_timeout=self._provider.READ_TIMEOUT,
+                                         max_connections=self._provider.get_settings().get_search_workers())
+        self._login_lock = asyncio.Lock()
+
+    async def disconnect(self):
+        log.debug('async disconnect()')
+        if self.logged_in():
+            await self.logout()
+        if self.connected():
+            self._client.close()
+            self._client = None
+
+    def connected(self):
+        return self._client is not None
+
+    async def login(self):
+        log.debug('async login()')
+        if self.logged_in():
+            return
+        if not self.connected():
+            await self.connect()
+        settings = self._provider.get_settings()
+        result = await self._call('LogIn', str(settings.username), str(settings.password), 'en',
+                                  str(settings.get_user_agent()))
+        self._provider.check_result(result)
+        self._token = result['token']
+
+    async def logout(self):
+        log.debug('async logout()')
+        if self.logged_in():
+            # Do no check result of this call. Assume connection closed.
+            await self._call('LogOut', self._token)
+        self._token = None
+
+    def logged_in(self):
+        return self._token is not None
+
+    async def _run(self, function, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, function, *args)
+
+    async def search_videos(self, videos, callback, languages=None):
+        """
+        Search subtitles for videos.
+        The windows are sent concurrently, at most search_workers at a time.
+        The videos are hashed and the search cache is used in the executor, so the event loop is not blocked.
+        :param videos: list of VideoFile objects
+        :param callback: ProgressCallback, updated from the event loop
+        :param languages: list of Language objects (None for all languages)
+        :return: list of OpenSubtitlesSubtitleFile
+        """
+        log.debug('async search_videos(#videos={})'.format(len(videos)))
+        if not self.logged_in():
+            raise ProviderNotConnectedError()
+        provider = self._provider
+
+        lang_str = provider._languages_to_str(languages)
+
+        remote_subtitles = []
+        search_cache = get_default_search_result_cache()
+        if search_cache is not None:
+            videos = await self._run(provider._search_videos_cached, videos, lang_str, search_cache, remote_subtitles)
+
+        callback.set_range(0, len(videos))
+        callback.update(0)
+        workers = provider.get_settings().get_search_workers()
+
+        async def search_window(queries):
+            timer = AttemptTimer()
+            result = await self._call_session('SearchSubtitles', queries, {'limit': provider.SEARCH_LIMIT},
+                                              timer=timer)
+            return result, timer.get_latency()
+
+        # Tuples of window, number of videos and task of the call, in order of the windows.
+        # A window is cut when its call is sent, so it takes the size learned from the results so far.
+        pending = deque()
+        nb_sent = 0
+        nb_searched = 0
+        try:
+            while True:
+                while nb_sent < len(videos) and len(pending) < workers:
+                    video_window = videos[nb_sent:nb_sent + provider._search_window.get_size()]
+                    nb_sent += len(video_window)
+                    # Hashing reads the videos: the calls sent before keep running meanwhile.
+                    window = await self._run(provider._search_window_queries, video_window, lang_str)
+                    pending.append((window, len(video_window), asyncio.ensure_future(search_window(window[0]))))
+                if not pending:
+                    break
+                (queries, hash_video), nb_videos, task = pending.popleft()
+                result, latency = await task
+                try:
+                    provider.check_result(result)
+                except ProviderConnectionError:
+                    provider._search_window.record_failure(len(queries), latency)
+                    raise
+                provider._search_window.record_success(len(queries), latency)
+                provider._add_search_result(result, queries, hash_video, remote_subtitles)
+                if search_cache is not None:
+                    await self._run(provider._store_search_result, search_cache, lang_str, queries, result)
+                nb_searched += nb_videos
+                callback.update(nb_searched)
+                if callback.canceled():
+                    break
+        finally:
+            tasks = [task for window, nb_videos, task in pending]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        callback.finish()
+        return remote_subtitles
+
+    async def query_text(self, query):
+        """
+        Create a text query. The text query is not native: it runs the synchronous implementation in the executor.
+        :param query: text to search for
+        :return: AsyncSubtitleTextQuery
+        """
+        return AsyncSubtitleTextQuery(self._provider.query_text(query), executor=self._executor)
+
+    async def download_subtitles(self, os_rsubs):
+        log.debug('async download_subtitles(#subtitles={})'.format(len(os_rsubs)))
+        if not self.logged_in():
+            raise ProviderNotConnectedError()
+        provider = self._provider
+
+        download_cache = get_default_subtitle_download_cache()
+
+        def load_cached():
+            map_id_contents = {}
+            os_rsubs_download = []
+            ids_download = set()
+            for os_rsub in os_rsubs:
+                id_online = os_rsub.get_id_online()
+                if id_online in map_id_contents or id_online in ids_download:
+                    continue
+                contents = None
+                if download_cache is not None:
+                    contents = provider._load_cached_subtitle(download_cache, os_rsub)
+                if contents is None:
+                    os_rsubs_download.append(os_rsub)
+                    ids_download.add(id_online)
+                else:
+                    map_id_contents[id_online] = contents
+            return map_id_contents, os_rsubs_download
+
+        # The cache is read in the executor, so the event loop is not blocked.
+        map_id_contents, os_rsubs_download = await self._run(load_cached)
+        provider.get_download_quota().check(len(os_rsubs_download))
+
+        def decode(os_rsub, data):
+            return b''.join(provider._iter_subtitle_chunks(download_cache, os_rsub, data))
+
+        for os_rsub_window in window_iterator(os_rsubs_download, provider._download_window.get_size):
+            query = [os_rsub.get_id_online() for os_rsub in os_rsub_window]
+            timer = AttemptTimer()
+            result = await self._call_session('DownloadSubtitles', query, timer=timer)
+            latency = timer.get_latency()
+            try:
+                provider.check_result(result)
+            except ProviderConnectionError:
+                provider._download_window.record_failure(len(query), latency)
+                raise
+            provider._download_window.record_success(len(query), latency)
+            provider.get_download_quota().add(len(query))
+            map_id_data = {item['idsubtitlefile']: item['data'] for item in result['data']}
+            result = None
+            for os_rsub in os_rsub_window:
+                data = map_id_data.pop(os_rsub.get_id_online())
+                # Decoding and caching the subtitle block: run them in the executor.
+                map_id_contents[os_rsub.get_id_online()] = await self._run(decode, os_rsub, data)
+        return [map_id_contents[os_rsub.get_id_online()] for os_rsub in os_rsubs]
+
+    async def upload_subtitles(self, local_movie):
+        # Uploading hashes and reads local files: run the synchronous implementation.
+        return await self._run(self._provider.upload_subtitles, local_movie)
+
+    async def ping(self):
+        log.debug('async ping()')
+        if not self.logged_in():
+            raise ProviderNotConnectedError()
+        result = await self._call_session('NoOperation')
+        self._provider.check_result(result)
+
+    async def provider_info(self):
+        return await self._run(self._provider.provider_info)
+
+    async def _call_session(self, method, *params, relogin=True, timer=None):
+        """
+        Call a method with the token of the session as first parameter.
+        When the server tells the session has ended, log in again and call the method again.
+        :param method: name of the method
+        :param params: parameters following the token
+        :param relogin: True to log in again when the session has ended
+        :param timer: AttemptTimer recording the duration of the last attempt (None to not time the call)
+        :return: result of the call or None when the connection fails
+        """
+        if self._token is not None and self._last_time is not None:
+            idle = self._provider._now() - self._last_time
+            if idle > self._provider.SESSION_TTL:
+                log.info('Session idle for {:.0f} seconds: expired'.format(idle))
+                await self._relogin(self._token)
+        token = self._token
+        result = await self._call(method, token, *params, timer=timer)
+        if relogin and self._provider._is_auth_error(result):
+            log.info('Session ended by server: {}'.format(result['status']))
+            await self._relogin(token)
+            return await self._call_session(method, *params, relogin=False, timer=timer)
+        return result
+
+    async def _relogin(self, expired_token):
+        """
+        Log in again after the session of a token has ended.
+        :param expired_token: token of the ended session
+        """
+        async with self._login_lock:
+            if self._token != expired_token:
+                # Another task has logged in already.
+                return
+            log.info('Logging in again')
+            self._token = None
+            await self.login()
+
+    async def _call(self, method, *params, timer=None):
+        """
+        Call a method, returning None when the connection fails.
+        :param method: name of the method
+        :param params: parameters of the method
+        :param timer: AttemptTimer recording the duration of the last attempt (None to not time the call)
+        :return: result of the call or None
+        """
+        client = self._client
+        if client is None:
+            raise ProviderNotConnectedError()
+
+        async def attempt():
+            await asyncio.sleep(self._provider._rate_limiter.reserve())
+            time_start = time.perf_counter()
+            try:
+                result = await client.call(method, *params)
+            except ProtocolError as e:
+                if is_retryable_http_code(e.errcode):
+                    raise RetryableError(e)
+                raise
+            except (OSError, EOFError, asyncio.TimeoutError, ExpatError) as e:
+                raise RetryableError(e)
+            finally:
+                if timer is not None:
+                    timer.record(time.perf_counter() - time_start)
+            if self._provider._get_status_code(result) in self._provider.RETRYABLE_STATUS_CODES:
+                raise RetryableError(result['status'], result=result)
+            return result
+        try:
+            result = await self._provider.get_retry_policy().execute_async(attempt, self._provider._circuit_breaker)
+        except RetryableError as e:
+            result = e.get_result()
+            if result is None:
+                return None
+        except (CircuitOpenError, ProtocolError) as e:
+            log.debug('Query failed: {} {}'.format(type(e), e.args))
+            return None
+        self._last_time = self._provider._now()
+        return result
+
+
 class OpenSubtitlesTextQuery(SubtitleTextQuery):
     def get_movies(self):
         return self._movies
@@ -541,10 +1435,17 @@ class OpenSubtitlesTextQuery(SubtitleTextQuery):
             return True
         return len(self._movies) < self._total
 
-    def __init__(self, query):
+    def __init__(self, query, retry_policy=None, circuit_breaker=None, rate_limiter=None):
         SubtitleTextQuery.__init__(self, query)
         self._movies = []
         self._total = None
+        # Number of movies per page, as reported by the server.
+        self._page_size = None
+        # Tuple of offset and Future of the prefetched page of movies.
+        self._prefetch = None
+        self._retry_policy = RetryPolicy() if retry_policy is None else retry_policy
+        self._circuit_breaker = circuit_breaker
+        self._rate_limiter = rate_limiter
 
     def search_online(self):
         raise NotImplementedError()
@@ -558,12 +1459,95 @@ class OpenSubtitlesTextQuery(SubtitleTextQuery):
             log.debug('Query failed: {} {}'.format(type(e), e.args))
             return default
 
+    PAGE_WORKERS = 4
+
     def search_more_movies(self):
         if not self.more_movies_available():
             return []
 
+        offset = len(self._movies)
+        page = self._take_prefetched_page(offset)
+        if page is None:
+            page = self._fetch_movie_page(offset)
+        return self._add_movie_page(offset, page)
+
+    def iter_more_movie_pages(self):
+        """
+        Search all remaining movies.
+        Once the first page has told the number of movies per page, the offsets of the remaining pages are known:
+        they are fetched concurrently, by up to PAGE_WORKERS workers.
+        :return: generator of lists of RemoteMovie, in order of the pages
+        :raise OpenSubtitlesProviderConnectionError: when a page cannot be fetched.
+            The movies of the pages yielded before have been added.
+        """
+        if not self.more_movies_available():
+            return
+        yield self.search_more_movies()
+        if not self.more_movies_available() or not self._page_size:
+            return
+
+        offsets = list(range(len(self._movies), self._total, self._page_size))
+        log.debug('Fetching {} pages of movies concurrently'.format(len(offsets)))
+        executor = ThreadPoolExecutor(max_workers=self.PAGE_WORKERS)
+        futures = [executor.submit(self._fetch_movie_page, offset) for offset in offsets]
+        try:
+            for offset, future in zip(offsets, futures):
+                yield self._add_movie_page(offset, future.result())
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def prefetch_more_movies(self):
+        """
+        Start fetching the next page of movies in the background. The next search_more_movies will use it.
+        """
+        if not self.more_movies_available():
+            return
+        offset = len(self._movies)
+        if self._prefetch is not None and self._prefetch[0] == offset:
+            return
+        future = Future()
+
+        def prefetch():
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(self._fetch_movie_page(offset))
+            except Exception as e:
+                future.set_exception(e)
+        thread = threading.Thread(target=prefetch, name='opensubtitles-prefetch')
+        thread.daemon = True
+        thread.start()
+        self._prefetch = offset, future
+
+    def _take_prefetched_page(self, offset):
+        """
+        Take the prefetched page of movies, waiting for it if it is still being fetched.
+        :param offset: offset of the page needed
+        :return: tuple as returned by _fetch_movie_page, None if no usable page has been prefetched
+        """
+        if self._prefetch is None:
+            return None
+        prefetch_offset, future = self._prefetch
+        self._prefetch = None
+        if prefetch_offset != offset:
+            return None
+        try:
+            return future.result()
+        except ProviderConnectionError as e:
+            log.debug('Prefetching movies failed: {}'.format(e.get_msg()))
+            return None
+
+    def _fetch_movie_page(self, offset):
+        """
+        Fetch and parse one page of movies. Does not modify this query, so it can run in any thread.
+        :param offset: number of movies before the page
+        :return: tuple of list of RemoteMovie, number of movies up to and including this page
+            and total number of movies
+        :raise OpenSubtitlesProviderConnectionError: when the page cannot be fetched or parsed
+        """
         xml_url = 'http://www.opensubtitles.org/en/search2/moviename-{text_quoted}/offset-{offset}/xml'.format(
-            offset=len(self._movies),
+            offset=offset,
             text_quoted=quote(self.query))
 
         xml_page = self._fetch_url(xml_url)
@@ -572,9 +1556,21 @@ class OpenSubtitlesTextQuery(SubtitleTextQuery):
 
         movies, nb_so_far, nb_provider = self._xml_to_movies(xml_page)
         if movies is None:
+            self._forget_url(xml_url)
             raise OpenSubtitlesProviderConnectionError(None, 'Failed to extract movies from data at {!r}'.format(xml_url))
+        return movies, nb_so_far, nb_provider
 
+    def _add_movie_page(self, offset, page):
+        """
+        Add a page of movies to this query.
+        :param offset: offset of the page
+        :param page: tuple as returned by _fetch_movie_page
+        :return: list of RemoteMovie of the page
+        """
+        movies, nb_so_far, nb_provider = page
         self._total = nb_provider
+        if nb_so_far > offset:
+            self._page_size = nb_so_far - offset
         self._movies.extend(movies)
 
         if len(self._movies) != nb_so_far:
@@ -597,6 +1593,7 @@ class OpenSubtitlesTextQuery(SubtitleTextQuery):
 
         subtitles, nb_so_far, nb_provider = self._xml_to_subtitles(xml_contents)
         if subtitles is None:
+            self._forget_url(xml_url)
             raise OpenSubtitlesProviderConnectionError(None, 'Failed to load subtitles from xml at {!r}'.format(xml_url))
 
         movie.add_subtitles(subtitles)
@@ -604,59 +1601,44 @@ class OpenSubtitlesTextQuery(SubtitleTextQuery):
         return subtitles
 
     def _xml_to_movies(self, xml):
-        subtitle_entries, nb_so_far, nb_provider = self._extract_subtitle_entries(xml)
-        if subtitle_entries is None:
-            return None, None, None
-
-        movies = []
-        for subtitle_entry in subtitle_entries:
-            try:
-                ads_entries = subtitle_entry.getElementsByTagName('ads1')
-                if ads_entries:
-                    continue
-
-                def try_get_firstchild_data(key, default):
-                    try:
-                        return subtitle_entry.getElementsByTagName(key)[0].firstChild.data
-                    except (AttributeError, IndexError):
-                        return default
-                movie_id_entries = subtitle_entry.getElementsByTagName('MovieID')
-                movie_id = movie_id_entries[0].firstChild.data
-                movie_id_link = movie_id_entries[0].getAttribute('Link')
-                # movie_thumb = subtitle_entry.getElementsByTagName('MovieThumb')[0].firstChild.data
-                # link_use_next = subtitle_entry.getElementsByTagName('LinkUseNext')[0].firstChild.data
-                # link_zoozle = subtitle_entry.getElementsByTagName('LinkZoozle')[0].firstChild.data
-                # link_boardreader = subtitle_entry.getElementsByTagName('LinkBoardreader')[0].firstChild.data
-                movie_name = try_get_firstchild_data('MovieName', None)
-                movie_year = try_get_firstchild_data('MovieYear', None)
-                try:
-                    movie_imdb_rating = float(
-                        subtitle_entry.getElementsByTagName('MovieImdbRating')[0].getAttribute('Percent')) / 10
-                except AttributeError:
-                    movie_imdb_rating = None
-                # try:
-                #     movie_imdb_link = movie_id_entries[0].getAttribute('LinkImdb')
-                # except AttributeError:
-                #     movie_imdb_link = None
-                movie_imdb_id = try_get_firstchild_data('MovieImdbID', None)
-                subs_total = int(subtitle_entry.getElementsByTagName('TotalSubs')[0].firstChild.data)
-                # newest = subtitle_entry.getElementsByTagName('Newest')[0].firstChild.data
-
-                imdb_identity = ImdbIdentity(imdb_id=movie_imdb_id, imdb_rating=movie_imdb_rating)
-                video_identity = VideoIdentity(name=movie_name, year=movie_year)
-                identity = ProviderIdentities(video_identity=video_identity, imdb_identity=imdb_identity, provider=self)
-
-                movie = RemoteMovie(
-                    subtitles_nb_total=subs_total, provider_link=movie_id_link, provider_id=movie_id,
-                    identities=identity
-                )
-
-                movies.append(movie)
-            except (AttributeError, IndexError, ValueError) as e:
-                log.warning('subtitle_entry={}'.format(subtitle_entry.toxml()))
-                log.warning('XML entry has invalid format: {} {}'.format(type(e), e.args))
-
-        return movies, nb_so_far, nb_provider
+        return self._parse_subtitle_entries(xml, self._xml_entry_to_movie)
+
+    def _xml_entry_to_movie(self, subtitle_entry):
+        """
+        Build a movie from an entry of a movie search page.
+        :param subtitle_entry: _XmlSubtitleEntry
+        :return: RemoteMovie or None to skip the entry
+        """
+        try:
+            if subtitle_entry.has('ads1'):
+                return None
+
+            movie_id = subtitle_entry.get_text('MovieID')
+            movie_id_link = subtitle_entry.get_attribute('MovieID', 'Link')
+            # movie_thumb = subtitle_entry.get_text('MovieThumb')
+            # link_use_next = subtitle_entry.get_text('LinkUseNext')
+            # link_zoozle = subtitle_entry.get_text('LinkZoozle')
+            # link_boardreader = subtitle_entry.get_text('LinkBoardreader')
+            movie_name = subtitle_entry.try_get_text('MovieName', None)
+            movie_year = subtitle_entry.try_get_text('MovieYear', None)
+            movie_imdb_rating = float(subtitle_entry.get_attribute('MovieImdbRating', 'Percent')) / 10
+            # movie_imdb_link = subtitle_entry.get_attribute('MovieID', 'LinkImdb')
+            movie_imdb_id = subtitle_entry.try_get_text('MovieImdbID', None)
+            subs_total = int(subtitle_entry.get_text('TotalSubs'))
+            # newest = subtitle_entry.get_text('Newest')
+
+            imdb_identity = ImdbIdentity(imdb_id=movie_imdb_id, imdb_rating=movie_imdb_rating)
+            video_identity = VideoIdentity(name=movie_name, year=movie_year)
+            identity = ProviderIdentities(video_identity=video_identity, imdb_identity=imdb_identity, provider=self)
+
+            return RemoteMovie(
+                subtitles_nb_total=subs_total, provider_link=movie_id_link, provider_id=movie_id,
+                identities=identity
+            )
+        except (AttributeError, IndexError, ValueError) as e:
+            log.warning('subtitle_entry={}'.format(subtitle_entry.to_xml()))
+            log.warning('XML entry has invalid format: {} {}'.format(type(e), e.args))
+            return None
 
     @staticmethod
     def cleanup_string(name, alt='_'):
@@ -665,134 +1647,213 @@ class OpenSubtitlesTextQuery(SubtitleTextQuery):
         return ''.join(c if c in valid else alt for c in name)
 
     def _xml_to_subtitles(self, xml):
-        subtitle_entries, nb_so_far, nb_provider = self._extract_subtitle_entries(xml)
-        if subtitle_entries is None:
-            return None, None, None
-
-        subtitles = []
-        for subtitle_entry in subtitle_entries:
-            try:
-                ads_entries = subtitle_entry.getElementsByTagName('ads1') or subtitle_entry.getElementsByTagName('ads2')
-                if ads_entries:
-                    continue
-
-                def try_get_first_child_data(key, default):
-                    try:
-                        return subtitle_entry.getElementsByTagName(key)[0].firstChild.data
-                    except (AttributeError, IndexError):
-                        return default
+        return self._parse_subtitle_entries(xml, self._xml_entry_to_subtitle)
+
+    def _xml_entry_to_subtitle(self, subtitle_entry):
+        """
+        Build a subtitle from an entry of a subtitle search page.
+        :param subtitle_entry: _XmlSubtitleEntry
+        :return: OpenSubtitlesSubtitleFile or None to skip the entry
+        """
+        try:
+            if subtitle_entry.has('ads1') or subtitle_entry.has('ads2'):
+                return None
 
-                subtitle_id_entry = subtitle_entry.getElementsByTagName('IDSubtitle')[0]
-                # subtitle_id = subtitle_id_entry.firstChild.data
-                subtitle_link = 'http://www.opensubtitles.org' + subtitle_id_entry.getAttribute('Link')
-                subtitle_uuid = subtitle_id_entry.getAttribute('uuid')
+            # subtitle_id = subtitle_entry.get_text('IDSubtitle')
+            subtitle_link = 'http://www.opensubtitles.org' + subtitle_entry.get_attribute('IDSubtitle', 'Link')
+            subtitle_uuid = subtitle_entry.get_attribute('IDSubtitle', 'uuid')
 
-                subtitlefile_id = subtitle_entry.getElementsByTagName('IDSubtitleFile')[0].firstChild.data
+            subtitlefile_id = subtitle_entry.get_text('IDSubtitleFile')
 
-                user_entry = subtitle_entry.getElementsByTagName('UserID')[0]
-                user_id = int(user_entry.firstChild.data)
-                # user_link = 'http://www.opensubtitles.org' + user_entry.getAttribute('Link')
-                user_nickname = try_get_first_child_data('UserNickName', None)
+            user_id = int(subtitle_entry.get_text('UserID'))
+            # user_link = 'http://www.opensubtitles.org' + subtitle_entry.get_attribute('UserID', 'Link')
+            user_nickname = subtitle_entry.try_get_text('UserNickName', None)
 
-                # comment = try_get_first_child_data(''SubAuthorComment', None)
+            # comment = subtitle_entry.try_get_text('SubAuthorComment', None)
 
-                language_entry = subtitle_entry.getElementsByTagName('ISO639')[0]
-                language_iso639 = language_entry.firstChild.data
-                # language_link_search = 'http://www.opensubtitles.org' + language_entry.getAttribute('LinkSearch')
-                # language_flag = 'http:' + language_entry.getAttribute('flag')
+            language_iso639 = subtitle_entry.get_text('ISO639')
+            # language_link_search = 'http://www.opensubtitles.org' + \
+            #     subtitle_entry.get_attribute('ISO639', 'LinkSearch')
+            # language_flag = 'http:' + subtitle_entry.get_attribute('ISO639', 'flag')
 
-                # language_name = try_get_first_child_data('LanguageName', None)
+            # language_name = subtitle_entry.try_get_text('LanguageName', None)
 
-                subtitle_format = try_get_first_child_data('SubFormat', 'srt')
-                # subtitle_nbcds = int(try_get_first_child_data('SubSumCD', -1))
-                subtitle_add_date_locale = subtitle_entry.getElementsByTagName('SubAddDate')[0].getAttribute('locale')
-                subtitle_add_date = datetime.datetime.strptime(subtitle_add_date_locale, '%d/%m/%Y %H:%M:%S')
-                # subtitle_bad = int(subtitle_entry.getElementsByTagName('SubBad')[0].firstChild.data)
-                subtitle_rating = float(subtitle_entry.getElementsByTagName('SubRating')[0].firstChild.data)
-                subtitle_file_size = int(subtitle_entry.getElementsByTagName('SubSize')[0].firstChild.data)
+            subtitle_format = subtitle_entry.try_get_text('SubFormat', 'srt')
+            # subtitle_nbcds = int(subtitle_entry.try_get_text('SubSumCD', -1))
+            subtitle_add_date_locale = subtitle_entry.get_attribute('SubAddDate', 'locale')
+            subtitle_add_date = datetime.datetime.strptime(subtitle_add_date_locale, '%d/%m/%Y %H:%M:%S')
+            # subtitle_bad = int(subtitle_entry.get_text('SubBad'))
+            subtitle_rating = float(subtitle_entry.get_text('SubRating'))
+            subtitle_file_size = int(subtitle_entry.get_text('SubSize'))
 
-                # download_count = int(try_get_first_child_data('SubDownloadsCnt', -1))
-                # subtitle_movie_aka = try_get_first_child_data('SubMovieAka', None)
+            # download_count = int(subtitle_entry.try_get_text('SubDownloadsCnt', -1))
+            # subtitle_movie_aka = subtitle_entry.try_get_text('SubMovieAka', None)
 
-                # subtitle_comments = int(try_get_first_child_data('SubComments', -1))
-                # subtitle_total = int(try_get_first_child_data('TotalSubs', -1)) #PRESENT?
-                # subtitle_newest = try_get_first_child_data('Newest', None) #PRESENT?
+            # subtitle_comments = int(subtitle_entry.try_get_text('SubComments', -1))
+            # subtitle_total = int(subtitle_entry.try_get_text('TotalSubs', -1)) #PRESENT?
+            # subtitle_newest = subtitle_entry.try_get_text('Newest', None) #PRESENT?
 
-                language = Language.from_xx(language_iso639)
+            language = Language.from_xx(language_iso639)
 
-                movie_release_name = try_get_first_child_data('MovieReleaseName', None)
-                if movie_release_name is None:
-                    movie_release_name = try_get_first_child_data('MovieName', None)
+            movie_release_name = subtitle_entry.try_get_text('MovieReleaseName', None)
+            if movie_release_name is None:
+                movie_release_name = subtitle_entry.try_get_text('MovieName', None)
 
-                if movie_release_name is None:
-                    log.warning('Skipping subtitle: no movie release name or movie name')
-                    continue
+            if movie_release_name is None:
+                log.warning('Skipping subtitle: no movie release name or movie name')
+                return None
 
-                movie_release_name = self.cleanup_string(movie_release_name)
+            movie_release_name = self.cleanup_string(movie_release_name)
 
-                filename = '{}.{}'.format(movie_release_name, subtitle_format)
+            filename = '{}.{}'.format(movie_release_name, subtitle_format)
 
-                download_link = None  # 'https://www.opensubtitles.org/en/subtitleserve/sub/{}'.format(subtitle_id)
-                if user_nickname:
-                    uploader = user_nickname
-                elif user_id != 0:
-                    uploader = str(user_id)
-                else:
-                    uploader = None
-                subtitle = OpenSubtitlesSubtitleFile(filename=filename, file_size=subtitle_file_size,
-                                                     md5_hash=subtitle_uuid, id_online=subtitlefile_id,
-                                                     download_link=download_link, link=subtitle_link, uploader=uploader,
-                                                     language=language, rating=subtitle_rating, date=subtitle_add_date)
-                subtitles.append(subtitle)
-            except (AttributeError, IndexError, ValueError) as e:
-                log.warning('subtitle_entry={}'.format(subtitle_entry.toxml()))
-                log.warning('XML entry has invalid format: {} {}'.format(type(e), e.args))
-
-        return subtitles, nb_so_far, nb_provider
+            download_link = None  # 'https://www.opensubtitles.org/en/subtitleserve/sub/{}'.format(subtitle_id)
+            if user_nickname:
+                uploader = user_nickname
+            elif user_id != 0:
+                uploader = str(user_id)
+            else:
+                uploader = None
+            return OpenSubtitlesSubtitleFile(filename=filename, file_size=subtitle_file_size,
+                                             md5_hash=subtitle_uuid, id_online=subtitlefile_id,
+                                             download_link=download_link, link=subtitle_link, uploader=uploader,
+                                             language=language, rating=subtitle_rating, date=subtitle_add_date)
+        except (AttributeError, IndexError, ValueError) as e:
+            log.warning('subtitle_entry={}'.format(subtitle_entry.to_xml()))
+            log.warning('XML entry has invalid format: {} {}'.format(type(e), e.args))
+            return None
 
     @staticmethod
-    def _extract_subtitle_entries(raw_xml):
-        entries = []
+    def _parse_subtitle_entries(raw_xml, entry_handler):
+        """
+        Parse a search2 XML page in one pass.
+        The subtitle entries are the subtitle elements of the first results element with valid item counts.
+        Every entry is passed to entry_handler once it is complete, and freed afterwards.
+        :param raw_xml: XML page as bytes
+        :param entry_handler: callable accepting an _XmlSubtitleEntry, returning an object or None to skip the entry
+        :return: tuple of list of objects returned by entry_handler, number of entries up to and including this page
+            and total number of entries. (None, None, None) if the page is not valid XML
+        """
+        objects = []
         nb_so_far = 0
         nb_total = 0
-        from xml.dom import minidom
-        import xml.parsers.expat
-        log.debug('extract_subtitle_entries() ...')
+        log.debug('parse_subtitle_entries() ...')
+        if isinstance(raw_xml, str):
+            raw_xml = raw_xml.encode('utf-8')
+        # Open elements, from the root to the current element.
+        stack = []
+        results = None
+        results_done = False
+        entry = None
         try:
-            # FIXME: use xpath
-            dom = minidom.parseString(raw_xml)
-            opensubtitles_entries = dom.getElementsByTagName('opensubtitles')
-            for opensubtitles_entry in opensubtitles_entries:
-                results_entries = opensubtitles_entry.getElementsByTagName('results')
-                for results_entry in results_entries:
-                    try:
-                        nb_so_far = int(results_entry.getAttribute('items'))
-                        nb_total = int(results_entry.getAttribute('itemsfound'))
-                        entries = results_entry.getElementsByTagName('subtitle')
-                        break
-                    except ValueError:
-                        continue
-            if entries is None:
-                log.debug('... extraction FAILED: no entries found, maybe no subtitles on page!')
-            else:
-                log.debug('... extraction SUCCESS')
-        except (AttributeError, ValueError, xml.parsers.expat.ExpatError) as e:
+            for event, element in ElementTree.iterparse(io.BytesIO(raw_xml), events=('start', 'end', )):
+                if event == 'start':
+                    if entry is not None:
+                        entry.add_descendant(element)
+                    elif results is not None and not results_done:
+                        if element.tag == 'subtitle':
+                            entry = _XmlSubtitleEntry(element)
+                    elif results is None and element.tag == 'results' and \
+                            any(parent.tag == 'opensubtitles' for parent in stack):
+                        try:
+                            nb_so_far = int(element.get('items', ''))
+                            nb_total = int(element.get('itemsfound', ''))
+                            results = element
+                        except ValueError:
+                            pass
+                    stack.append(element)
+                    continue
+                stack.pop()
+                if entry is not None and element is entry.element:
+                    obj = entry_handler(entry)
+                    if obj is not None:
+                        objects.append(obj)
+                    entry = None
+                    element.clear()
+                    stack[-1].remove(element)
+                elif element is results:
+                    results_done = True
+        except (ElementTree.ParseError, ExpatError) as e:
             log.debug('... extraction FAILED (xml error): {} {}'.format(type(e), e.args))
-            nb_so_far = None
-            entries = None
-        return entries, nb_so_far, nb_total
+            return None, None, None
+        log.debug('... extraction SUCCESS')
+        return objects, nb_so_far, nb_total
 
-    @staticmethod
-    def _fetch_url(url):
+    def _fetch_url(self, url):
         try:
             log.debug('Fetching data from {}...'.format(url))
-            page = urlopen(url).read()
+            page = fetch_url(url, self._retry_policy, self._circuit_breaker, rate_limiter=self._rate_limiter,
+                             cache=get_default_http_response_cache(), timeout=OpenSubtitles.READ_TIMEOUT)
             log.debug('... SUCCESS')
-        except HTTPError as e:
+        except (HTTPError, RetryableError, CircuitOpenError, SocketError, EOFError, zlib.error) as e:
             log.debug('... FAILED: {} {}'.format(type(e), e.args))
             return None
         return page
 
+    @staticmethod
+    def _forget_url(url):
+        """
+        Remove the cached response of an url, because its contents are invalid.
+        :param url: url as string
+        """
+        http_cache = get_default_http_response_cache()
+        if http_cache is not None:
+            http_cache.remove_response(url)
+
+
+class _XmlSubtitleEntry(object):
+    """
+    Subtitle entry of a search2 XML page.
+    Looking up a tag returns the first element with that tag in the subtree of the entry.
+    """
+    def __init__(self, element):
+        self.element = element
+        self._tag_elements = {}
+
+    def add_descendant(self, element):
+        self._tag_elements.setdefault(element.tag, element)
+
+    def has(self, tag):
+        return tag in self._tag_elements
+
+    def _get_element(self, tag):
+        try:
+            return self._tag_elements[tag]
+        except KeyError:
+            raise IndexError(tag)
+
+    def get_text(self, tag):
+        """
+        Get the text of an element.
+        :param tag: tag of the element
+        :return: text as string
+        :raise IndexError: when the entry has no element with this tag
+        :raise AttributeError: when the element has no text
+        """
+        text = self._get_element(tag).text
+        if text is None:
+            raise AttributeError(tag)
+        return text
+
+    def try_get_text(self, tag, default):
+        try:
+            return self.get_text(tag)
+        except (AttributeError, IndexError):
+            return default
+
+    def get_attribute(self, tag, name):
+        """
+        Get an attribute of an element.
+        :param tag: tag of the element
+        :param name: name of the attribute
+        :return: value of the attribute, empty string if the element does not have the attribute
+        :raise IndexError: when the entry has no element with this tag
+        """
+        return self._get_element(tag).get(name, '')
+
+    def to_xml(self):
+        return ElementTree.tostring(self.element, encoding='unicode')
+
 
 DEFAULT_USER_AGENT = ''
 
@@ -803,11 +1864,29 @@ def set_default_user_agent(user_agent):
 
 
 class OpenSubtitlesSettings(ProviderSettings):
-    def __init__(self, username='', password='', user_agent=None):
+    DEFAULT_SEARCH_WORKERS = 4
+    # The server allows 40 requests per 10 seconds and 200 downloads per day for registered users.
+    DEFAULT_REQUEST_RATE = 4.
+    DEFAULT_DOWNLOAD_QUOTA = 200
+
+    def __init__(self, username='', password='', user_agent=None, search_workers=None, request_rate=None,
+                 download_quota=None):
+        """
+        Create new settings for the OpenSubtitles provider.
+        :param username: user name
+        :param password: password
+        :param user_agent: user agent (None for the default)
+        :param search_workers: maximum number of search requests in flight (None for the default)
+        :param request_rate: maximum number of requests per second, 0 for no limit (None for the default)
+        :param download_quota: maximum number of downloads per day, 0 for no limit (None for the default)
+        """
         ProviderSettings.__init__(self)
         self._username = username
         self._password = password
         self._user_agent = DEFAULT_USER_AGENT if user_agent is None else user_agent
+        self._search_workers = self.DEFAULT_SEARCH_WORKERS if search_workers is None else max(1, search_workers)
+        self._request_rate = self.DEFAULT_REQUEST_RATE if request_rate is None else max(0., request_rate)
+        self._download_quota = self.DEFAULT_DOWNLOAD_QUOTA if download_quota is None else max(0, download_quota)
 
     @property
     def username(self):
@@ -818,13 +1897,29 @@ class OpenSubtitlesSettings(ProviderSettings):
         return self._password
 
     @classmethod
-    def load(cls, username, password):
-        return cls(username=str(username), password=str(password))
+    def load(cls, username, password, search_workers=None, request_rate=None, download_quota=None):
+        return cls(username=str(username), password=str(password),
+                   search_workers=cls._load_number(int, search_workers),
+                   request_rate=cls._load_number(float, request_rate),
+                   download_quota=cls._load_number(int, download_quota))
+
+    @staticmethod
+    def _load_number(number_type, value):
+        if value is None:
+            return None
+        try:
+            return number_type(value)
+        except ValueError:
+            log.warning('Invalid setting "{}": using default'.format(value))
+            return None
 
     def as_dict(self):
         return {
             'username': self._username,
             'password': self._password,
+            'search_workers': str(self._search_workers),
+            'request_rate': str(self._request_rate),
+            'download_quota': str(self._download_quota),
         }
 
     @staticmethod
@@ -832,11 +1927,23 @@ class OpenSubtitlesSettings(ProviderSettings):
         return {
             'username': ProviderSettingsType.String,
             'password': ProviderSettingsType.Password,
+            'search_workers': ProviderSettingsType.String,
+            'request_rate': ProviderSettingsType.String,
+            'download_quota': ProviderSettingsType.String,
         }
 
     def get_user_agent(self):
         return self._user_agent
 
+    def get_search_workers(self):
+        return self._search_workers
+
+    def get_request_rate(self):
+        return self._request_rate
+
+    def get_download_quota(self):
+        return self._download_quota
+
 
 class OpenSubtitlesSubtitleFile(RemoteSubtitleFile):
     def __init__(self, filename, file_size, md5_hash, id_online, download_link,
@@ -869,19 +1976,28 @@ class OpenSubtitlesSubtitleFile(RemoteSubtitleFile):
 
     def download(self, target_path, provider_instance, callback):
         if self._download_link is None:
-            stream = self._download_service(provider_instance)
+            provider_instance.write_subtitles([(self, target_path)])
         else:
-            stream = unzip_stream(self._download_http())
-        write_stream(src_file=stream, destination_path=target_path)
+            write_stream(src_file=self._download_http_cached(provider_instance), destination_path=target_path)
         local_sub = LocalSubtitleFile(filepath=target_path)
         return local_sub
 
-    def _download_service(self, provider_instance):
-        subs = provider_instance.download_subtitles([self])
-        return io.BytesIO(subs[0])
-
-    def _download_http(self):
-        sub_stream = urlopen(self._download_link)
+    def _download_http_cached(self, provider_instance):
+        download_cache = get_default_subtitle_download_cache()
+        if download_cache is None:
+            return unzip_stream(self._download_http(provider_instance))
+        contents = provider_instance._load_cached_subtitle(download_cache, self)
+        if contents is None:
+            data = self._download_http(provider_instance).read()
+            contents = unzip_bytes(data).read()
+            provider_instance._store_cached_subtitle(download_cache, self, data, hashlib.md5(contents).hexdigest())
+        return io.BytesIO(contents)
+
+    def _download_http(self, provider_instance):
+        download_quota = provider_instance.get_download_quota()
+        download_quota.check()
+        sub_stream = provider_instance._urlopen(self._download_link)
+        download_quota.add()
         return sub_stream
 
 
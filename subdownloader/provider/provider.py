@@ -1,9 +1,14 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
 
+import asyncio
 from enum import Enum
 import logging
+from pathlib import Path
 import sys
+import tempfile
+
+from subdownloader.callback import ProgressCallback
 
 log = logging.getLogger('subdownloader.provider.provider')
 
@@ -31,6 +36,24 @@ class ProviderNotConnectedError(ProviderConnectionError):
         ProviderConnectionError.__init__(self, _('Not connected'))
 
 
+class ProviderQuotaExceededError(ProviderConnectionError):
+    def __init__(self, limit):
+        ProviderConnectionError.__init__(self, _('Daily download limit of {} subtitles reached').format(limit))
+        self._limit = limit
+
+    def get_limit(self):
+        return self._limit
+
+
+class ProviderTimeoutError(ProviderConnectionError):
+    def __init__(self, timeout):
+        ProviderConnectionError.__init__(self, _('No response within {} seconds').format(timeout))
+        self._timeout = timeout
+
+    def get_timeout(self):
+        return self._timeout
+
+
 # FIXME: let providers implement interfaces for these capabilities
 class ProviderCapability(Enum):
     SEARCH_VIDEO_FILE = 'search_videofile'
@@ -87,12 +110,41 @@ class SubtitleProvider(object):
     def upload_subtitles(self, local_movie):
         raise NotImplementedError()
 
+    def iter_write_subtitles(self, rsub_paths):
+        """
+        Download subtitles of this provider and write them to their target paths.
+        This implementation downloads the subtitles one by one:
+        providers override it to download multiple subtitles per request.
+        :param rsub_paths: list of tuples of RemoteSubtitleFile and target path
+        :return: generator of tuples of RemoteSubtitleFile and LocalSubtitleFile, yielded when written
+        :raise ProviderConnectionError: when a download fails. The subtitles yielded before have been written.
+        """
+        for rsub, target_path in rsub_paths:
+            yield rsub, rsub.download(target_path=target_path, provider_instance=self, callback=ProgressCallback())
+
     def ping(self):
         raise NotImplementedError()
 
     def provider_info(self):
         raise NotImplementedError()
 
+    def get_adaptive_windows(self):
+        """
+        Get the batch sizes learned by this provider, so they can be persisted.
+        :return: list of AdaptiveWindow objects
+        """
+        return []
+
+    def create_async_provider(self, executor=None):
+        """
+        Create an AsyncSubtitleProvider sharing the settings of this provider.
+        This implementation runs the blocking member functions of this provider in an executor:
+        providers override it to return a native asyncio implementation.
+        :param executor: concurrent.futures.Executor (None for the default executor of the event loop)
+        :return: AsyncSubtitleProvider
+        """
+        return AsyncProviderAdapter(self, executor=executor)
+
     # @classmethod
     # def supports_mode(cls, method):
     #     raise NotImplementedError()
@@ -110,6 +162,131 @@ class SubtitleProvider(object):
         raise NotImplementedError()
 
 
+class AsyncSubtitleProvider(object):
+    """
+    Represents an abstract SubtitleProvider for asyncio.
+    The member functions doing network requests are coroutines, so many requests can share one event loop.
+    Create one with SubtitleProvider.create_async_provider.
+    """
+    def __init__(self, provider):
+        """
+        Create a new AsyncSubtitleProvider.
+        :param provider: SubtitleProvider whose settings are used
+        """
+        self._provider = provider
+
+    @property
+    def provider(self):
+        return self._provider
+
+    async def connect(self):
+        raise NotImplementedError()
+
+    async def disconnect(self):
+        raise NotImplementedError()
+
+    def connected(self):
+        raise NotImplementedError()
+
+    async def login(self):
+        raise NotImplementedError()
+
+    async def logout(self):
+        raise NotImplementedError()
+
+    def logged_in(self):
+        raise NotImplementedError()
+
+    async def search_videos(self, videos, callback, languages=None):
+        raise NotImplementedError()
+
+    async def query_text(self, query):
+        raise NotImplementedError()
+
+    async def download_subtitles(self, rsubs):
+        """
+        Download the contents of subtitles.
+        :param rsubs: list of RemoteSubtitleFile
+        :return: list of contents as bytes, in order of rsubs
+        """
+        raise NotImplementedError()
+
+    async def upload_subtitles(self, local_movie):
+        raise NotImplementedError()
+
+    async def ping(self):
+        raise NotImplementedError()
+
+    async def provider_info(self):
+        raise NotImplementedError()
+
+    def get_name(self):
+        return self._provider.get_name()
+
+
+class AsyncProviderAdapter(AsyncSubtitleProvider):
+    """
+    AsyncSubtitleProvider running the blocking member functions of a SubtitleProvider in an executor.
+    The ProgressCallback passed to search_videos is called from a thread of the executor.
+    """
+    def __init__(self, provider, executor=None):
+        """
+        Create a new AsyncProviderAdapter.
+        :param provider: SubtitleProvider
+        :param executor: concurrent.futures.Executor (None for the default executor of the event loop)
+        """
+        AsyncSubtitleProvider.__init__(self, provider)
+        self._executor = executor
+
+    async def _run(self, function, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, function, *args)
+
+    async def connect(self):
+        await self._run(self._provider.connect)
+
+    async def disconnect(self):
+        await self._run(self._provider.disconnect)
+
+    def connected(self):
+        return self._provider.connected()
+
+    async def login(self):
+        await self._run(self._provider.login)
+
+    async def logout(self):
+        await self._run(self._provider.logout)
+
+    def logged_in(self):
+        return self._provider.logged_in()
+
+    async def search_videos(self, videos, callback, languages=None):
+        if languages is None:
+            return await self._run(self._provider.search_videos, videos, callback)
+        return await self._run(self._provider.search_videos, videos, callback, languages)
+
+    async def query_text(self, query):
+        return AsyncSubtitleTextQuery(self._provider.query_text(query), executor=self._executor)
+
+    async def download_subtitles(self, rsubs):
+        def download():
+            # The synchronous interface writes subtitles to files.
+            with tempfile.TemporaryDirectory() as tmpdir:
+                rsub_paths = [(rsub, Path(tmpdir) / str(rsub_i)) for rsub_i, rsub in enumerate(rsubs)]
+                for _rsub, _local_sub in self._provider.iter_write_subtitles(rsub_paths):
+                    pass
+                return [path.read_bytes() for _rsub, path in rsub_paths]
+        return await self._run(download)
+
+    async def upload_subtitles(self, local_movie):
+        return await self._run(self._provider.upload_subtitles, local_movie)
+
+    async def ping(self):
+        await self._run(self._provider.ping)
+
+    async def provider_info(self):
+        return await self._run(self._provider.provider_info)
+
+
 class ProviderSettingsType(Enum):
     String = 'string'
     Password = 'password'
@@ -150,10 +327,69 @@ class SubtitleTextQuery(object):
     def search_more_movies(self):
         raise NotImplementedError()
 
+    def iter_more_movie_pages(self):
+        """
+        Search all remaining movies.
+        This implementation searches the pages one after another: providers override it to fetch pages concurrently.
+        :return: generator of lists of movies, in order of the pages
+        """
+        while self.more_movies_available():
+            yield self.search_more_movies()
+
+    def prefetch_more_movies(self):
+        """
+        Start searching the next movies in the background, so the next search_more_movies returns sooner.
+        This implementation does nothing.
+        """
+        pass
+
     def search_more_subtitles(self, movie):
         raise NotImplementedError()
 
 
+class AsyncSubtitleTextQuery(object):
+    """
+    SubtitleTextQuery for asyncio: the searches run in an executor.
+    """
+    def __init__(self, text_query, executor=None):
+        """
+        Create a new AsyncSubtitleTextQuery.
+        :param text_query: SubtitleTextQuery
+        :param executor: concurrent.futures.Executor (None for the default executor of the event loop)
+        """
+        self._text_query = text_query
+        self._executor = executor
+
+    @property
+    def text_query(self):
+        return self._text_query
+
+    @property
+    def query(self):
+        return self._text_query.query
+
+    def get_movies(self):
+        return self._text_query.get_movies()
+
+    def get_nb_movies_online(self):
+        return self._text_query.get_nb_movies_online()
+
+    def more_movies_available(self):
+        return self._text_query.more_movies_available()
+
+    async def search_more_movies(self):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, self._text_query.search_more_movies)
+
+    async def search_all_movies(self):
+        def search_all():
+            return [movie for movies in self._text_query.iter_more_movie_pages() for movie in movies]
+        return await asyncio.get_event_loop().run_in_executor(self._executor, search_all)
+
+    async def search_more_subtitles(self, movie):
+        return await asyncio.get_event_loop().run_in_executor(self._executor, self._text_query.search_more_subtitles,
+                                                              movie)
+
+
 class UploadResult(object):
     class Type(Enum):
         OK = 0
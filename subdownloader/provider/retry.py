@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+
+import asyncio
+import logging
+import random
+from socket import error as SocketError
+import threading
+import time
+from urllib.error import HTTPError, URLError
+from urllib.request import urlopen
+
+from subdownloader.provider.provider import ProviderConnectionError
+
+log = logging.getLogger('subdownloader.provider.retry')
+
+
+class RetryableError(Exception):
+    """
+    Raised by a call to signal a transient failure, that can be solved by trying again.
+    """
+    def __init__(self, cause, result=None):
+        """
+        Create a new RetryableError.
+        :param cause: exception or message describing the failure
+        :param result: result of the call, when the server answered with a transient error status
+        """
+        Exception.__init__(self, cause)
+        self._cause = cause
+        self._result = result
+
+    def get_cause(self):
+        return self._cause
+
+    def get_result(self):
+        return self._result
+
+
+class CircuitOpenError(ProviderConnectionError):
+    """
+    Raised instead of calling a server that has failed too often recently.
+    """
+    def __init__(self, retry_time):
+        ProviderConnectionError.__init__(self, _('Server unavailable: too many failures'))
+        self._retry_time = retry_time
+
+    def get_retry_time(self):
+        return self._retry_time
+
+
+def is_retryable_http_code(code):
+    """
+    Check whether a http status code signals a transient failure.
+    :param code: http status code
+    :return: True if the request can be sent again
+    """
+    return code in (408, 429, ) or 500 <= code < 600
+
+
+class CircuitBreaker(object):
+    """
+    Stop calling a server after a number of consecutive failures.
+    When open, calls fail immediately until reset_timeout seconds have passed.
+    Then one trial call is allowed: it closes the circuit on success and opens it again on failure
+    or when it is aborted by another exception.
+    Thread-safe.
+    """
+    DEFAULT_FAILURE_THRESHOLD = 5
+    DEFAULT_RESET_TIMEOUT = 60.
+
+    def __init__(self, failure_threshold=None, reset_timeout=None):
+        """
+        Create a new CircuitBreaker.
+        :param failure_threshold: number of consecutive failures opening the circuit (None for the default)
+        :param reset_timeout: time (in seconds) to wait before allowing a trial call (None for the default)
+        """
+        self._failure_threshold = self.DEFAULT_FAILURE_THRESHOLD if failure_threshold is None else failure_threshold
+        self._reset_timeout = self.DEFAULT_RESET_TIMEOUT if reset_timeout is None else reset_timeout
+        self._nb_failures = 0
+        self._open_time = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def is_open(self):
+        return self._open_time is not None
+
+    def before_call(self):
+        """
+        Check whether a call can be made.
+        :raise CircuitOpenError: when the circuit is open
+        """
+        with self._lock:
+            if self._open_time is None:
+                return
+            retry_time = self._open_time + self._reset_timeout
+            if self._trial or self._now() < retry_time:
+                raise CircuitOpenError(retry_time)
+            log.debug('Circuit half open: trial call')
+            self._trial = True
+
+    def record_success(self):
+        with self._lock:
+            if self._open_time is not None:
+                log.info('Circuit closed')
+            self._nb_failures = 0
+            self._open_time = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self._nb_failures += 1
+            if self._trial or self._nb_failures >= self._failure_threshold:
+                if not self._trial:
+                    log.warning('Circuit opened after {} consecutive failures'.format(self._nb_failures))
+                self._open_time = self._now()
+                self._trial = False
+
+    def record_aborted(self):
+        """
+        Record a call that ended with an exception that is not a transient failure.
+        Such a call does not count as a failure, but a trial call must not stay pending: the circuit is opened again.
+        """
+        with self._lock:
+            if self._trial:
+                log.debug('Trial call aborted: circuit opened again')
+                self._open_time = self._now()
+                self._trial = False
+
+    @staticmethod
+    def _now():
+        return time.monotonic()
+
+
+class RetryPolicy(object):
+    """
+    Try a call again after a transient failure, waiting longer after every attempt.
+    The waiting time grows exponentially and is randomized (full jitter),
+    so multiple clients do not retry at the same time.
+    """
+    DEFAULT_MAX_ATTEMPTS = 4
+    DEFAULT_BASE_DELAY = .5
+    DEFAULT_MAX_DELAY = 30.
+    DEFAULT_DEADLINE = 120.
+
+    def __init__(self, max_attempts=None, base_delay=None, max_delay=None, deadline=None):
+        """
+        Create a new RetryPolicy.
+        :param max_attempts: maximum number of attempts of a call, 1 to never retry (None for the default)
+        :param base_delay: maximum time (in seconds) to wait before the first retry (None for the default)
+        :param max_delay: maximum time (in seconds) to wait between two attempts (None for the default)
+        :param deadline: maximum time (in seconds) spent on a call, including all attempts (None for the default).
+            No attempt is started or retried after the deadline. execute_async also cancels an attempt at the deadline;
+            execute cannot interrupt a blocking attempt, which is bounded by the timeouts of its transport only.
+        """
+        self._max_attempts = max(1, self.DEFAULT_MAX_ATTEMPTS if max_attempts is None else max_attempts)
+        self._base_delay = self.DEFAULT_BASE_DELAY if base_delay is None else base_delay
+        self._max_delay = self.DEFAULT_MAX_DELAY if max_delay is None else max_delay
+        self._deadline = self.DEFAULT_DEADLINE if deadline is None else deadline
+
+    def get_max_attempts(self):
+        return self._max_attempts
+
+    def get_deadline(self):
+        return self._deadline
+
+    def get_delay(self, attempt):
+        """
+        Get the time to wait after a failed attempt.
+        :param attempt: number of the failed attempt, starting at 0
+        :return: time in seconds
+        """
+        return random.uniform(0, min(self._max_delay, self._base_delay * (2 ** attempt)))
+
+    def execute(self, call, circuit_breaker=None):
+        """
+        Execute a call, trying again when it raises RetryableError.
+        Other exceptions are passed on, after aborting a trial call of the circuit breaker.
+        The deadline is checked between the attempts: a blocking attempt is not interrupted.
+        :param call: callable without arguments
+        :param circuit_breaker: CircuitBreaker of the server (None to not use one)
+        :return: result of call
+        :raise RetryableError: when all attempts have failed or the deadline has passed
+        :raise CircuitOpenError: when the circuit breaker does not allow calls
+        """
+        deadline = self._now() + self._deadline
+        attempt = 0
+        while True:
+            if circuit_breaker is not None:
+                circuit_breaker.before_call()
+            try:
+                result = call()
+            except RetryableError as e:
+                if circuit_breaker is not None:
+                    circuit_breaker.record_failure()
+                delay = self.get_delay(attempt)
+                attempt += 1
+                if attempt >= self._max_attempts or self._now() + delay > deadline:
+                    log.debug('Call failed after {} attempts: {}'.format(attempt, e.get_cause()))
+                    raise
+                log.debug('Attempt {} failed ({}): retrying in {:.3f}s'.format(attempt, e.get_cause(), delay))
+                self._sleep(delay)
+                continue
+            except BaseException:
+                if circuit_breaker is not None:
+                    circuit_breaker.record_aborted()
+                raise
+            if circuit_breaker is not None:
+                circuit_breaker.record_success()
+            return result
+
+    async def execute_async(self, call, circuit_breaker=None):
+        """
+        Execute a coroutine function, trying again when it raises RetryableError.
+        Like execute, but waits between the attempts without blocking the event loop.
+        An attempt still running at the deadline is cancelled, and fails like a RetryableError.
+        :param call: coroutine function without arguments
+        :param circuit_breaker: CircuitBreaker of the server (None to not use one)
+        :return: result of call
+        :raise RetryableError: when all attempts have failed or the deadline has passed
+        :raise CircuitOpenError: when the circuit breaker does not allow calls
+        """
+        deadline = self._now() + self._deadline
+        attempt = 0
+        while True:
+            if circuit_breaker is not None:
+                circuit_breaker.before_call()
+            try:
+                try:
+                    result = await asyncio.wait_for(call(), max(0., deadline - self._now()))
+                except asyncio.TimeoutError as e:
+                    raise RetryableError(e)
+            except RetryableError as e:
+                if circuit_breaker is not None:
+                    circuit_breaker.record_failure()
+                delay = self.get_delay(attempt)
+                attempt += 1
+                if attempt >= self._max_attempts or self._now() + delay > deadline:
+                    log.debug('Call failed after {} attempts: {}'.format(attempt, e.get_cause()))
+                    raise
+                log.debug('Attempt {} failed ({}): retrying in {:.3f}s'.format(attempt, e.get_cause(), delay))
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                if circuit_breaker is not None:
+                    circuit_breaker.record_aborted()
+                raise
+            if circuit_breaker is not None:
+                circuit_breaker.record_success()
+            return result
+
+    @staticmethod
+    def _now():
+        return time.monotonic()
+
+    @staticmethod
+    def _sleep(duration):
+        time.sleep(duration)
+
+
+def urlopen_retry(url, retry_policy, circuit_breaker=None, rate_limiter=None, timeout=None):
+    """
+    Open an url, trying again after connection errors and transient http errors.
+    :param url: url to open, as string or as urllib.request.Request
+    :param retry_policy: RetryPolicy
+    :param circuit_breaker: CircuitBreaker of the server (None to not use one)
+    :param rate_limiter: RateLimiter of the server (None to not use one)
+    :param timeout: maximum time (in seconds) to wait for the server per attempt (None for the socket default)
+    :return: response of urlopen
+    :raise HTTPError: on a http error that is not transient
+    :raise RetryableError: when all attempts have failed
+    :raise CircuitOpenError: when the circuit breaker does not allow calls
+    """
+    def attempt():
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            if timeout is None:
+                return urlopen(url)
+            return urlopen(url, timeout=timeout)
+        except HTTPError as e:
+            if is_retryable_http_code(e.code):
+                raise RetryableError(e)
+            raise
+        except (URLError, SocketError) as e:
+            raise RetryableError(e)
+    return retry_policy.execute(attempt, circuit_breaker)
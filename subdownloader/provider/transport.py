@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+
+import asyncio
+import gzip
+from http.client import BadStatusLine, HTTPConnection, HTTPSConnection, ImproperConnectionState
+import logging
+import ssl
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+from urllib.request import Request
+from xmlrpc.client import dumps, loads, ProtocolError, SafeTransport, Transport
+
+from subdownloader.provider.retry import urlopen_retry
+
+log = logging.getLogger('subdownloader.provider.transport')
+
+DEFAULT_CONNECT_TIMEOUT = 10.
+DEFAULT_READ_TIMEOUT = 60.
+
+
+class _TimeoutConnectionMixin(object):
+    """
+    Use the timeout of the connection while connecting, and read_timeout afterwards.
+    """
+    read_timeout = None
+
+    def connect(self):
+        super().connect()
+        self.sock.settimeout(self.read_timeout)
+
+
+class TimeoutHTTPConnection(_TimeoutConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimeoutHTTPSConnection(_TimeoutConnectionMixin, HTTPSConnection):
+    pass
+
+
+class KeepAliveTransport(Transport):
+    """
+    XML-RPC transport reusing one persistent HTTP/1.1 connection for all requests.
+    Responses are requested gzip encoded, requests can be gzip encoded too.
+    When a reused connection turns out to be closed by the server, the request is sent again over a new connection.
+    Not thread-safe: use one transport per thread.
+    """
+    connection_class = TimeoutHTTPConnection
+
+    # Errors raised when sending a request over a connection that has been closed by the server.
+    STALE_CONNECTION_ERRORS = (ConnectionError, BadStatusLine, ImproperConnectionState, )
+
+    def __init__(self, connect_timeout=None, read_timeout=None, gzip_request_threshold=None, **kwargs):
+        """
+        Create a new KeepAliveTransport.
+        :param connect_timeout: maximum time (in seconds) to set up a connection (None for the default)
+        :param read_timeout: maximum time (in seconds) to wait for data of the server (None for the default)
+        :param gzip_request_threshold: minimum size (in bytes) of a request to be gzip encoded
+            (None to never encode requests). The server must accept gzip encoded requests.
+        :param kwargs: keyword arguments passed to xmlrpc.client.Transport
+        """
+        super().__init__(**kwargs)
+        self._connect_timeout = DEFAULT_CONNECT_TIMEOUT if connect_timeout is None else connect_timeout
+        self._read_timeout = DEFAULT_READ_TIMEOUT if read_timeout is None else read_timeout
+        self.encode_threshold = gzip_request_threshold
+
+    def make_connection(self, host):
+        if self._connection and host == self._connection[0]:
+            return self._connection[1]
+        chost, self._extra_headers, x509 = self.get_host_info(host)
+        connection = self._create_connection(chost, x509)
+        connection.read_timeout = self._read_timeout
+        self._connection = host, connection
+        log.debug('make_connection(host={})'.format(chost))
+        return connection
+
+    def _create_connection(self, chost, x509):
+        return self.connection_class(chost, timeout=self._connect_timeout)
+
+    def _connection_reusable(self, host):
+        return bool(self._connection) and self._connection[0] == host and self._connection[1].sock is not None
+
+    def request(self, host, handler, request_body, verbose=False):
+        reused = self._connection_reusable(host)
+        try:
+            return self.single_request(host, handler, request_body, verbose)
+        except self.STALE_CONNECTION_ERRORS as e:
+            # single_request has closed the connection.
+            self.close()
+            if not reused:
+                raise
+            log.debug('Connection to {} went stale ({}): reconnecting'.format(host, type(e).__name__))
+        return self.single_request(host, handler, request_body, verbose)
+
+
+class SafeKeepAliveTransport(KeepAliveTransport, SafeTransport):
+    """
+    KeepAliveTransport over https.
+    """
+    connection_class = TimeoutHTTPSConnection
+
+    def __init__(self, connect_timeout=None, read_timeout=None, gzip_request_threshold=None, context=None, **kwargs):
+        super().__init__(connect_timeout=connect_timeout, read_timeout=read_timeout,
+                         gzip_request_threshold=gzip_request_threshold, context=context, **kwargs)
+
+    def _create_connection(self, chost, x509):
+        return self.connection_class(chost, timeout=self._connect_timeout, context=self.context, **(x509 or {}))
+
+
+def create_transport(url, **kwargs):
+    """
+    Create a keep-alive transport for an url.
+    :param url: url of the XML-RPC server
+    :param kwargs: keyword arguments passed to KeepAliveTransport
+    :return: KeepAliveTransport or SafeKeepAliveTransport
+    """
+    if urlsplit(url).scheme == 'https':
+        return SafeKeepAliveTransport(**kwargs)
+    return KeepAliveTransport(**kwargs)
+
+
+def fetch_url(url, retry_policy, circuit_breaker=None, rate_limiter=None, cache=None, timeout=None):
+    """
+    Fetch the body of an url, trying again after connection errors and transient http errors.
+    A fresh response of the cache is used without contacting the server.
+    A stale response is revalidated with a conditional request, using its ETag and Last-Modified validators.
+    Responses are requested gzip encoded.
+    :param url: url to fetch
+    :param retry_policy: RetryPolicy
+    :param circuit_breaker: CircuitBreaker of the server (None to not use one)
+    :param rate_limiter: RateLimiter of the server (None to not use one)
+    :param cache: HttpResponseCache (None to not cache the response)
+    :param timeout: maximum time (in seconds) to wait for the server per attempt (None for the read timeout)
+    :return: body as bytes
+    :raise HTTPError: on a http error that is not transient
+    :raise RetryableError: when all attempts have failed
+    :raise CircuitOpenError: when the circuit breaker does not allow calls
+    """
+    cached = None if cache is None else cache.get_response(url)
+    if cached is not None and cached.fresh:
+        log.debug('Using cached response of {}'.format(url))
+        return cached.body
+
+    headers = {'Accept-Encoding': 'gzip'}
+    if cached is not None:
+        if cached.etag is not None:
+            headers['If-None-Match'] = cached.etag
+        if cached.last_modified is not None:
+            headers['If-Modified-Since'] = cached.last_modified
+    request = Request(url, headers=headers)
+    try:
+        response = urlopen_retry(request, retry_policy, circuit_breaker, rate_limiter=rate_limiter,
+                                 timeout=DEFAULT_READ_TIMEOUT if timeout is None else timeout)
+    except HTTPError as e:
+        if e.code != 304 or cached is None:
+            raise
+        log.debug('Cached response of {} is still valid'.format(url))
+        cache.refresh_response(url)
+        return cached.body
+
+    with response:
+        body = response.read()
+        if response.headers.get('Content-Encoding', '').lower() == 'gzip':
+            body = gzip.decompress(body)
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+    if cache is not None:
+        cache.set_response(url, body, etag=etag, last_modified=last_modified)
+    return body
+
+
+class AsyncXmlRpcClient(object):
+    """
+    XML-RPC client for asyncio, sending requests over a pool of persistent HTTP/1.1 connections.
+    Calls of multiple tasks run concurrently, each over its own connection, up to max_connections.
+    Responses are requested gzip encoded.
+    When a reused connection turns out to be closed by the server, the request is sent again over a new connection.
+    Use the client from one event loop only.
+    """
+    DEFAULT_MAX_CONNECTIONS = 4
+
+    # Errors raised when sending a request over a connection that has been closed by the server.
+    STALE_CONNECTION_ERRORS = (ConnectionError, asyncio.IncompleteReadError, )
+
+    def __init__(self, url, connect_timeout=None, read_timeout=None, max_connections=None, ssl_context=None):
+        """
+        Create a new AsyncXmlRpcClient.
+        :param url: url of the XML-RPC server
+        :param connect_timeout: maximum time (in seconds) to set up a connection (None for the default)
+        :param read_timeout: maximum time (in seconds) to wait for data of the server (None for the default)
+        :param max_connections: maximum number of connections to the server (None for the default)
+        :param ssl_context: SSL context of https connections (None for the default context)
+        """
+        parts = urlsplit(url)
+        self._url = url
+        self._netloc = parts.netloc
+        self._host = parts.hostname
+        self._ssl = None
+        if parts.scheme == 'https':
+            self._ssl = ssl.create_default_context() if ssl_context is None else ssl_context
+        self._port = parts.port or (443 if self._ssl else 80)
+        self._handler = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        self._connect_timeout = DEFAULT_CONNECT_TIMEOUT if connect_timeout is None else connect_timeout
+        self._read_timeout = DEFAULT_READ_TIMEOUT if read_timeout is None else read_timeout
+        self._max_connections = self.DEFAULT_MAX_CONNECTIONS if max_connections is None else max_connections
+        # Created by the first call, so it belongs to the event loop of the calls.
+        self._semaphore = None
+        self._idle_connections = []
+
+    async def call(self, method, *params):
+        """
+        Call a method of the server.
+        :param method: name of the method
+        :param params: parameters of the method
+        :return: result of the call
+        :raise ProtocolError: when the server answers with a http error
+        :raise xmlrpc.client.Fault: when the server answers with a fault
+        :raise asyncio.TimeoutError: when the server does not answer in time
+        :raise OSError: on a connection error
+        """
+        request_body = dumps(params, method, encoding='utf-8', allow_none=False).encode('utf-8')
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_connections)
+        async with self._semaphore:
+            while True:
+                reused = bool(self._idle_connections)
+                if reused:
+                    reader, writer = self._idle_connections.pop()
+                else:
+                    reader, writer = await asyncio.wait_for(
+                        asyncio.open_connection(self._host, self._port, ssl=self._ssl), self._connect_timeout)
+                    log.debug('open_connection(host={})'.format(self._netloc))
+                try:
+                    status, reason, headers, body, keep_alive = await self._request(reader, writer, request_body)
+                except self.STALE_CONNECTION_ERRORS as e:
+                    writer.close()
+                    if not reused:
+                        raise
+                    log.debug('Connection to {} went stale ({}): reconnecting'.format(self._netloc, type(e).__name__))
+                    continue
+                except BaseException:
+                    writer.close()
+                    raise
+                break
+            if keep_alive:
+                self._idle_connections.append((reader, writer))
+            else:
+                writer.close()
+        if status != 200:
+            raise ProtocolError(self._url, status, reason, headers)
+        response, response_method = loads(body)
+        return response[0]
+
+    async def _request(self, reader, writer, request_body):
+        """
+        Send one request and read its response.
+        :return: tuple of status, reason, dict of headers (lower case names), body and whether to reuse the connection
+        """
+        header = (
+            'POST {handler} HTTP/1.1\r\n'
+            'Host: {host}\r\n'
+            'User-Agent: {user_agent}\r\n'
+            'Content-Type: text/xml\r\n'
+            'Content-Length: {length}\r\n'
+            'Accept-Encoding: gzip\r\n'
+            '\r\n').format(handler=self._handler, host=self._netloc, user_agent=Transport.user_agent,
+                             length=len(request_body))
+        writer.write(header.encode('latin-1') + request_body)
+        await asyncio.wait_for(writer.drain(), self._read_timeout)
+
+        status_line = await self._read(reader.readline())
+        if not status_line:
+            raise ConnectionResetError('Connection closed by server')
+        version, status, reason = (status_line.decode('latin-1').rstrip('\r\n').split(None, 2) + [''])[:3]
+        headers = {}
+        while True:
+            line = await self._read(reader.readline())
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = await self._read_chunked(reader)
+        elif 'content-length' in headers:
+            body = await self._read(reader.readexactly(int(headers['content-length'])))
+        else:
+            body = await self._read(reader.read())
+            keep_alive = False
+        if headers.get('content-encoding', '').lower() == 'gzip':
+            body = gzip.decompress(body)
+        return int(status), reason, headers, body, keep_alive
+
+    async def _read_chunked(self, reader):
+        chunks = []
+        while True:
+            size_line = await self._read(reader.readline())
+            size = int(size_line.split(b';', 1)[0], 16)
+            if size == 0:
+                # Skip the trailer.
+                while (await self._read(reader.readline())) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self._read(reader.readexactly(size)))
+            await self._read(reader.readexactly(2))
+
+    async def _read(self, coroutine):
+        return await asyncio.wait_for(coroutine, self._read_timeout)
+
+    def close(self):
+        """
+        Close the idle connections.
+        """
+        while self._idle_connections:
+            reader, writer = self._idle_connections.pop()
+            writer.close()
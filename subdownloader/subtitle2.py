@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
 
+import bisect
+from concurrent.futures import as_completed, ThreadPoolExecutor
 import hashlib
 import os
 import logging
 import re
 
+from subdownloader.cache import FileIdentity, get_default_file_hash_cache
 from subdownloader.languages.language import Language, NotALanguageException, UnknownLanguage
 
 log = logging.getLogger('subdownloader.subtitle2')
@@ -15,6 +18,82 @@ List of known subtitle extensions.
 """
 SUBTITLES_EXT = ['srt', 'sub', 'txt', 'ssa', 'smi', 'ass', 'mpl']
 
+"""
+Default number of subtitles that are hashed at the same time.
+"""
+DEFAULT_HASH_WORKERS = 8
+
+MD5_CHUNK_SIZE = 64 << 10
+
+
+def _match_stem_rest(sub_rest):
+    """
+    Check whether the rest of a subtitle stem, after the stem of a video, consists of numbers and languages.
+    e.g. 'movie.2.en' matches 'movie' because the rest '.2.en' is a number and a language.
+    :param sub_rest: rest of the subtitle stem as lower case string
+    :return: tuple of True if the rest matches and the (last) language found or None
+    """
+    lang = None
+    for rest in sub_rest.split('.'):
+        if not rest:
+            continue
+        try:
+            int(rest)
+            continue
+        except ValueError:
+            pass
+        try:
+            lang = Language.from_unknown(rest, xx=True, xxx=True)
+            continue
+        except NotALanguageException:
+            pass
+        return False, lang
+    return True, lang
+
+
+class SubtitleFilenameIndex(object):
+    """
+    Index of subtitles by lower case filename stem, to find the subtitles matching a video
+    without calling SubtitleFile.matches_video_filename for every subtitle.
+    The stems are kept sorted, so all subtitles starting with the stem of a video are adjacent.
+    """
+    def __init__(self, subtitles):
+        """
+        Create a new index.
+        :param subtitles: iterable of SubtitleFile objects
+        """
+        entries = sorted((os.path.splitext(subtitle.get_filename())[0].lower(), subtitle_i, subtitle)
+                         for subtitle_i, subtitle in enumerate(subtitles))
+        self._stems = [entry[0] for entry in entries]
+        self._entries = [(entry[1], entry[2]) for entry in entries]
+        self._rest_matches = {}
+
+    def _match_rest(self, sub_rest):
+        try:
+            return self._rest_matches[sub_rest]
+        except KeyError:
+            matches, _ = _match_stem_rest(sub_rest)
+            self._rest_matches[sub_rest] = matches
+            return matches
+
+    def find_matches(self, video):
+        """
+        Find the subtitles whose filename matches the filename of video.
+        The result is identical to filtering the subtitles with SubtitleFile.matches_video_filename.
+        :param video: VideoFile instance
+        :return: list of SubtitleFile objects, in the order they were passed to the index
+        """
+        vid_stem = os.path.splitext(video.get_filename())[0].lower()
+        matches = []
+        entry_i = bisect.bisect_left(self._stems, vid_stem)
+        while entry_i < len(self._stems) and self._stems[entry_i].startswith(vid_stem):
+            sub_stem = self._stems[entry_i]
+            if sub_stem == vid_stem or self._match_rest(sub_stem[len(vid_stem):]):
+                matches.append(self._entries[entry_i])
+            entry_i += 1
+        matches.sort(key=lambda entry: entry[0])
+        return [subtitle for _, subtitle in matches]
+
 
 class SubtitleFile(object):
     def __init__(self, parent):
@@ -79,7 +158,8 @@ class SubtitleFile(object):
         return UnknownLanguage.create_generic()
 
     def equals_subtitle_file(self, other):
-        return self.get_md5_hash() == other.get_md5_hash() and self.get_file_size() == other.get_file_size()
+        # Compare the sizes first: the md5 hash of a local subtitle is only calculated when needed.
+        return self.get_file_size() == other.get_file_size() and self.get_md5_hash() == other.get_md5_hash()
 
 
 class SubtitleFileNetwork(SubtitleFile):
@@ -184,26 +264,7 @@ class SubtitleFileStorage(SubtitleFile):
         lang = None
         if not matches:
             if sub_stem.startswith(vid_stem):
-                sub_rest = sub_stem[len(vid_stem):]
-                rests = sub_rest.split('.')
-                rest_matches = True
-                for rest in rests:
-                    if not rest:
-                        continue
-                    try:
-                        int(rest)
-                        continue
-                    except ValueError:
-                        pass
-                    try:
-                        lang = Language.from_unknown(rest, xx=True, xxx=True)
-                        continue
-                    except NotALanguageException:
-                        pass
-                    rest_matches = False
-                    break
-
-                matches = rest_matches
+                matches, lang = _match_stem_rest(sub_stem[len(vid_stem):])
 
         if matches:
             log.debug('... matches (language={language})'.format(language=lang))
@@ -228,13 +289,59 @@ class SubtitleFileStorage(SubtitleFile):
 
 
 class LocalSubtitleFile(SubtitleFileStorage):
-    def __init__(self, filepath, parent=None):
+    def __init__(self, filepath, parent=None, stat=None):
         filename = filepath.name
-        file_size = filepath.stat().st_size
+        if stat is None:
+            stat = filepath.stat()
         language = self.detect_language_filename(filename)
-        md5_hash = hashlib.md5(filepath.open(mode='rb').read()).hexdigest()
-        SubtitleFileStorage.__init__(self, parent=None, file_size=file_size, language=language, md5_hash=md5_hash)
+        # The md5 hash is calculated on request.
+        SubtitleFileStorage.__init__(self, parent=None, file_size=stat.st_size, language=language, md5_hash=None)
         self._filepath = filepath
+        self._stat = stat
+
+    def get_md5_hash(self):
+        """
+        Get the md5 hash of the contents of this local subtitle.
+        :return: hash as string, None if the file could not be read
+        """
+        if self._md5_hash is None:
+            cache = get_default_file_hash_cache()
+            if cache is None:
+                self._md5_hash = self.calculate_md5_hash()
+            else:
+                self._md5_hash = self._get_md5_hash_cached(cache)
+        return self._md5_hash
+
+    def _get_md5_hash_cached(self, cache):
+        """
+        Get the md5 hash of this local subtitle from cache. Calculate and store it on a cache miss.
+        :param cache: instance of FileHashCache
+        :return: hash as string
+        """
+        identity = FileIdentity.from_stat(self._stat)
+        md5_hash = cache.get_md5_hash(identity)
+        if md5_hash is not None:
+            log.debug('md5("{}")={} (cached)'.format(self._filepath, md5_hash))
+            return md5_hash
+        md5_hash = self.calculate_md5_hash()
+        if md5_hash is not None:
+            cache.set_md5_hash(identity, md5_hash)
+        return md5_hash
+
+    def calculate_md5_hash(self):
+        """
+        Calculate the md5 hash of the contents of this local subtitle.
+        :return: hash as string, None if the file could not be read
+        """
+        md5 = hashlib.md5()
+        try:
+            with self._filepath.open(mode='rb') as f:
+                for chunk in iter(lambda: f.read(MD5_CHUNK_SIZE), b''):
+                    md5.update(chunk)
+        except (OSError, IOError):
+            log.warning('Could not read "{}"'.format(self._filepath), exc_info=True)
+            return None
+        return md5.hexdigest()
 
     def detect_language_contents(self):
         return Language.from_file(self._filepath)
@@ -356,3 +463,33 @@ class SubtitleFileCollection(object):
 
     def __getitem__(self, item):
         return self._networks[item]
+
+
+def hash_subtitles(subtitles, callback, workers=None):
+    """
+    Calculate the md5 hash of multiple local subtitles concurrently.
+    The results are stored in the LocalSubtitleFile objects, so later calls to get_md5_hash return immediately.
+    Progress is reported from the calling thread.
+    :param subtitles: list of LocalSubtitleFile objects
+    :param callback: Instance of ProgressCallback
+    :param workers: maximum number of subtitles that are hashed at the same time (None for the default)
+    :return: True if all subtitles have been hashed, False if the operation was canceled
+    """
+    if workers is None:
+        workers = DEFAULT_HASH_WORKERS
+    log.debug('hash_subtitles(#subtitles={nb}, workers={workers})'.format(nb=len(subtitles), workers=workers))
+
+    callback.set_range(0, len(subtitles))
+    callback.update(0)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(subtitle.get_md5_hash) for subtitle in subtitles]
+        for subtitle_i, future in enumerate(as_completed(futures)):
+            future.result()
+            callback.update(subtitle_i + 1)
+            if callback.canceled():
+                log.debug('hash_subtitles canceled')
+                for pending_future in futures:
+                    pending_future.cancel()
+                return False
+    callback.finish()
+    return True
@@ -30,3 +30,13 @@ class SubtitlesTextQuery(object):
             movies = query.search_more_movies()
             for movie in movies:
                 self.movies.add_movie(movie, query)
+
+    def search_all_movies(self):
+        for query in self._queries:
+            for movies in query.iter_more_movie_pages():
+                for movie in movies:
+                    self.movies.add_movie(movie, query)
+
+    def prefetch_more_movies(self):
+        for query in self._queries:
+            query.prefetch_more_movies()
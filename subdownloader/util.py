@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
 
+import base64
 import gzip
 import io
 import shutil
+import zlib
 
 
 class IllegalPathException(Exception):
@@ -40,6 +42,29 @@ def unzip_stream(src_stream):
     return gzip.GzipFile(fileobj=src_stream)
 
 
+def iter_unzip_base64(data, chunk_size=64 * 1024):
+    """
+    Decode base64 encoded gzip data incrementally.
+    Only one chunk of the compressed and uncompressed data is held in memory at a time.
+    :param data: base64 encoded gzip data as string
+    :param chunk_size: number of characters of data to decode at once
+    :return: generator of tuples of a compressed chunk and the uncompressed chunk
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    rest = ''
+    for offset in range(0, len(data), chunk_size):
+        # Whitespace is not part of the encoding: remove it, so quads of characters can be decoded.
+        encoded = rest + ''.join(data[offset:offset + chunk_size].split())
+        nb_decode = len(encoded) - len(encoded) % 4
+        rest = encoded[nb_decode:]
+        compressed = base64.b64decode(encoded[:nb_decode])
+        yield compressed, decompressor.decompress(compressed)
+    compressed = base64.b64decode(rest)
+    yield compressed, decompressor.decompress(compressed) + decompressor.flush()
+    if not decompressor.eof:
+        raise EOFError('Compressed data ended before the end-of-stream marker was reached')
+
+
 def write_stream(src_file, destination_path):
     """
     Write the file-like src_file object to the string dest_path
@@ -1,12 +1,14 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import copy
 import logging
-import os
-import struct
 
 from subdownloader import metadata
+from subdownloader.cache import FileIdentity, get_default_file_hash_cache
 from subdownloader.identification import IdentityCollection
+from subdownloader.osdb_hash import osdb_hash
 from subdownloader.subtitle2 import SubtitleFileCollection
 
 log = logging.getLogger('subdownloader.video2')
@@ -25,6 +27,12 @@ VIDEOS_EXT = ['3g2', '3gp', '3gp2', '3gpp', '60d', 'ajp', 'asf', 'asx',
               'wx', 'x264', 'xvid']
 
 
+"""
+Default number of videos that are hashed concurrently by hash_videos.
+"""
+DEFAULT_HASH_WORKERS = 8
+
+
 class NotAVideoException(Exception):
     """
     Exception used to indicate a certain file is not a video.
@@ -41,19 +49,21 @@ class VideoFile(object):
     Represents a local video file.
     """
 
-    def __init__(self, filepath):
+    def __init__(self, filepath, stat=None):
         """
         Initialize a new local VideoFile
         :param filepath: path of the videofile as string
+        :param stat: result of a stat call on filepath, if available (avoids stat'ing the file again)
         """
         log.debug('VideoFile.__init__("{}")'.format(filepath))
 
         self._filepath = filepath
-        if not self._filepath.exists():
+        if stat is None and not self._filepath.exists():
             raise NotAVideoException(self._filepath)
+        self._stat = stat
 
         # calculate hash and size on request
-        self._size = None
+        self._size = None if stat is None else stat.st_size
         self._osdb_hash_valid = False
         self._osdb_hash = None
 
@@ -120,6 +130,15 @@ class VideoFile(object):
         """
         return self._filepath.name
 
+    def get_stat(self):
+        """
+        Get the result of a stat call on this videofile. The stat result of the scan is reused if available.
+        :return: os.stat_result
+        """
+        if self._stat is None:
+            self._stat = self._filepath.stat()
+        return self._stat
+
     def get_size(self):
         """
         Get size of this VideoFile in bytes
@@ -135,10 +154,35 @@ class VideoFile(object):
         :return: hash as string
         """
         if not self._osdb_hash_valid:
-            self._osdb_hash = self.calculate_osdb_hash()
+            cache = get_default_file_hash_cache()
+            if cache is None:
+                self._osdb_hash = self.calculate_osdb_hash()
+            else:
+                self._osdb_hash = self._get_osdb_hash_cached(cache)
             self._osdb_hash_valid = True
         return self._osdb_hash
 
+    def _get_osdb_hash_cached(self, cache):
+        """
+        Get the hash of this local videofile from cache. Calculate and store it on a cache miss.
+        The size of this VideoFile is taken from the same stat call, so a cache hit does not open the file.
+        :param cache: instance of FileHashCache
+        :return: hash as string
+        """
+        try:
+            identity = FileIdentity.from_stat(self.get_stat())
+        except (OSError, IOError):
+            return self.calculate_osdb_hash()
+        self._size = identity.size
+        osdb_hash = cache.get_osdb_hash(identity)
+        if osdb_hash is not None:
+            log.debug('hash("{}")={} (cached)'.format(self.get_filepath(), osdb_hash))
+            return osdb_hash
+        osdb_hash = self.calculate_osdb_hash()
+        if osdb_hash is not None:
+            cache.set_osdb_hash(identity, osdb_hash)
+        return osdb_hash
+
     def get_fps(self):
         """
         Get the fps (frames per second) of this VideoFile
@@ -198,6 +242,28 @@ class VideoFile(object):
         """
         self._identities.add_identity(identity)
 
+    def create_search_copy(self):
+        """
+        Create a copy of this VideoFile without subtitles and identities, to collect the results of a search.
+        The size, hash and metadata are shared, so the copy does not read the file again.
+        :return: new VideoFile
+        """
+        video = copy.copy(self)
+        video._subtitles = SubtitleFileCollection(parent=video)
+        video._identities = IdentityCollection()
+        return video
+
+    def merge_search_copy(self, video):
+        """
+        Move the subtitles and identities found by a search on a copy of this VideoFile to this VideoFile.
+        :param video: VideoFile created by create_search_copy
+        """
+        for network in video.get_subtitles().get_subtitle_networks():
+            for subtitle in list(network.get_subtitles()):
+                self.add_subtitle(subtitle)
+        for identity in video.get_identities():
+            self.add_identity(identity)
+
     def calculate_osdb_hash(self):
         """
         Calculate OSDB (OpenSubtitleDataBase) hash of this VideoFile
@@ -206,33 +272,47 @@ class VideoFile(object):
         log.debug('calculate_OSDB_hash() of "{path}" ...'.format(path=self._filepath))
         try:
             with self._filepath.open(mode='rb') as f:
-                file_size = self.get_size()
-
-                longlong_format = 'Q'  # unsigned long long little endian
-                size_longlong = struct.calcsize(longlong_format)
-
-                block_size = min(file_size, 64 << 10)  # 64kiB
-                block_size = block_size & ~(size_longlong - 1)  # lower round on multiple of longlong
-
-                nb_longlong = block_size // size_longlong
-                fmt = '<{nbll}{member_format}'.format(
-                    nbll=nb_longlong,
-                    member_format=longlong_format)
-
-                hash_int = file_size
-
-                buffer = f.read(block_size)
-                list_longlong = struct.unpack(fmt, buffer)
-                hash_int += sum(list_longlong)
-
-                f.seek(-block_size, os.SEEK_END)
-                buffer = f.read(block_size)
-                list_longlong = struct.unpack(fmt, buffer)
-                hash_int += sum(list_longlong)
+                hash_str = osdb_hash(f, self.get_size())
         except (OSError, IOError) as e:
             log.info('Error calculating OSDB hash on {} ({})'.format(str(self._filepath), type(e)))
             return None
 
-        hash_str = '{:016x}'.format(hash_int)[-16:]
         log.debug('hash("{}")={}'.format(self.get_filepath(), hash_str))
         return hash_str
+
+
+def hash_videos(videos, callback, workers=None):
+    """
+    Calculate the size and OSDB hash of multiple videos concurrently.
+    The results are stored in the VideoFile objects, so later calls to get_osdb_hash and get_size return immediately.
+    Progress is reported from the calling thread.
+    :param videos: list of VideoFile objects
+    :param callback: Instance of ProgressCallback
+    :param workers: maximum number of videos that are hashed at the same time (None for the default)
+    :return: True if all videos have been hashed, False if the operation was canceled
+    """
+    if workers is None:
+        workers = DEFAULT_HASH_WORKERS
+    log.debug('hash_videos(#videos={nb}, workers={workers})'.format(nb=len(videos), workers=workers))
+
+    def hash_video(video):
+        try:
+            video.get_size()
+            video.get_osdb_hash()
+        except (OSError, IOError):
+            log.info('Error hashing {}'.format(video.get_filepath()), exc_info=True)
+
+    callback.set_range(0, len(videos))
+    callback.update(0)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(hash_video, video) for video in videos]
+        for video_i, future in enumerate(as_completed(futures)):
+            future.result()
+            callback.update(video_i + 1)
+            if callback.canceled():
+                log.debug('hash_videos canceled')
+                for pending_future in futures:
+                    pending_future.cancel()
+                return False
+    callback.finish()
+    return True
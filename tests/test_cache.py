@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+
+import os
+import unittest
+
+from subdownloader.cache import DownloadCountCache, FileHashCache, FileIdentity, HttpResponseCache, \
+    SearchResultCache, set_default_file_hash_cache, SubtitleDownloadCache
+from subdownloader.video2 import VideoFile
+
+from tests.util import create_temporary_directory
+
+
+class TestFileHashCache(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = create_temporary_directory()
+        self.cache = FileHashCache(self.tempdir.path / 'hashes.sqlite')
+
+    def tearDown(self):
+        set_default_file_hash_cache(None)
+        self.cache.close()
+        del self.cache
+        del self.tempdir
+
+    def test_get_set(self):
+        identity = FileIdentity(device=1, inode=2, size=3, mtime_ns=4)
+        self.assertIsNone(self.cache.get_osdb_hash(identity))
+        self.cache.set_osdb_hash(identity, '0123456789abcdef')
+        self.assertEqual(self.cache.get_osdb_hash(identity), '0123456789abcdef')
+        self.assertEqual(len(self.cache), 1)
+
+    def test_modified(self):
+        identity = FileIdentity(device=1, inode=2, size=3, mtime_ns=4)
+        self.cache.set_osdb_hash(identity, '0123456789abcdef')
+        self.assertIsNone(self.cache.get_osdb_hash(identity._replace(mtime_ns=5)))
+        self.assertIsNone(self.cache.get_osdb_hash(identity._replace(size=5)))
+        self.cache.set_osdb_hash(identity._replace(size=5), 'fedcba9876543210')
+        self.assertEqual(len(self.cache), 1)
+
+    def test_persistent(self):
+        identity = FileIdentity(device=1, inode=2, size=3, mtime_ns=4)
+        self.cache.set_osdb_hash(identity, '0123456789abcdef')
+        self.cache.close()
+        self.cache = FileHashCache(self.tempdir.path / 'hashes.sqlite')
+        self.assertEqual(self.cache.get_osdb_hash(identity), '0123456789abcdef')
+
+    def test_invalidate(self):
+        identities = [FileIdentity(device=1, inode=i, size=3, mtime_ns=4) for i in range(10)]
+        for identity in identities:
+            self.cache.set_osdb_hash(identity, '0123456789abcdef')
+        self.cache.invalidate(identities[:5])
+        self.assertEqual(len(self.cache), 5)
+        self.assertIsNone(self.cache.get_osdb_hash(identities[0]))
+        self.assertIsNotNone(self.cache.get_osdb_hash(identities[5]))
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_max_entries(self):
+        self.cache.set_max_entries(10)
+        for i in range(100):
+            self.cache.set_osdb_hash(FileIdentity(device=1, inode=i, size=3, mtime_ns=4), '0123456789abcdef')
+        self.assertLessEqual(len(self.cache), 10)
+        self.assertIsNotNone(self.cache.get_osdb_hash(FileIdentity(device=1, inode=99, size=3, mtime_ns=4)))
+
+    def test_atime_batched(self):
+        identity = FileIdentity(device=1, inode=2, size=3, mtime_ns=4)
+        self.cache.set_osdb_hash(identity, '0123456789abcdef')
+        total_changes = self.cache._db.total_changes
+        for i in range(10):
+            self.assertEqual(self.cache.get_osdb_hash(identity), '0123456789abcdef')
+        # A cache hit does not write.
+        self.assertEqual(self.cache._db.total_changes, total_changes)
+        self.cache.flush()
+        self.assertEqual(self.cache._db.total_changes, total_changes + 1)
+
+    def test_videofile(self):
+        video_path = self.tempdir.path / 'movie.avi'
+        video_path.write_bytes(os.urandom(256 << 10))
+        set_default_file_hash_cache(self.cache)
+
+        osdb_hash = VideoFile(video_path).get_osdb_hash()
+        self.assertEqual(osdb_hash, VideoFile(video_path).calculate_osdb_hash())
+        self.assertEqual(len(self.cache), 1)
+
+        # Overwrite the contents without changing the identity: the cached hash must be returned.
+        st = video_path.stat()
+        video_path.write_bytes(os.urandom(256 << 10))
+        os.utime(str(video_path), ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertEqual(VideoFile(video_path).get_osdb_hash(), osdb_hash)
+
+    def test_md5_hash(self):
+        identity = FileIdentity(device=1, inode=2, size=3, mtime_ns=4)
+        self.cache.set_osdb_hash(identity, '0123456789abcdef')
+        self.assertIsNone(self.cache.get_md5_hash(identity))
+        self.cache.set_md5_hash(identity, 'd41d8cd98f00b204e9800998ecf8427e')
+        self.assertEqual(self.cache.get_md5_hash(identity), 'd41d8cd98f00b204e9800998ecf8427e')
+        self.assertEqual(self.cache.get_osdb_hash(identity), '0123456789abcdef')
+        self.assertEqual(len(self.cache), 1)
+
+        # A modified file invalidates all of its hashes.
+        self.cache.set_md5_hash(identity._replace(mtime_ns=5), 'd41d8cd98f00b204e9800998ecf8427e')
+        self.assertIsNone(self.cache.get_osdb_hash(identity._replace(mtime_ns=5)))
+        self.assertEqual(len(self.cache), 1)
+
+
+class TestDownloadCountCache(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = create_temporary_directory()
+        self.path = self.tempdir.path / 'downloads.sqlite'
+        self.cache = DownloadCountCache(self.path)
+
+    def tearDown(self):
+        self.cache.close()
+        del self.tempdir
+
+    def test_count(self):
+        self.assertEqual(self.cache.get_download_count('provider', '2019-01-01'), 0)
+        self.assertEqual(self.cache.add_download_count('provider', '2019-01-01', 5), 5)
+        self.assertEqual(self.cache.add_download_count('provider', '2019-01-01', 2), 7)
+        self.assertEqual(self.cache.get_download_count('other', '2019-01-01'), 0)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_next_day(self):
+        self.cache.add_download_count('provider', '2019-01-01', 5)
+        self.assertEqual(self.cache.get_download_count('provider', '2019-01-02'), 0)
+        self.assertEqual(self.cache.add_download_count('provider', '2019-01-02', 1), 1)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_persistent(self):
+        self.cache.add_download_count('provider', '2019-01-01', 5)
+        self.cache.close()
+        self.cache = DownloadCountCache(self.path)
+        self.assertEqual(self.cache.get_download_count('provider', '2019-01-01'), 5)
+
+
+class FixedTimeSearchResultCache(SearchResultCache):
+    time = 0.
+
+    @staticmethod
+    def _now():
+        return FixedTimeSearchResultCache.time
+
+
+class TestSearchResultCache(unittest.TestCase):
+    RESULT = [{'IDSubtitleFile': '1', 'SubFileName': 'movie.srt'}]
+
+    def setUp(self):
+        FixedTimeSearchResultCache.time = 0.
+        self.cache = FixedTimeSearchResultCache(':memory:', ttl=100., negative_ttl=10.)
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get_search_result('provider', 'abc', 10, 'eng'))
+        self.cache.set_search_results('provider', 'eng', [('abc', 10, self.RESULT), ('def', 20, [])])
+        self.assertEqual(self.cache.get_search_result('provider', 'abc', 10, 'eng'), self.RESULT)
+        self.assertEqual(self.cache.get_search_result('provider', 'def', 20, 'eng'), [])
+        self.assertIsNone(self.cache.get_search_result('provider', 'abc', 11, 'eng'))
+        self.assertIsNone(self.cache.get_search_result('provider', 'abc', 10, 'dut'))
+        self.assertIsNone(self.cache.get_search_result('other', 'abc', 10, 'eng'))
+        self.assertEqual(len(self.cache), 2)
+
+    def test_ttl(self):
+        self.cache.set_search_results('provider', 'eng', [('abc', 10, self.RESULT), ('def', 20, [])])
+        FixedTimeSearchResultCache.time = 50.
+        # An empty result expires sooner.
+        self.assertIsNone(self.cache.get_search_result('provider', 'def', 20, 'eng'))
+        self.assertEqual(self.cache.get_search_result('provider', 'abc', 10, 'eng'), self.RESULT)
+        FixedTimeSearchResultCache.time = 150.
+        self.assertIsNone(self.cache.get_search_result('provider', 'abc', 10, 'eng'))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_max_entries(self):
+        self.cache.set_max_entries(10)
+        for i in range(10):
+            FixedTimeSearchResultCache.time = i
+            self.cache.set_search_results('provider', 'eng', [(str(i), i, [])])
+        # Use the oldest entry, so it is not evicted.
+        self.assertEqual(self.cache.get_search_result('provider', '0', 0, 'eng'), [])
+        self.cache.set_search_results('provider', 'eng', [('10', 10, [])])
+        self.assertLessEqual(len(self.cache), 10)
+        self.assertEqual(self.cache.get_search_result('provider', '0', 0, 'eng'), [])
+        self.assertIsNone(self.cache.get_search_result('provider', '1', 1, 'eng'))
+
+
+class FixedTimeSubtitleDownloadCache(SubtitleDownloadCache):
+    time = 0.
+
+    @staticmethod
+    def _now():
+        return FixedTimeSubtitleDownloadCache.time
+
+
+class TestSubtitleDownloadCache(unittest.TestCase):
+    def setUp(self):
+        FixedTimeSubtitleDownloadCache.time = 0.
+        self.tempdir = create_temporary_directory()
+        self.path = self.tempdir.path / 'subtitles.sqlite'
+        self.cache = FixedTimeSubtitleDownloadCache(self.path, max_size=1000)
+
+    def tearDown(self):
+        self.cache.close()
+        del self.tempdir
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get_subtitle('provider', '1', 'abc'))
+        self.cache.set_subtitle('provider', '1', 'abc', b'data')
+        self.assertEqual(self.cache.get_subtitle('provider', '1', 'abc'), b'data')
+        # The subtitle has been replaced at the provider.
+        self.assertIsNone(self.cache.get_subtitle('provider', '1', 'def'))
+        self.cache.set_subtitle('provider', '1', 'def', b'other data')
+        self.assertEqual(self.cache.get_subtitle('provider', '1', 'def'), b'other data')
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.cache.get_total_size(), 10)
+        self.cache.remove_subtitle('provider', '1')
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.get_total_size(), 0)
+
+    def test_max_size(self):
+        for i in range(10):
+            FixedTimeSubtitleDownloadCache.time = i
+            self.cache.set_subtitle('provider', str(i), 'abc', b'x' * 100)
+        self.assertEqual(self.cache.get_total_size(), 1000)
+        # Use the oldest entry, so it is not evicted.
+        self.assertIsNotNone(self.cache.get_subtitle('provider', '0', 'abc'))
+        self.cache.set_subtitle('provider', '10', 'abc', b'x' * 100)
+        self.assertLessEqual(self.cache.get_total_size(), 1000)
+        self.assertIsNotNone(self.cache.get_subtitle('provider', '0', 'abc'))
+        self.assertIsNone(self.cache.get_subtitle('provider', '1', 'abc'))
+        self.cache.set_max_size(300)
+        self.assertLessEqual(self.cache.get_total_size(), 300)
+        self.assertEqual(self.cache.get_total_size(), 100 * len(self.cache))
+
+    def test_persistent(self):
+        self.cache.set_subtitle('provider', '1', 'abc', b'data')
+        self.cache.close()
+        self.cache = FixedTimeSubtitleDownloadCache(self.path)
+        self.assertEqual(self.cache.get_subtitle('provider', '1', 'abc'), b'data')
+        self.assertEqual(self.cache.get_total_size(), 4)
+
+
+class FixedTimeHttpResponseCache(HttpResponseCache):
+    time = 0.
+
+    @staticmethod
+    def _now():
+        return FixedTimeHttpResponseCache.time
+
+
+class TestHttpResponseCache(unittest.TestCase):
+    URL = 'http://www.opensubtitles.org/en/search2/moviename-movie/offset-0/xml'
+
+    def setUp(self):
+        FixedTimeHttpResponseCache.time = 0.
+        self.cache = FixedTimeHttpResponseCache(':memory:', ttl=100., max_age=1000.)
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get_response(self.URL))
+        self.cache.set_response(self.URL, b'<xml/>' * 100, etag='"abc"', last_modified='Mon, 01 Apr 2019 10:00:00 GMT')
+        response = self.cache.get_response(self.URL)
+        self.assertEqual(response.body, b'<xml/>' * 100)
+        self.assertEqual(response.etag, '"abc"')
+        self.assertEqual(response.last_modified, 'Mon, 01 Apr 2019 10:00:00 GMT')
+        self.assertTrue(response.fresh)
+        self.cache.set_response(self.URL, b'<other/>')
+        response = self.cache.get_response(self.URL)
+        self.assertEqual(response.body, b'<other/>')
+        self.assertIsNone(response.etag)
+        self.assertEqual(len(self.cache), 1)
+        self.cache.remove_response(self.URL)
+        self.assertIsNone(self.cache.get_response(self.URL))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_ttl(self):
+        self.cache.set_response(self.URL, b'<xml/>', etag='"abc"')
+        FixedTimeHttpResponseCache.time = 150.
+        # A stale response is kept, so it can be revalidated.
+        self.assertFalse(self.cache.get_response(self.URL).fresh)
+        self.cache.refresh_response(self.URL)
+        self.assertTrue(self.cache.get_response(self.URL).fresh)
+        FixedTimeHttpResponseCache.time = 1200.
+        self.assertIsNone(self.cache.get_response(self.URL))
+        self.assertEqual(len(self.cache), 0)
@@ -4,12 +4,16 @@
 import io
 import unittest
 
+from subdownloader.cache import VideoStateCache
+from subdownloader.client.incremental import IncrementalScan
+
 from subdownloader.client.cli import get_default_options
+from subdownloader.client.cli.callback import ProgressBarCallback
 from subdownloader.client.cli.cli import BadCliArguments, CliCmd
 from subdownloader.client.cli.state import CliState
 from subdownloader.client.configuration import Settings
 
-from tests.util import create_temporary_file
+from tests.util import create_temporary_directory, create_temporary_file
 from tests.resources import RESOURCE_PATH, RESOURCE_AVI
 
 
@@ -104,3 +108,32 @@ class TestCli(unittest.TestCase):
         self.stdout.seek(0)
         lines = self.stdout.readlines()
         self.assertGreater(len(lines), 1)
+
+    def test_filescan_canceled(self):
+        class CanceledProgressBarCallback(ProgressBarCallback):
+            def canceled(self):
+                return True
+        self.cli.get_callback = lambda: CanceledProgressBarCallback(fd=self.stdout)
+
+        tempdir = create_temporary_directory()
+        self.addCleanup(tempdir.delete)
+        (tempdir.path / 'movie.avi').write_bytes(b'video' * 10)
+        self.cli.state.set_video_paths([tempdir.path])
+        self.cli.onecmd('filescan')
+        self.assertListEqual([], self.cli._videos)
+
+    def test_interactive_incremental(self):
+        tempdir = create_temporary_directory()
+        self.addCleanup(tempdir.delete)
+        (tempdir.path / 'subtitled.avi').write_bytes(b'video' * 10)
+        (tempdir.path / 'subtitled.srt').write_bytes(b'subtitle')
+        (tempdir.path / 'other.avi').write_bytes(b'video' * 20)
+        self.cli.state.set_video_paths([tempdir.path])
+        cache = VideoStateCache(':memory:')
+        self.addCleanup(cache.close)
+        incremental = IncrementalScan(cache, [])
+
+        self.cli.run_headless_interactive(incremental)
+        # The video with a local subtitle is not searched.
+        self.assertEqual([video.get_filepath().name for video in self.cli._videos], ['other.avi'])
+        self.assertEqual(len(cache), 2)
@@ -5,10 +5,14 @@ from pathlib import Path
 import unittest
 
 from tests.resources import resources_init, RESOURCE_AVI, RESOURCE_PATH
-from tests.util import ChangeDirectoryScope
+from tests.util import ChangeDirectoryScope, create_temporary_directory
 
 from subdownloader.callback import ProgressCallback
-from subdownloader.filescan import scan_videopath
+from subdownloader.filescan import ExtensionClassifier, FileCategory, filter_files_extensions, \
+    get_default_extension_classifier, iter_scan_videopaths, scan_videopath, scan_videopaths, \
+    set_default_extension_classifier
+from subdownloader.subtitle2 import LocalSubtitleFile, SubtitleFilenameIndex, SUBTITLES_EXT
+from subdownloader.video2 import VideoFile, VIDEOS_EXT
 
 
 class TestFileScan(unittest.TestCase):
@@ -39,3 +43,134 @@ class TestFileScan(unittest.TestCase):
             videos, subtitles = scan_videopath(Path('..'), ProgressCallback(), recursive=True)
             self.assertTrue(len(videos) > 0)
             video = next(video for video in videos if video.get_filepath().resolve() == RESOURCE_AVI)
+
+
+class TestIterScan(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = create_temporary_directory()
+        for dir_name in ('', 'season1', 'season1/extras', 'season2'):
+            directory = self.tempdir.path / dir_name
+            directory.mkdir(parents=True, exist_ok=True)
+            for i in range(3):
+                (directory / 'episode{}.mkv'.format(i)).write_bytes(b'video')
+                (directory / 'episode{}.en.srt'.format(i)).write_text('subtitle {}'.format(i))
+            (directory / 'notes.txt').write_text('notes')
+
+    def tearDown(self):
+        del self.tempdir
+
+    @staticmethod
+    def _summary(videos):
+        return sorted((str(video.get_filepath()), sorted(str(subtitle.get_filepath())
+                                                         for subtitle in video.get_subtitles().iter_local_subtitles()))
+                      for video in videos)
+
+    def test_iter_scan_recursive(self):
+        videos, _ = scan_videopaths([self.tempdir.path], ProgressCallback(), recursive=True)
+        iter_videos = list(iter_scan_videopaths([self.tempdir.path], recursive=True))
+        self.assertEqual(len(iter_videos), 12)
+        self.assertListEqual(self._summary(iter_videos), self._summary(videos))
+
+    def test_iter_scan_non_recursive(self):
+        videos, _ = scan_videopaths([self.tempdir.path], ProgressCallback(), recursive=False)
+        iter_videos = list(iter_scan_videopaths([self.tempdir.path], recursive=False))
+        self.assertEqual(len(iter_videos), 3)
+        self.assertListEqual(self._summary(iter_videos), self._summary(videos))
+
+    def test_iter_scan_lazy(self):
+        iterator = iter_scan_videopaths([self.tempdir.path], recursive=True)
+        video = next(iterator)
+        self.assertEqual(len(list(video.get_subtitles().iter_local_subtitles())), 1)
+
+    def test_scan_stat(self):
+        (self.tempdir.path / 'folder.avi').mkdir()
+        (self.tempdir.path / 'big.avi').write_bytes(b'v' * 1000)
+        videos, subtitles = scan_videopaths([self.tempdir.path], ProgressCallback(), recursive=False)
+        self.assertNotIn('folder.avi', [video.get_filepath().name for video in videos])
+        for video in videos:
+            self.assertEqual(video.get_size(), video.get_filepath().stat().st_size)
+        for subtitle in subtitles:
+            self.assertEqual(subtitle.get_file_size(), subtitle.get_filepath().stat().st_size)
+
+    def test_scan_file(self):
+        videos, subtitles = scan_videopath(self.tempdir.path / 'episode1.mkv', ProgressCallback())
+        self.assertEqual([video.get_filepath().name for video in videos], ['episode1.mkv'])
+        self.assertEqual(len([subtitle for subtitle in subtitles if subtitle.get_filepath().suffix == '.srt']), 3)
+
+
+class TestExtensionClassifier(unittest.TestCase):
+    def setUp(self):
+        self.classifier = get_default_extension_classifier()
+
+    def tearDown(self):
+        set_default_extension_classifier(self.classifier)
+
+    def test_classify(self):
+        classifier = ExtensionClassifier()
+        self.assertEqual(classifier.classify('movie.AVI'), FileCategory.VIDEO)
+        self.assertEqual(classifier.classify('movie.en.srt'), FileCategory.SUBTITLE)
+        self.assertIsNone(classifier.classify('movie.nfo'))
+        self.assertIsNone(classifier.classify('avi'))
+        self.assertEqual(classifier.get_extensions(FileCategory.VIDEO), frozenset(VIDEOS_EXT))
+
+    def test_filter_files_extensions(self):
+        files = [Path('file{}.{}'.format(i, ext)) for i, ext in enumerate(['avi', 'SRT', 'nfo', 'mkv', 'txt', ''])]
+        result = filter_files_extensions(files, [SUBTITLES_EXT, VIDEOS_EXT])
+        classifier = ExtensionClassifier()
+        self.assertListEqual(result, [
+            [file for file in files if classifier.classify(file.name) == FileCategory.SUBTITLE],
+            [file for file in files if classifier.classify(file.name) == FileCategory.VIDEO],
+        ])
+
+    def test_extra_extensions(self):
+        tempdir = create_temporary_directory()
+        (tempdir.path / 'movie.xyz').write_bytes(b'video')
+        (tempdir.path / 'movie.abc').write_text('subtitle')
+        videos, _ = scan_videopaths([tempdir.path], ProgressCallback())
+        self.assertEqual(len(videos), 0)
+
+        classifier = ExtensionClassifier()
+        classifier.add_extensions(FileCategory.VIDEO, ['.XYZ'])
+        classifier.add_extensions(FileCategory.SUBTITLE, ['abc', 'avi'])
+        self.assertEqual(classifier.classify('movie.txt'), FileCategory.SUBTITLE)
+        self.assertEqual(classifier.classify('movie.avi'), FileCategory.SUBTITLE)
+        self.assertNotIn('avi', classifier.get_extensions(FileCategory.VIDEO))
+        set_default_extension_classifier(classifier)
+        videos, subtitles = scan_videopaths([tempdir.path], ProgressCallback())
+        self.assertEqual([video.get_filepath().name for video in videos], ['movie.xyz'])
+        self.assertEqual([subtitle.get_filepath().name for subtitle in subtitles], ['movie.abc'])
+
+
+class TestSubtitleFilenameIndex(unittest.TestCase):
+    VIDEOS = ['ep1.mkv', 'ep10.mkv', 'Movie.avi', 'movie.part2.avi', 'show.s01e01.mp4', 'other.avi', 'a.b.avi']
+    SUBTITLES = ['ep1.srt', 'ep1.en.srt', 'ep10.srt', 'ep10.fr.2.srt', 'ep1x.srt', 'EP1.NL.srt', 'movie.srt',
+                 'MOVIE.eng.sub', 'movie.foo.srt', 'movie..en.srt', 'movie.part2.en.srt', 'movie.part2.es.srt',
+                 'movie.part3.srt', 'show.s01e01.srt', 'show.s01e01.pt-br.srt', 'show.srt', 'a.srt', 'a.b.srt',
+                 'a.b.c.srt', 'a.b.de.3.srt', 'zzz.srt']
+
+    def setUp(self):
+        self.tempdir = create_temporary_directory()
+        for name in self.VIDEOS + self.SUBTITLES:
+            (self.tempdir.path / name).write_text(name)
+        self.videos = [VideoFile(self.tempdir.path / name) for name in self.VIDEOS]
+        self.subtitles = [LocalSubtitleFile(self.tempdir.path / name) for name in self.SUBTITLES]
+
+    def tearDown(self):
+        del self.tempdir
+
+    def test_identical_matches(self):
+        index = SubtitleFilenameIndex(self.subtitles)
+        nb_matches = 0
+        for video in self.videos:
+            expected = [subtitle for subtitle in self.subtitles if subtitle.matches_video_filename(video)]
+            self.assertListEqual(index.find_matches(video), expected, video.get_filename())
+            nb_matches += len(expected)
+        self.assertGreater(nb_matches, 0)
+
+    def test_scan(self):
+        videos, _ = scan_videopaths([self.tempdir.path], ProgressCallback())
+        self.assertEqual(len(videos), len(self.VIDEOS))
+        for video in videos:
+            expected = [subtitle.get_filename() for subtitle in self.subtitles if subtitle.matches_video_filename(video)]
+            matched = [subtitle.get_filename() for subtitle in video.get_subtitles().iter_local_subtitles()]
+            self.assertListEqual(sorted(matched), sorted(expected))
@@ -0,0 +1,764 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+
+import asyncio
+import base64
+import datetime
+import gzip
+import hashlib
+from socketserver import ThreadingMixIn
+import threading
+import time
+import unittest
+from xmlrpc.server import SimpleXMLRPCServer
+
+from subdownloader.cache import SearchResultCache, set_default_search_result_cache, \
+    set_default_subtitle_download_cache, SubtitleDownloadCache
+from subdownloader.callback import ProgressCallback
+from subdownloader.languages.language import Language
+from subdownloader.provider import AdaptiveWindow
+from subdownloader.provider.opensubtitles import AsyncOpenSubtitles, OpenSubtitles, \
+    OpenSubtitlesProviderConnectionError, OpenSubtitlesSettings, OpenSubtitlesSubtitleFile
+from subdownloader.provider.provider import ProviderNotConnectedError, ProviderQuotaExceededError
+from subdownloader.provider.retry import RetryPolicy
+from subdownloader.video2 import VideoFile
+
+from tests.util import create_temporary_directory
+
+
+class ThreadingXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+class FakeOpenSubtitlesServer(object):
+    """
+    Local XML-RPC server with sessions, answering SearchSubtitles with one subtitle per query.
+    """
+    def __init__(self, delay=0.):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.nb_searches = 0
+        self.nb_logins = 0
+        self.nb_busy = 0
+        self.nb_downloads = 0
+        self.nb_download_calls = 0
+        self.nb_pings = 0
+        self.no_data = False
+        self.tokens = set()
+
+        self.server = ThreadingXMLRPCServer(('127.0.0.1', 0), logRequests=False, allow_none=True)
+        for name in ('DownloadSubtitles', 'LogIn', 'LogOut', 'NoOperation', 'SearchSubtitles', ):
+            self.server.register_function(getattr(self, name), name)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def get_url(self):
+        return 'http://{}:{}/RPC2'.format(*self.server.server_address)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def expire_sessions(self):
+        with self.lock:
+            self.tokens.clear()
+
+    def LogIn(self, username, password, language, user_agent):
+        with self.lock:
+            self.nb_logins += 1
+            token = 'token{}'.format(self.nb_logins)
+            self.tokens.add(token)
+        return {'status': '200 OK', 'token': token}
+
+    def LogOut(self, token):
+        with self.lock:
+            self.tokens.discard(token)
+        return {'status': '200 OK'}
+
+    def NoOperation(self, token):
+        with self.lock:
+            self.nb_pings += 1
+            if token not in self.tokens:
+                return {'status': '406 No session'}
+        return {'status': '200 OK'}
+
+    @staticmethod
+    def subtitle_contents(id_online):
+        return 'subtitle {}'.format(id_online).encode()
+
+    def DownloadSubtitles(self, token, ids):
+        with self.lock:
+            if token not in self.tokens:
+                return {'status': '406 No session'}
+            self.nb_downloads += len(ids)
+            self.nb_download_calls += 1
+        return {
+            'status': '200 OK',
+            'data': [{
+                'idsubtitlefile': id_online,
+                'data': base64.b64encode(gzip.compress(self.subtitle_contents(id_online))).decode(),
+            } for id_online in ids],
+        }
+
+    def SearchSubtitles(self, token, queries, options):
+        with self.lock:
+            if token not in self.tokens:
+                return {'status': '406 No session'}
+            if self.nb_busy:
+                self.nb_busy -= 1
+                return {'status': '503 Service unavailable'}
+            if self.no_data:
+                # The server answers False instead of an empty list when nothing is found.
+                return {'status': '200 OK', 'data': False}
+            self.in_flight += 1
+            self.nb_searches += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        return {
+            'status': '200 OK',
+            'data': [{
+                'SubFileName': 'sub_{}.srt'.format(query['moviehash']),
+                'SubSize': '100',
+                'IDSubtitleFile': query['moviehash'],
+                'SubHash': '0' * 32,
+                'SubDownloadLink': '',
+                'SubtitlesLink': '',
+                'UserNickName': 'user',
+                'SubLanguageID': 'eng',
+                'SubRating': '0.0',
+                'SubAddDate': '2019-01-01 00:00:00',
+                'MovieHash': query['moviehash'],
+                'IDMovieImdb': '1',
+                'MovieName': 'movie',
+                'MovieYear': '2019',
+            } for query in queries],
+        }
+
+
+def create_remote_subtitle(id_online):
+    md5_hash = hashlib.md5(FakeOpenSubtitlesServer.subtitle_contents(id_online)).hexdigest()
+    return OpenSubtitlesSubtitleFile(filename='{}.srt'.format(id_online), file_size=100, md5_hash=md5_hash,
+                                     id_online=id_online, download_link=None, link='', uploader='user',
+                                     language=Language.from_xxx('eng'), rating=0.,
+                                     date=datetime.datetime(2019, 1, 1))
+
+
+class RecordingProgressCallback(ProgressCallback):
+    def __init__(self):
+        ProgressCallback.__init__(self)
+        self.values = []
+
+    def on_update(self, value, *args, **kwargs):
+        self.values.append(value)
+
+
+class TestOpenSubtitlesSearch(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenSubtitlesServer(delay=0.05)
+        # Registered first, so the server is closed after the providers have disconnected.
+        self.addCleanup(self.server.close)
+        self.tempdir = create_temporary_directory()
+        self.videos = []
+        for i in range(23):
+            path = self.tempdir.path / 'movie{}.avi'.format(i)
+            path.write_bytes(b'video' * (i + 1))
+            self.videos.append(VideoFile(path))
+
+    def tearDown(self):
+        del self.tempdir
+
+    def _create_provider(self, search_workers, request_rate=0.):
+        provider = OpenSubtitles(OpenSubtitlesSettings(search_workers=search_workers, request_rate=request_rate))
+        provider.URL = self.server.get_url()
+        provider.login()
+        self.addCleanup(provider.disconnect)
+        return provider
+
+    def test_search_serial(self):
+        provider = self._create_provider(search_workers=1)
+        rsubs = provider.search_videos(self.videos, ProgressCallback())
+        self.assertEqual([rsub.get_id_online() for rsub in rsubs],
+                         [video.get_osdb_hash() for video in self.videos])
+        # The window grows during the search: windows of 5, 6, 7 and 5 videos.
+        self.assertEqual(self.server.nb_searches, 4)
+        self.assertEqual(self.server.max_in_flight, 1)
+
+    def test_search_concurrent(self):
+        provider = self._create_provider(search_workers=3)
+        callback = RecordingProgressCallback()
+        rsubs = provider.search_videos(self.videos, callback)
+        self.assertEqual([rsub.get_id_online() for rsub in rsubs],
+                         [video.get_osdb_hash() for video in self.videos])
+        for video in self.videos:
+            remote_subtitles = [sub for network in video.get_subtitles() for sub in network.get_subtitles()
+                                if sub.is_remote()]
+            self.assertEqual([sub.get_id_online() for sub in remote_subtitles], [video.get_osdb_hash()])
+        self.assertEqual(self.server.nb_searches, 5)
+        self.assertLessEqual(self.server.max_in_flight, 3)
+        # Three windows of 5 videos are sent at once, the next ones grow with every result.
+        self.assertEqual(callback.values, [0, 5, 10, 15, 21, 23])
+        self.assertTrue(callback.finished())
+
+    def test_search_adaptive_window(self):
+        provider = self._create_provider(search_workers=3)
+        provider.search_videos(self.videos, ProgressCallback())
+        self.assertEqual(self.server.nb_searches, 5)
+        self.assertGreater(provider.get_adaptive_windows()[0].get_size(), 5)
+        rsubs = provider.search_videos(self.videos, ProgressCallback())
+        self.assertLess(self.server.nb_searches, 10)
+        self.assertEqual([rsub.get_id_online() for rsub in rsubs],
+                         [video.get_osdb_hash() for video in self.videos])
+
+    def test_search_adaptive_window_throttled(self):
+        provider = self._create_provider(search_workers=1, request_rate=2.5)
+        provider._search_window = AdaptiveWindow('search', initial=5, maximum=20, target_latency=.2)
+        provider.search_videos(self.videos, ProgressCallback())
+        # Waiting for the rate limiter takes longer than the target latency, but the server answers in time.
+        self.assertEqual([statistic.size for statistic in provider._search_window.get_statistics()], [5, 6, 7, 5])
+        self.assertTrue(all(statistic.latency < .2 for statistic in provider._search_window.get_statistics()))
+
+    def test_search_retry(self):
+        provider = self._create_provider(search_workers=1)
+        provider.set_retry_policy(RetryPolicy(base_delay=0.))
+        self.server.nb_busy = 2
+        rsubs = provider.search_videos(self.videos, ProgressCallback())
+        self.assertEqual(len(rsubs), len(self.videos))
+        self.assertEqual(self.server.nb_busy, 0)
+
+    def test_search_retry_exhausted(self):
+        provider = self._create_provider(search_workers=3)
+        provider.set_retry_policy(RetryPolicy(max_attempts=2, base_delay=0.))
+        self.server.nb_busy = 100
+        with self.assertRaises(OpenSubtitlesProviderConnectionError) as cm:
+            provider.search_videos(self.videos, ProgressCallback())
+        self.assertEqual(cm.exception.get_code(), 503)
+
+    def test_search_no_data(self):
+        provider = self._create_provider(search_workers=3)
+        self.server.no_data = True
+        self.assertEqual(provider.search_videos(self.videos, ProgressCallback()), [])
+
+    def test_search_rate(self):
+        # The bucket allows a burst of 2 requests, that has been used by the login.
+        provider = self._create_provider(search_workers=5, request_rate=2.5)
+        start = time.perf_counter()
+        provider.search_videos(self.videos, ProgressCallback())
+        self.assertGreaterEqual(time.perf_counter() - start, 3 / 2.5)
+        self.assertEqual(self.server.nb_searches, 5)
+
+    def test_search_cache(self):
+        cache = SearchResultCache(':memory:')
+        set_default_search_result_cache(cache)
+        self.addCleanup(cache.close)
+        self.addCleanup(set_default_search_result_cache, None)
+        provider = self._create_provider(search_workers=3)
+        provider.search_videos(self.videos[:20], ProgressCallback())
+        nb_searches = self.server.nb_searches
+        videos = [VideoFile(video.get_filepath()) for video in self.videos]
+        rsubs = provider.search_videos(videos, ProgressCallback())
+        # Only the videos that were not searched before are searched online.
+        self.assertEqual(self.server.nb_searches, nb_searches + 1)
+        self.assertEqual([rsub.get_id_online() for rsub in rsubs], [video.get_osdb_hash() for video in videos])
+        for video in videos:
+            self.assertEqual([identity.video_identity.get_name() for identity in video.get_identities()], ['movie'])
+            self.assertEqual(len(list(video.get_subtitles().get_subtitle_networks())), 1)
+        self.assertEqual(len(cache), len(videos))
+        # Results are cached per set of languages.
+        provider.search_videos(videos, ProgressCallback(), languages=[Language.from_xxx('dut')])
+        self.assertGreater(self.server.nb_searches, nb_searches + 1)
+
+    def test_settings(self):
+        settings = OpenSubtitlesSettings.load(**OpenSubtitlesSettings(search_workers=7, request_rate=2.5).as_dict())
+        self.assertEqual(settings.get_search_workers(), 7)
+        self.assertEqual(settings.get_request_rate(), 2.5)
+        settings = OpenSubtitlesSettings.load(username='', password='', search_workers='many')
+        self.assertEqual(settings.get_search_workers(), OpenSubtitlesSettings.DEFAULT_SEARCH_WORKERS)
+
+
+class FixedTimeOpenSubtitles(OpenSubtitles):
+    time = 0.
+
+    @staticmethod
+    def _now():
+        return FixedTimeOpenSubtitles.time
+
+
+class TestOpenSubtitlesSession(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenSubtitlesServer()
+        # Registered first, so the server is closed after the providers have disconnected.
+        self.addCleanup(self.server.close)
+        self.tempdir = create_temporary_directory()
+        self.videos = []
+        for i in range(12):
+            path = self.tempdir.path / 'movie{}.avi'.format(i)
+            path.write_bytes(b'video' * (i + 1))
+            self.videos.append(VideoFile(path))
+        FixedTimeOpenSubtitles.time = 0.
+
+    def tearDown(self):
+        del self.tempdir
+
+    def _create_provider(self, search_workers=1):
+        provider = FixedTimeOpenSubtitles(OpenSubtitlesSettings(search_workers=search_workers, request_rate=0.))
+        provider.URL = self.server.get_url()
+        provider.login()
+        self.addCleanup(provider.disconnect)
+        return provider
+
+    def test_relogin_on_session_expired(self):
+        provider = self._create_provider()
+        self.server.expire_sessions()
+        rsubs = provider.search_videos(self.videos, ProgressCallback())
+        self.assertEqual(len(rsubs), len(self.videos))
+        self.assertEqual(self.server.nb_logins, 2)
+
+    def test_relogin_on_session_expired_concurrent(self):
+        provider = self._create_provider(search_workers=3)
+        self.server.expire_sessions()
+        rsubs = provider.search_videos(self.videos, ProgressCallback())
+        self.assertEqual([rsub.get_id_online() for rsub in rsubs],
+                         [video.get_osdb_hash() for video in self.videos])
+        self.assertEqual(self.server.nb_logins, 2)
+
+    def test_session_ttl(self):
+        provider = self._create_provider()
+        provider.ping()
+        self.assertEqual(self.server.nb_logins, 1)
+        FixedTimeOpenSubtitles.time += provider.SESSION_TTL + 1
+        # The session has expired locally: log in before sending the call.
+        self.server.expire_sessions()
+        provider.ping()
+        self.assertEqual(self.server.nb_logins, 2)
+        self.assertEqual(self.server.nb_pings, 2)
+
+    def test_keep_alive(self):
+        provider = self._create_provider()
+        provider.KEEP_ALIVE_CHECK_INTERVAL = .01
+        provider.logout()
+        provider.login()
+        time.sleep(.1)
+        self.assertEqual(self.server.nb_pings, 0)
+        FixedTimeOpenSubtitles.time += provider.KEEP_ALIVE_IDLE
+        for _ in range(100):
+            if self.server.nb_pings:
+                break
+            time.sleep(.01)
+        self.assertGreaterEqual(self.server.nb_pings, 1)
+        provider.logout()
+        nb_pings = self.server.nb_pings
+        FixedTimeOpenSubtitles.time += provider.KEEP_ALIVE_IDLE
+        time.sleep(.1)
+        self.assertEqual(self.server.nb_pings, nb_pings)
+
+
+class TestOpenSubtitlesDownload(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenSubtitlesServer()
+        self.addCleanup(self.server.close)
+
+    def _create_provider(self, download_quota=0):
+        provider = OpenSubtitles(OpenSubtitlesSettings(request_rate=0., download_quota=download_quota))
+        provider.URL = self.server.get_url()
+        provider.login()
+        self.addCleanup(provider.disconnect)
+        return provider
+
+    def test_download(self):
+        provider = self._create_provider()
+        ids = [str(i) for i in range(45)]
+        subtitles = provider.download_subtitles([create_remote_subtitle(id_online) for id_online in ids])
+        self.assertEqual(subtitles, [self.server.subtitle_contents(id_online) for id_online in ids])
+
+    def test_iter_download(self):
+        provider = self._create_provider()
+        ids = [str(i) for i in range(45)]
+        nb_downloads = []
+        for rsub, contents in provider.iter_download_subtitles([create_remote_subtitle(id_online) for id_online in ids]):
+            self.assertEqual(contents, self.server.subtitle_contents(rsub.get_id_online()))
+            nb_downloads.append(self.server.nb_downloads)
+        # Subtitles are yielded as soon as their window has arrived.
+        self.assertEqual(nb_downloads, [20] * 20 + [40] * 20 + [45] * 5)
+
+    def test_write_subtitles(self):
+        provider = self._create_provider()
+        tempdir = create_temporary_directory()
+        self.addCleanup(tempdir.delete)
+        rsub_paths = [(create_remote_subtitle(str(i)), tempdir.path / '{}.srt'.format(i)) for i in range(25)]
+        provider.write_subtitles(rsub_paths)
+        for rsub, path in rsub_paths:
+            self.assertEqual(path.read_bytes(), self.server.subtitle_contents(rsub.get_id_online()))
+        rsub, path = rsub_paths[0]
+        rsub.download(path.with_name('download.srt'), provider, None)
+        self.assertEqual(path.with_name('download.srt').read_bytes(), path.read_bytes())
+
+    def test_write_subtitles_same_id(self):
+        provider = self._create_provider()
+        tempdir = create_temporary_directory()
+        self.addCleanup(tempdir.delete)
+        rsub_paths = [(create_remote_subtitle('1'), tempdir.path / 'copy{}.srt'.format(i)) for i in range(2)]
+        provider.write_subtitles(rsub_paths)
+        for rsub, path in rsub_paths:
+            self.assertEqual(path.read_bytes(), self.server.subtitle_contents('1'))
+        self.assertEqual(self.server.nb_downloads, 1)
+
+    def test_download_subtitle_chunks_independent(self):
+        provider = self._create_provider()
+        rsubs = [create_remote_subtitle(str(i)) for i in range(25)]
+        rsub_chunks = list(provider._iter_download_subtitle_chunks(rsubs))
+        # The chunks can be consumed after the generator has moved on, in any order.
+        for rsub, chunks in reversed(rsub_chunks):
+            self.assertEqual(b''.join(chunks), self.server.subtitle_contents(rsub.get_id_online()))
+        self.assertEqual(self.server.nb_download_calls, 2)
+
+    def test_iter_write_subtitles(self):
+        provider = self._create_provider()
+        tempdir = create_temporary_directory()
+        self.addCleanup(tempdir.delete)
+        rsub_paths = [(create_remote_subtitle(str(i)), tempdir.path / '{}.srt'.format(i)) for i in range(45)]
+        written = list(provider.iter_write_subtitles(rsub_paths))
+        self.assertEqual([rsub for rsub, _ in written], [rsub for rsub, _ in rsub_paths])
+        for (rsub, path), (_, local_sub) in zip(rsub_paths, written):
+            self.assertEqual(local_sub.get_filepath(), path)
+            self.assertEqual(path.read_bytes(), self.server.subtitle_contents(rsub.get_id_online()))
+        self.assertEqual(self.server.nb_download_calls, 3)
+
+    def test_iter_write_subtitles_same_id(self):
+        provider = self._create_provider()
+        tempdir = create_temporary_directory()
+        self.addCleanup(tempdir.delete)
+        # Two copies of the same video pick the same subtitle.
+        rsub_paths = [(create_remote_subtitle('1'), tempdir.path / 'copy{}.srt'.format(i)) for i in range(2)]
+        rsub_paths.append((create_remote_subtitle('2'), tempdir.path / 'other.srt'))
+        written = list(provider.iter_write_subtitles(rsub_paths))
+        self.assertEqual([(rsub, local_sub.get_filepath()) for rsub, local_sub in written], rsub_paths)
+        for rsub, path in rsub_paths:
+            self.assertEqual(path.read_bytes(), self.server.subtitle_contents(rsub.get_id_online()))
+        self.assertEqual(self.server.nb_downloads, 2)
+
+    def test_iter_write_subtitles_error(self):
+        provider = self._create_provider(download_quota=30)
+        tempdir = create_temporary_directory()
+        self.addCleanup(tempdir.delete)
+        rsub_paths = [(create_remote_subtitle(str(i)), tempdir.path / '{}.srt'.format(i)) for i in range(25)]
+        provider.download_subtitles([create_remote_subtitle(str(i)) for i in range(100, 110)])
+        written = []
+        with self.assertRaises(ProviderQuotaExceededError):
+            for rsub, _ in provider.iter_write_subtitles(rsub_paths):
+                written.append(rsub)
+        self.assertEqual(written, [])
+
+    def test_download_quota(self):
+        provider = self._create_provider(download_quota=5)
+        provider.download_subtitles([create_remote_subtitle(str(i)) for i in range(3)])
+        self.assertEqual(provider.get_download_quota().get_remaining(), 2)
+        with self.assertRaises(ProviderQuotaExceededError):
+            provider.download_subtitles([create_remote_subtitle(str(i)) for i in range(3)])
+        self.assertEqual(self.server.nb_downloads, 3)
+
+    def test_download_cache(self):
+        cache = SubtitleDownloadCache(':memory:')
+        set_default_subtitle_download_cache(cache)
+        self.addCleanup(cache.close)
+        self.addCleanup(set_default_subtitle_download_cache, None)
+        provider = self._create_provider(download_quota=30)
+        ids = [str(i) for i in range(20)]
+        provider.download_subtitles([create_remote_subtitle(id_online) for id_online in ids[:10]])
+        self.assertEqual(len(cache), 10)
+        subtitles = provider.download_subtitles([create_remote_subtitle(id_online) for id_online in ids])
+        self.assertEqual(subtitles, [self.server.subtitle_contents(id_online) for id_online in ids])
+        # Cached subtitles are not downloaded again and do not count for the quota.
+        self.assertEqual(self.server.nb_downloads, 20)
+        self.assertEqual(provider.get_download_quota().get_count(), 20)
+
+    def test_download_cache_hash_mismatch(self):
+        cache = SubtitleDownloadCache(':memory:')
+        set_default_subtitle_download_cache(cache)
+        self.addCleanup(cache.close)
+        self.addCleanup(set_default_subtitle_download_cache, None)
+        provider = self._create_provider()
+        rsub = create_remote_subtitle('1')
+        rsub_replaced = OpenSubtitlesSubtitleFile(
+            filename='1.srt', file_size=100, md5_hash='0' * 32, id_online='1', download_link=None, link='',
+            uploader='user', language=Language.from_xxx('eng'), rating=0., date=datetime.datetime(2019, 1, 1))
+        # Contents not matching the hash are not cached.
+        provider.download_subtitles([rsub_replaced])
+        self.assertEqual(len(cache), 0)
+        provider.download_subtitles([rsub])
+        cache.set_subtitle(provider.get_name(), '1', rsub.get_md5_hash(), gzip.compress(b'corrupt'))
+        self.assertEqual(provider.download_subtitles([rsub]), [self.server.subtitle_contents('1')])
+        self.assertEqual(self.server.nb_downloads, 3)
+
+
+class TestAsyncOpenSubtitles(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenSubtitlesServer(delay=0.05)
+        self.addCleanup(self.server.close)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.tempdir = create_temporary_directory()
+        self.videos = []
+        for i in range(23):
+            path = self.tempdir.path / 'movie{}.avi'.format(i)
+            path.write_bytes(b'video' * (i + 1))
+            self.videos.append(VideoFile(path))
+
+    def tearDown(self):
+        del self.tempdir
+
+    def _create_provider(self, search_workers=3):
+        provider = OpenSubtitles(OpenSubtitlesSettings(search_workers=search_workers, request_rate=0.))
+        provider.URL = self.server.get_url()
+        async_provider = provider.create_async_provider()
+        self.assertIsInstance(async_provider, AsyncOpenSubtitles)
+        self.loop.run_until_complete(async_provider.login())
+        self.addCleanup(self.loop.run_until_complete, async_provider.disconnect())
+        return async_provider
+
+    def test_search(self):
+        async_provider = self._create_provider()
+        callback = RecordingProgressCallback()
+        rsubs = self.loop.run_until_complete(async_provider.search_videos(self.videos, callback))
+        self.assertEqual([rsub.get_id_online() for rsub in rsubs],
+                         [video.get_osdb_hash() for video in self.videos])
+        self.assertEqual(self.server.nb_searches, 5)
+        self.assertGreater(self.server.max_in_flight, 1)
+        self.assertLessEqual(self.server.max_in_flight, 3)
+        self.assertEqual(callback.values, [0, 5, 10, 15, 21, 23])
+        self.assertTrue(callback.finished())
+
+    def test_search_hash_in_executor(self):
+        async_provider = self._create_provider()
+        hash_threads = set()
+        for video in self.videos:
+            def get_osdb_hash(get_osdb_hash=video.get_osdb_hash):
+                hash_threads.add(threading.current_thread())
+                return get_osdb_hash()
+            video.get_osdb_hash = get_osdb_hash
+        rsubs = self.loop.run_until_complete(async_provider.search_videos(self.videos, ProgressCallback()))
+        self.assertEqual(len(rsubs), len(self.videos))
+        # The videos are not hashed on the event loop.
+        self.assertTrue(hash_threads)
+        self.assertNotIn(threading.current_thread(), hash_threads)
+
+    def test_search_concurrent_calls(self):
+        async_provider = self._create_provider()
+        video_halves = [self.videos[:10], self.videos[10:]]
+
+        async def search_all():
+            return await asyncio.gather(*[async_provider.search_videos(videos, ProgressCallback())
+                                          for videos in video_halves])
+        results = self.loop.run_until_complete(search_all())
+        for videos, rsubs in zip(video_halves, results):
+            self.assertEqual([rsub.get_id_online() for rsub in rsubs], [video.get_osdb_hash() for video in videos])
+
+    def test_download(self):
+        async_provider = self._create_provider()
+        ids = [str(i) for i in range(45)] + ['0']
+        subtitles = self.loop.run_until_complete(
+            async_provider.download_subtitles([create_remote_subtitle(id_online) for id_online in ids]))
+        self.assertEqual(subtitles, [self.server.subtitle_contents(id_online) for id_online in ids])
+        self.assertEqual(self.server.nb_downloads, 45)
+
+    def test_relogin_on_session_expired(self):
+        async_provider = self._create_provider()
+        self.server.expire_sessions()
+        self.loop.run_until_complete(async_provider.ping())
+        self.assertEqual(self.server.nb_logins, 2)
+
+    def test_not_logged_in(self):
+        provider = OpenSubtitles(OpenSubtitlesSettings(request_rate=0.))
+        with self.assertRaises(ProviderNotConnectedError):
+            self.loop.run_until_complete(provider.create_async_provider().search_videos(self.videos,
+                                                                                       ProgressCallback()))
+
+
+MOVIES_XML = b'''<?xml version="1.0" encoding="utf-8"?>
+<opensubtitles base="http://www.opensubtitles.org">
+  <search>
+    <results items="3" itemsfound="120" searchtime="0.05">
+      <subtitle>
+        <MovieID Link="/en/search/sublanguageid-all/idmovie-1">1</MovieID>
+        <MovieName><![CDATA[The Movie]]></MovieName>
+        <MovieYear>2019</MovieYear>
+        <MovieImdbRating Percent="81">8.1</MovieImdbRating>
+        <MovieImdbID>133093</MovieImdbID>
+        <TotalSubs>12</TotalSubs>
+      </subtitle>
+      <subtitle><ads1>advertisement</ads1></subtitle>
+      <subtitle>
+        <MovieID Link="/en/search/sublanguageid-all/idmovie-2">2</MovieID>
+        <MovieImdbRating Percent="50">5.0</MovieImdbRating>
+        <TotalSubs>invalid</TotalSubs>
+      </subtitle>
+      <subtitle>
+        <MovieID Link="/en/search/sublanguageid-all/idmovie-3">3</MovieID>
+        <MovieName>Another Movie</MovieName>
+        <MovieImdbRating Percent="70">7.0</MovieImdbRating>
+        <TotalSubs>3</TotalSubs>
+      </subtitle>
+    </results>
+  </search>
+</opensubtitles>
+'''
+
+SUBTITLES_XML = b'''<?xml version="1.0" encoding="utf-8"?>
+<opensubtitles base="http://www.opensubtitles.org">
+  <search>
+    <results items="2" itemsfound="12" searchtime="0.05">
+      <subtitle>
+        <IDSubtitle Link="/en/subtitles/10/the-movie-en" uuid="0123456789abcdef">10</IDSubtitle>
+        <IDSubtitleFile>100</IDSubtitleFile>
+        <UserID Link="/en/profile/iduser-5">5</UserID>
+        <UserNickName>uploader</UserNickName>
+        <ISO639 LinkSearch="/en/search/sublanguageid-eng">en</ISO639>
+        <SubFormat>sub</SubFormat>
+        <SubAddDate locale="02/03/2019 10:11:12">2019-03-02</SubAddDate>
+        <SubRating>7.5</SubRating>
+        <SubSize>2048</SubSize>
+        <MovieReleaseName><![CDATA[The.Movie.2019]]></MovieReleaseName>
+      </subtitle>
+      <subtitle><ads2>advertisement</ads2></subtitle>
+      <subtitle>
+        <IDSubtitle Link="/en/subtitles/11/the-movie-nl" uuid="fedcba9876543210">11</IDSubtitle>
+        <IDSubtitleFile>101</IDSubtitleFile>
+        <UserID>0</UserID>
+        <ISO639>nl</ISO639>
+        <SubAddDate locale="03/03/2019 10:11:12">2019-03-03</SubAddDate>
+        <SubRating>0.0</SubRating>
+        <SubSize>1024</SubSize>
+        <MovieName>The Movie</MovieName>
+      </subtitle>
+    </results>
+  </search>
+</opensubtitles>
+'''
+
+
+class TestOpenSubtitlesTextQueryXml(unittest.TestCase):
+    def setUp(self):
+        self.query = OpenSubtitles(OpenSubtitlesSettings(request_rate=0.)).query_text('the movie')
+
+    def test_movies(self):
+        movies, nb_so_far, nb_total = self.query._xml_to_movies(MOVIES_XML)
+        self.assertEqual((nb_so_far, nb_total), (3, 120))
+        # The advertisement and the invalid entry are skipped.
+        self.assertEqual([movie.get_provider_id() for movie in movies], ['1', '3'])
+        self.assertEqual(movies[0].get_provider_link(), '/en/search/sublanguageid-all/idmovie-1')
+        self.assertEqual(movies[0].get_nb_subs_total(), 12)
+        identity = movies[0].get_identities()
+        self.assertEqual(identity.video_identity.get_name(), 'The Movie')
+        self.assertEqual(identity.imdb_identity.get_imdb_id(), '133093')
+        self.assertAlmostEqual(identity.imdb_identity.get_imdb_rating(), 8.1)
+        self.assertIsNone(movies[1].get_identities().imdb_identity.get_imdb_id())
+
+    def test_subtitles(self):
+        subtitles, nb_so_far, nb_total = self.query._xml_to_subtitles(SUBTITLES_XML)
+        self.assertEqual((nb_so_far, nb_total), (2, 12))
+        self.assertEqual([subtitle.get_id_online() for subtitle in subtitles], ['100', '101'])
+        self.assertEqual(subtitles[0].get_filename(), 'The_Movie_2019.sub')
+        self.assertEqual(subtitles[0].get_uploader(), 'uploader')
+        self.assertEqual(subtitles[0].get_link(), 'http://www.opensubtitles.org/en/subtitles/10/the-movie-en')
+        self.assertEqual(subtitles[0].get_md5_hash(), '0123456789abcdef')
+        self.assertEqual(subtitles[0].get_file_size(), 2048)
+        self.assertEqual(subtitles[0].get_language(), Language.from_xx('en'))
+        self.assertEqual(subtitles[1].get_filename(), 'The_Movie.srt')
+        self.assertIsNone(subtitles[1].get_uploader())
+
+    def test_invalid_xml(self):
+        self.assertEqual(self.query._xml_to_movies(MOVIES_XML[:200]), (None, None, None))
+
+    def test_no_results(self):
+        xml = b'<?xml version="1.0" encoding="utf-8"?><opensubtitles><search></search></opensubtitles>'
+        self.assertEqual(self.query._xml_to_movies(xml), ([], 0, 0))
+
+
+def movies_page_xml(offset, page_size, total):
+    entries = ''.join(
+        '<subtitle><MovieID Link="/en/search/idmovie-{id}">{id}</MovieID><MovieName>Movie {id}</MovieName>'
+        '<MovieImdbRating Percent="50">5.0</MovieImdbRating><TotalSubs>1</TotalSubs></subtitle>'.format(id=movie_id)
+        for movie_id in range(offset, min(offset + page_size, total)))
+    return '<?xml version="1.0" encoding="utf-8"?><opensubtitles><search>' \
+           '<results items="{so_far}" itemsfound="{total}">{entries}</results>' \
+           '</search></opensubtitles>'.format(so_far=min(offset + page_size, total), total=total,
+                                              entries=entries).encode()
+
+
+class TestOpenSubtitlesTextQueryPages(unittest.TestCase):
+    PAGE_SIZE = 40
+    TOTAL = 250
+
+    def setUp(self):
+        self.query = OpenSubtitles(OpenSubtitlesSettings(request_rate=0.)).query_text('the movie')
+        self.query._fetch_url = self._fetch_url
+        self.fetched_offsets = []
+        self.nb_running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+        self.release.set()
+
+    def _fetch_url(self, url):
+        offset = int(url.rsplit('/offset-', 1)[1].split('/')[0])
+        with self.lock:
+            self.fetched_offsets.append(offset)
+            self.nb_running += 1
+            self.max_running = max(self.max_running, self.nb_running)
+        # Let later pages finish first, to check the order of the results.
+        time.sleep(.05 * (self.TOTAL - offset) / self.TOTAL)
+        self.release.wait()
+        with self.lock:
+            self.nb_running -= 1
+        return movies_page_xml(offset, self.PAGE_SIZE, self.TOTAL)
+
+    def test_all_pages_in_order(self):
+        pages = list(self.query.iter_more_movie_pages())
+        self.assertEqual([len(movies) for movies in pages], [40, 40, 40, 40, 40, 40, 10])
+        self.assertEqual([movie.get_provider_id() for movie in self.query.get_movies()],
+                         [str(movie_id) for movie_id in range(self.TOTAL)])
+        self.assertEqual(sorted(self.fetched_offsets), list(range(0, self.TOTAL, self.PAGE_SIZE)))
+        self.assertFalse(self.query.more_movies_available())
+        self.assertGreater(self.max_running, 1)
+        self.assertLessEqual(self.max_running, self.query.PAGE_WORKERS)
+
+    def test_failed_page(self):
+        fetch_url = self._fetch_url
+
+        def failing_fetch_url(url):
+            if url.endswith('/offset-120/xml'):
+                return None
+            return fetch_url(url)
+        self.query._fetch_url = failing_fetch_url
+        with self.assertRaises(OpenSubtitlesProviderConnectionError):
+            for _movies in self.query.iter_more_movie_pages():
+                pass
+        # The pages before the failed page are kept, so the search can continue.
+        self.assertEqual(len(self.query.get_movies()), 120)
+        self.assertTrue(self.query.more_movies_available())
+
+    def test_prefetch(self):
+        self.query.search_more_movies()
+        self.release.clear()
+        self.query.prefetch_more_movies()
+        self.query.prefetch_more_movies()
+        self.assertEqual(len(self.query.get_movies()), 40)
+        self.release.set()
+        movies = self.query.search_more_movies()
+        self.assertEqual([movie.get_provider_id() for movie in movies], [str(movie_id) for movie_id in range(40, 80)])
+        self.assertEqual(self.fetched_offsets, [0, 40])
+
+    def test_prefetch_failed(self):
+        self.query.search_more_movies()
+        self.query._fetch_url = lambda url: None
+        self.query.prefetch_more_movies()
+        self.query._prefetch[1].exception()
+        self.query._fetch_url = self._fetch_url
+        movies = self.query.search_more_movies()
+        self.assertEqual(len(movies), 40)
+        self.assertEqual(self.fetched_offsets, [0, 40])
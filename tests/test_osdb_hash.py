@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+
+import os
+import unittest
+
+from subdownloader import osdb_hash
+
+from tests.util import create_temporary_directory
+
+
+class TestOsdbHash(unittest.TestCase):
+    SIZES = [0, 7, 8, 100, osdb_hash.BLOCK_SIZE - 1, osdb_hash.BLOCK_SIZE, osdb_hash.BLOCK_SIZE + 3, 200 << 10]
+
+    def setUp(self):
+        self.tempdir = create_temporary_directory()
+        self.paths = []
+        for size in self.SIZES:
+            path = self.tempdir.path / 'video{}.avi'.format(size)
+            path.write_bytes(os.urandom(size))
+            self.paths.append(path)
+        self.sum_words = osdb_hash.sum_words
+
+    def tearDown(self):
+        osdb_hash.sum_words = self.sum_words
+        del self.tempdir
+
+    def assertKernelIdentical(self, kernel):
+        for path in self.paths:
+            size = path.stat().st_size
+            with path.open('rb') as f:
+                reference = osdb_hash.osdb_hash_struct(f, size)
+            with path.open('rb') as f:
+                self.assertEqual(kernel(f, size), reference, 'size={}'.format(size))
+
+    def test_readinto(self):
+        self.assertKernelIdentical(osdb_hash.osdb_hash_readinto)
+
+    def test_mmap(self):
+        self.assertKernelIdentical(osdb_hash.osdb_hash_mmap)
+
+    def test_array(self):
+        osdb_hash.sum_words = osdb_hash._sum_words_array
+        self.assertKernelIdentical(osdb_hash.osdb_hash_readinto)
+        self.assertKernelIdentical(osdb_hash.osdb_hash_mmap)
+
+    @unittest.skipIf(not osdb_hash.NUMPY_AVAILABLE, 'NumPy not available')
+    def test_numpy(self):
+        osdb_hash.sum_words = osdb_hash._sum_words_numpy
+        self.assertKernelIdentical(osdb_hash.osdb_hash_readinto)
+        self.assertKernelIdentical(osdb_hash.osdb_hash_mmap)
+
+    def test_overflow(self):
+        path = self.tempdir.path / 'ones.avi'
+        path.write_bytes(b'\xff' * (200 << 10))
+        self.paths = [path]
+        self.assertKernelIdentical(osdb_hash.osdb_hash_readinto)
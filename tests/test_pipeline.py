@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+
+import threading
+import unittest
+
+from subdownloader.cache import FileIdentity, VideoStateCache
+from subdownloader.client.incremental import IncrementalScan
+from subdownloader.client.pipeline import SubtitlePipeline
+from subdownloader.client.state import BaseState
+from subdownloader.languages.language import Language
+from subdownloader.provider.opensubtitles import OpenSubtitles
+from subdownloader.provider.provider import ProviderQuotaExceededError
+from subdownloader.subtitle2 import LocalSubtitleFile, RemoteSubtitleFile
+from subdownloader.util import IllegalPathException
+
+from tests.util import create_temporary_directory
+
+
+class FakeRemoteSubtitleFile(RemoteSubtitleFile):
+    def __init__(self, video):
+        RemoteSubtitleFile.__init__(self, filename='{}.srt'.format(video.get_filepath().stem),
+                                    language=Language.from_xx('en'), file_size=8,
+                                    md5_hash='{}'.format(video.get_osdb_hash()))
+
+    def get_provider(self):
+        return OpenSubtitles
+
+    def download(self, target_path, provider_instance, callback):
+        target_path.write_bytes(b'subtitle')
+        return LocalSubtitleFile(filepath=target_path)
+
+
+class QuotaRemoteSubtitleFile(FakeRemoteSubtitleFile):
+    quota = 0
+    lock = threading.Lock()
+
+    def download(self, target_path, provider_instance, callback):
+        with QuotaRemoteSubtitleFile.lock:
+            if not QuotaRemoteSubtitleFile.quota:
+                raise ProviderQuotaExceededError(3)
+            QuotaRemoteSubtitleFile.quota -= 1
+        return FakeRemoteSubtitleFile.download(self, target_path, provider_instance, callback)
+
+
+class FakeSearchState(BaseState):
+    def __init__(self):
+        BaseState.__init__(self)
+        self.search_threads = set()
+        self.searched = []
+        self.remote_subtitle_class = FakeRemoteSubtitleFile
+
+    def search_videos(self, videos, callback):
+        self.search_threads.add(threading.current_thread())
+        self.searched.extend(videos)
+        for video in videos:
+            if video.get_filepath().stem.endswith('_nosub'):
+                continue
+            video.add_subtitle(self.remote_subtitle_class(video))
+
+
+class TestSubtitlePipeline(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = create_temporary_directory()
+        for dir_name in ('a', 'b'):
+            directory = self.tempdir.path / dir_name
+            directory.mkdir()
+            for i in range(10):
+                (directory / 'movie{}.avi'.format(i)).write_bytes(b'video' * (i + 1))
+            (directory / 'movie_nosub.avi').write_bytes(b'video')
+        self.state = FakeSearchState()
+        self.state.set_video_paths([self.tempdir.path])
+        self.state.set_recursive(True)
+
+    def tearDown(self):
+        del self.tempdir
+
+    @staticmethod
+    def _select_first(video):
+        for network in video.get_subtitles():
+            for subtitle in network.get_subtitles():
+                if subtitle.is_remote():
+                    return subtitle
+        return None
+
+    def test_run(self):
+        pipeline = SubtitlePipeline(self.state, self._select_first, None, queue_size=2, hash_workers=3,
+                                    search_batch=4, download_workers=2)
+        statistics = pipeline.run()
+        self.assertEqual(statistics.get('scanned'), 22)
+        self.assertEqual(statistics.get('hashed'), 22)
+        self.assertEqual(statistics.get('searched'), 22)
+        self.assertEqual(statistics.get('downloaded'), 20)
+        self.assertEqual(statistics.get('failed'), 0)
+        self.assertGreater(statistics.get_videos_per_second(), 0)
+        self.assertEqual(len(pipeline.get_videos()), 22)
+        self.assertNotIn(threading.current_thread(), self.state.search_threads)
+        for video in pipeline.get_videos():
+            # Same naming as calculate_download_path
+            subtitle_path = video.get_folderpath() / '{}.srt'.format(video.get_filepath().stem)
+            self.assertEqual(subtitle_path.exists(), not video.get_filepath().stem.endswith('_nosub'))
+
+    def test_conflict_free(self):
+        pipeline = SubtitlePipeline(self.state, self._select_first, None)
+        pipeline.run()
+        pipeline.run()
+        self.assertEqual(len(list(self.tempdir.path.glob('*/*.srt'))), 40)
+
+    def test_quota_exceeded(self):
+        QuotaRemoteSubtitleFile.quota = 3
+        self.state.remote_subtitle_class = QuotaRemoteSubtitleFile
+        incremental_cache = VideoStateCache(':memory:')
+        incremental = IncrementalScan(incremental_cache, [])
+        statistics = SubtitlePipeline(self.state, self._select_first, None, incremental=incremental).run()
+        self.assertEqual(statistics.get('downloaded'), 3)
+        self.assertEqual(statistics.get('deferred'), 17)
+        self.assertEqual(statistics.get('failed'), 0)
+        self.assertEqual(len(list(self.tempdir.path.glob('*/*.srt'))), 3)
+
+        # Deferred videos are searched again in the next run, unlike satisfied videos and videos without subtitles.
+        QuotaRemoteSubtitleFile.quota = 100
+        statistics = SubtitlePipeline(self.state, self._select_first, None, incremental=incremental).run()
+        self.assertEqual(statistics.get('skipped'), 5)
+        self.assertEqual(statistics.get('downloaded'), 17)
+        incremental_cache.close()
+
+    def test_search_error(self):
+        def search_videos(videos, callback):
+            raise TypeError('unexpected result')
+        self.state.search_videos = search_videos
+        # A failing search must not stall the stages before it.
+        statistics = SubtitlePipeline(self.state, self._select_first, None, queue_size=2, search_batch=4).run()
+        self.assertEqual(statistics.get('hashed'), 22)
+        self.assertEqual(statistics.get('searched'), 0)
+        self.assertEqual(statistics.get('failed'), 22)
+
+    def test_illegal_path(self):
+        self.state.set_video_paths([self.tempdir.path / 'nonexisting'])
+        pipeline = SubtitlePipeline(self.state, self._select_first, None)
+        with self.assertRaises(IllegalPathException):
+            pipeline.run()
+
+
+class TestIncrementalPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = create_temporary_directory()
+        self.video_dir = self.tempdir.path / 'videos'
+        self.video_dir.mkdir()
+        for i in range(5):
+            (self.video_dir / 'movie{}.avi'.format(i)).write_bytes(b'video' * (i + 1))
+        (self.video_dir / 'movie_nosub.avi').write_bytes(b'video')
+        self.state = FakeSearchState()
+        self.state.set_video_paths([self.video_dir])
+        self.cache = VideoStateCache(self.tempdir.path / 'incremental.sqlite')
+
+    def tearDown(self):
+        self.cache.close()
+        del self.tempdir
+
+    def _run(self, backoff=None, now=None):
+        class FixedTimeIncrementalScan(IncrementalScan):
+            @staticmethod
+            def _now():
+                return IncrementalScan._now() if now is None else now
+
+        incremental = FixedTimeIncrementalScan(self.cache, [], backoff=backoff)
+        self.state.searched = []
+        pipeline = SubtitlePipeline(self.state, TestSubtitlePipeline._select_first, None, incremental=incremental)
+        return pipeline.run()
+
+    def test_skip(self):
+        statistics = self._run()
+        self.assertEqual(statistics.get('skipped'), 0)
+        self.assertEqual(statistics.get('downloaded'), 5)
+
+        statistics = self._run()
+        self.assertEqual(statistics.get('scanned'), 6)
+        self.assertEqual(statistics.get('skipped'), 6)
+        self.assertListEqual(self.state.searched, [])
+
+    def test_satisfied_elsewhere(self):
+        self._run()
+        for subtitle_path in self.video_dir.glob('*.srt'):
+            subtitle_path.unlink()
+        # The subtitles were downloaded before: the state file remembers it.
+        statistics = self._run()
+        self.assertEqual(statistics.get('skipped'), 6)
+
+    def test_backoff(self):
+        nosub_path = self.video_dir / 'movie_nosub.avi'
+        identity = FileIdentity.from_stat(nosub_path.stat())
+        self._run(backoff=3600)
+        self.assertEqual(self.cache.get_video_state(identity).nb_searches, 1)
+
+        last_search = self.cache.get_video_state(identity).last_search
+        statistics = self._run(backoff=3600, now=last_search + 1800)
+        self.assertEqual(statistics.get('skipped'), 6)
+
+        statistics = self._run(backoff=3600, now=last_search + 3601)
+        self.assertEqual(statistics.get('skipped'), 5)
+        self.assertEqual([video.get_filepath() for video in self.state.searched], [nosub_path])
+        self.assertEqual(self.cache.get_video_state(identity).nb_searches, 2)
+
+        # Modifying the video resets its state.
+        nosub_path.write_bytes(b'modified video')
+        statistics = self._run(backoff=3600)
+        self.assertEqual(statistics.get('skipped'), 5)
+
+    def test_backoff_doubles(self):
+        incremental = IncrementalScan(self.cache, [], backoff=10, max_backoff=50)
+        self.assertListEqual([incremental.get_backoff(n) for n in range(6)], [0, 10, 20, 40, 50, 50])
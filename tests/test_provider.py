@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+
+import asyncio
+import threading
+import unittest
+
+from subdownloader.cache import DownloadCountCache, set_default_download_count_cache
+from subdownloader.provider import AdaptiveWindow, DownloadQuota, RateLimiter, window_iterator
+from subdownloader.callback import ProgressCallback
+from subdownloader.provider.provider import AsyncProviderAdapter, ProviderQuotaExceededError, SubtitleProvider
+
+
+class FakeTimeRateLimiter(RateLimiter):
+    time = 0.
+    slept = []
+
+    @staticmethod
+    def _now():
+        return FakeTimeRateLimiter.time
+
+    @staticmethod
+    def _sleep(duration):
+        FakeTimeRateLimiter.slept.append(duration)
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        FakeTimeRateLimiter.time = 0.
+        FakeTimeRateLimiter.slept = []
+
+    def test_unlimited(self):
+        limiter = FakeTimeRateLimiter(None)
+        for _ in range(10):
+            self.assertEqual(limiter.acquire(), 0.)
+        self.assertEqual(FakeTimeRateLimiter.slept, [])
+
+    def test_rate(self):
+        limiter = FakeTimeRateLimiter(2.)
+        self.assertEqual(limiter.acquire(), 0.)
+        self.assertAlmostEqual(limiter.acquire(), .5)
+        # A waiting request reserves its token: the next one waits longer.
+        self.assertAlmostEqual(limiter.acquire(), 1.)
+        FakeTimeRateLimiter.time = 10.
+        self.assertEqual(limiter.acquire(), 0.)
+        self.assertEqual(len(FakeTimeRateLimiter.slept), 2)
+
+    def test_reserve(self):
+        limiter = FakeTimeRateLimiter(2.)
+        self.assertEqual(limiter.reserve(), 0.)
+        self.assertAlmostEqual(limiter.reserve(), .5)
+        # Reserving does not sleep: the caller waits.
+        self.assertEqual(FakeTimeRateLimiter.slept, [])
+
+    def test_burst(self):
+        limiter = FakeTimeRateLimiter(1., burst=3)
+        for _ in range(3):
+            self.assertEqual(limiter.acquire(), 0.)
+        self.assertAlmostEqual(limiter.acquire(), 1.)
+
+
+class FakeSyncProvider(SubtitleProvider):
+    def __init__(self):
+        SubtitleProvider.__init__(self)
+        self.threads = []
+
+    def disconnect(self):
+        pass
+
+    def search_videos(self, videos, callback, language=None):
+        self.threads.append(threading.current_thread())
+        return ['rsub_{}'.format(video) for video in videos]
+
+    def iter_write_subtitles(self, rsub_paths):
+        for rsub, target_path in rsub_paths:
+            target_path.write_bytes(rsub.encode())
+            yield rsub, None
+
+    @classmethod
+    def get_name(cls):
+        return 'fake'
+
+
+class TestAsyncProviderAdapter(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.provider = FakeSyncProvider()
+        self.async_provider = self.provider.create_async_provider()
+
+    def test_adapter(self):
+        self.assertIsInstance(self.async_provider, AsyncProviderAdapter)
+        self.assertIs(self.async_provider.provider, self.provider)
+        self.assertEqual(self.async_provider.get_name(), 'fake')
+
+    def test_search_videos(self):
+        rsubs = self.loop.run_until_complete(self.async_provider.search_videos(['a', 'b'], ProgressCallback()))
+        self.assertEqual(rsubs, ['rsub_a', 'rsub_b'])
+        # The blocking call does not run in the thread of the event loop.
+        self.assertNotIn(threading.current_thread(), self.provider.threads)
+
+    def test_download_subtitles(self):
+        subtitles = self.loop.run_until_complete(self.async_provider.download_subtitles(['a', 'b']))
+        self.assertEqual(subtitles, [b'a', b'b'])
+
+
+class TestWindowIterator(unittest.TestCase):
+    def test_windows(self):
+        self.assertEqual(list(window_iterator(list(range(7)), 3)), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(window_iterator([], 3)), [])
+
+    def test_adaptive_windows(self):
+        window = AdaptiveWindow('test', initial=2, maximum=4, target_latency=1.)
+        windows = []
+        for data in window_iterator(list(range(12)), window.get_size):
+            windows.append(data)
+            window.record_success(len(data), .1)
+        self.assertEqual(windows, [[0, 1], [2, 3, 4], [5, 6, 7, 8], [9, 10, 11]])
+        self.assertEqual(window.get_size(), 4)
+
+
+class TestAdaptiveWindow(unittest.TestCase):
+    def test_grow(self):
+        window = AdaptiveWindow('test', initial=5, maximum=7, target_latency=1.)
+        window.record_success(5, .5)
+        self.assertEqual(window.get_size(), 6)
+        # A partial window does not tell whether a larger one is fast enough.
+        window.record_success(3, .5)
+        self.assertEqual(window.get_size(), 6)
+        window.record_success(6, .5)
+        window.record_success(7, .5)
+        self.assertEqual(window.get_size(), 7)
+
+    def test_shrink(self):
+        window = AdaptiveWindow('test', initial=8, maximum=20, target_latency=1.)
+        window.record_success(8, 2.)
+        self.assertEqual(window.get_size(), 7)
+        window.record_failure(7, 10.)
+        self.assertEqual(window.get_size(), 3)
+        window.record_failure(3, 10.)
+        window.record_failure(1, 10.)
+        self.assertEqual(window.get_size(), 1)
+
+    def test_statistics(self):
+        window = AdaptiveWindow('test', initial=5, maximum=20)
+        window.record_success(5, .5)
+        window.record_failure(6, 3.)
+        self.assertEqual([(s.size, s.success) for s in window.get_statistics()], [(5, True), (6, False)])
+        for _ in range(AdaptiveWindow.STATISTICS_LENGTH):
+            window.record_success(1, .5)
+        self.assertEqual(len(window.get_statistics()), AdaptiveWindow.STATISTICS_LENGTH)
+
+    def test_size_bounds(self):
+        window = AdaptiveWindow('test', initial=50, maximum=20, minimum=2)
+        self.assertEqual(window.get_size(), 20)
+        window.set_size(0)
+        self.assertEqual(window.get_size(), 2)
+
+
+class FixedDayDownloadQuota(DownloadQuota):
+    day = '2019-01-01'
+
+    @staticmethod
+    def _today():
+        return FixedDayDownloadQuota.day
+
+
+class TestDownloadQuota(unittest.TestCase):
+    def setUp(self):
+        FixedDayDownloadQuota.day = '2019-01-01'
+
+    def tearDown(self):
+        set_default_download_count_cache(None)
+
+    def _test_quota(self):
+        quota = FixedDayDownloadQuota('provider', 10)
+        quota.check(10)
+        quota.add(8)
+        self.assertEqual(quota.get_count(), 8)
+        self.assertEqual(quota.get_remaining(), 2)
+        with self.assertRaises(ProviderQuotaExceededError):
+            quota.check(3)
+        quota.check(2)
+        FixedDayDownloadQuota.day = '2019-01-02'
+        self.assertEqual(quota.get_remaining(), 10)
+        quota.add(1)
+        self.assertEqual(quota.get_count(), 1)
+
+    def test_memory(self):
+        self._test_quota()
+
+    def test_cache(self):
+        cache = DownloadCountCache(':memory:')
+        set_default_download_count_cache(cache)
+        self._test_quota()
+        # The count is shared with other instances, such as the provider of the next run.
+        self.assertEqual(FixedDayDownloadQuota('provider', 10).get_count(), 1)
+        cache.close()
+
+    def test_no_limit(self):
+        quota = FixedDayDownloadQuota('provider', 0)
+        quota.add(1000)
+        quota.check(1000)
+        self.assertIsNone(quota.get_remaining())
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+
+import asyncio
+import unittest
+
+from subdownloader.provider.retry import CircuitBreaker, CircuitOpenError, is_retryable_http_code, \
+    RetryableError, RetryPolicy
+
+
+class FakeClock(object):
+    time = 0.
+    slept = []
+
+    @staticmethod
+    def now():
+        return FakeClock.time
+
+    @staticmethod
+    def sleep(duration):
+        FakeClock.slept.append(duration)
+        FakeClock.time += duration
+
+
+class FakeTimeRetryPolicy(RetryPolicy):
+    _now = staticmethod(FakeClock.now)
+    _sleep = staticmethod(FakeClock.sleep)
+
+
+class FakeTimeCircuitBreaker(CircuitBreaker):
+    _now = staticmethod(FakeClock.now)
+
+
+class FailingCall(object):
+    def __init__(self, nb_failures, exception=None):
+        self.nb_failures = nb_failures
+        self.exception = RetryableError('busy') if exception is None else exception
+        self.nb_calls = 0
+
+    def __call__(self):
+        self.nb_calls += 1
+        if self.nb_calls <= self.nb_failures:
+            raise self.exception
+        return 'result'
+
+
+class TestRetryPolicy(unittest.TestCase):
+    def setUp(self):
+        FakeClock.time = 0.
+        FakeClock.slept = []
+
+    def test_retry(self):
+        policy = FakeTimeRetryPolicy(max_attempts=4, base_delay=1.)
+        call = FailingCall(3)
+        self.assertEqual(policy.execute(call), 'result')
+        self.assertEqual(call.nb_calls, 4)
+        self.assertEqual(len(FakeClock.slept), 3)
+        for attempt, delay in enumerate(FakeClock.slept):
+            self.assertLessEqual(delay, 2 ** attempt)
+
+    def test_max_attempts(self):
+        policy = FakeTimeRetryPolicy(max_attempts=3)
+        call = FailingCall(5)
+        with self.assertRaises(RetryableError):
+            policy.execute(call)
+        self.assertEqual(call.nb_calls, 3)
+
+    def test_fatal(self):
+        policy = FakeTimeRetryPolicy()
+        call = FailingCall(1, exception=ValueError())
+        with self.assertRaises(ValueError):
+            policy.execute(call)
+        self.assertEqual(call.nb_calls, 1)
+
+    def test_deadline(self):
+        policy = FakeTimeRetryPolicy(max_attempts=100, base_delay=10., max_delay=10., deadline=25.)
+        call = FailingCall(100)
+        with self.assertRaises(RetryableError):
+            policy.execute(call)
+        self.assertLessEqual(sum(FakeClock.slept), 25.)
+
+    def test_retry_async(self):
+        policy = RetryPolicy(max_attempts=4, base_delay=0.)
+        call = FailingCall(3)
+
+        async def async_call():
+            return call()
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        self.assertEqual(loop.run_until_complete(policy.execute_async(async_call)), 'result')
+        self.assertEqual(call.nb_calls, 4)
+
+    def test_deadline_async(self):
+        policy = RetryPolicy(max_attempts=100, base_delay=0., deadline=.2)
+        nb_calls = []
+
+        async def hanging_call():
+            nb_calls.append(1)
+            await asyncio.sleep(10.)
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        with self.assertRaises(RetryableError):
+            loop.run_until_complete(asyncio.wait_for(policy.execute_async(hanging_call), 2.))
+        # The hanging attempt is cancelled at the deadline and not retried.
+        self.assertEqual(len(nb_calls), 1)
+
+    def test_delay(self):
+        policy = RetryPolicy(base_delay=1., max_delay=5.)
+        for attempt in range(10):
+            self.assertLessEqual(policy.get_delay(attempt), min(5., 2 ** attempt))
+
+    def test_http_codes(self):
+        self.assertTrue(is_retryable_http_code(503))
+        self.assertTrue(is_retryable_http_code(429))
+        self.assertFalse(is_retryable_http_code(404))
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        FakeClock.time = 0.
+        FakeClock.slept = []
+
+    def test_open(self):
+        breaker = FakeTimeCircuitBreaker(failure_threshold=3, reset_timeout=10.)
+        policy = FakeTimeRetryPolicy(max_attempts=2, base_delay=0.)
+        with self.assertRaises(RetryableError):
+            policy.execute(FailingCall(10), breaker)
+        self.assertFalse(breaker.is_open())
+        with self.assertRaises(CircuitOpenError):
+            policy.execute(FailingCall(10), breaker)
+        self.assertTrue(breaker.is_open())
+        call = FailingCall(0)
+        with self.assertRaises(CircuitOpenError):
+            policy.execute(call, breaker)
+        self.assertEqual(call.nb_calls, 0)
+
+    def test_half_open(self):
+        breaker = FakeTimeCircuitBreaker(failure_threshold=1, reset_timeout=10.)
+        breaker.record_failure()
+        FakeClock.time = 11.
+        # The trial call fails: open again.
+        breaker.before_call()
+        breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        FakeClock.time = 22.
+        breaker.before_call()
+        # Only one trial call at a time.
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        self.assertFalse(breaker.is_open())
+        breaker.before_call()
+
+    def test_trial_aborted(self):
+        breaker = FakeTimeCircuitBreaker(failure_threshold=1, reset_timeout=10.)
+        policy = FakeTimeRetryPolicy(max_attempts=1)
+        breaker.record_failure()
+        FakeClock.time = 11.
+        # The trial call raises an exception that is not a transient failure: open again.
+        with self.assertRaises(ValueError):
+            policy.execute(FailingCall(1, ValueError('invalid')), breaker)
+        with self.assertRaises(CircuitOpenError):
+            policy.execute(FailingCall(0), breaker)
+        FakeClock.time = 22.
+        self.assertEqual(policy.execute(FailingCall(0), breaker), 'result')
+        self.assertFalse(breaker.is_open())
+
+    def test_trial_aborted_async(self):
+        breaker = FakeTimeCircuitBreaker(failure_threshold=1, reset_timeout=10.)
+        policy = FakeTimeRetryPolicy(max_attempts=1)
+        breaker.record_failure()
+        FakeClock.time = 11.
+
+        async def cancelled_call():
+            raise asyncio.CancelledError()
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        with self.assertRaises(asyncio.CancelledError):
+            loop.run_until_complete(policy.execute_async(cancelled_call, breaker))
+        FakeClock.time = 22.
+        breaker.before_call()
+        breaker.record_success()
+        self.assertFalse(breaker.is_open())
+
+    def test_error_closed(self):
+        breaker = FakeTimeCircuitBreaker(failure_threshold=1)
+        policy = FakeTimeRetryPolicy(max_attempts=1)
+        # Other exceptions do not count as failures.
+        with self.assertRaises(ValueError):
+            policy.execute(FailingCall(1, ValueError('invalid')), breaker)
+        self.assertFalse(breaker.is_open())
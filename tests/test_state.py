@@ -1,11 +1,19 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
 
+import threading
+import time
 import unittest
 
 from subdownloader.client.arguments import get_argument_options
-from subdownloader.client.state import BaseState
+from subdownloader.callback import ProgressCallback
+from subdownloader.client.state import BaseState, ProviderFanOut, ProviderState, ProviderStateCallback
 from subdownloader.client.configuration import Settings
+from subdownloader.provider.opensubtitles import OpenSubtitles
+from subdownloader.provider.provider import ProviderConnectionError, ProviderTimeoutError, SubtitleProvider
+from subdownloader.video2 import VideoFile
+
+from tests.test_opensubtitles import create_remote_subtitle
 
 from tests.util import create_temporary_directory
 
@@ -36,3 +44,227 @@ class TestBaseState(unittest.TestCase):
 
         copyState = BaseState()
         copyState.load_settings(self.settings)
+
+    def test_save_load_adaptive_windows(self):
+        provider = self.state.providers.get(OpenSubtitles).provider
+        for window in provider.get_adaptive_windows():
+            window.set_size(window.get_size() - 1)
+        sizes = [window.get_size() for window in provider.get_adaptive_windows()]
+        self.state.save_settings(self.settings)
+
+        copyState = BaseState()
+        copyState.load_settings(self.settings)
+        copy_provider = copyState.providers.get(OpenSubtitles).provider
+        self.assertListEqual(sizes, [window.get_size() for window in copy_provider.get_adaptive_windows()])
+
+    def test_iter_write_subtitles(self):
+        class UnavailableProvider(SubtitleProvider):
+            @classmethod
+            def get_name(cls):
+                return 'unavailable'
+
+        provider = self.state.providers.get(OpenSubtitles).provider
+        batches = []
+
+        def iter_write_subtitles(rsub_paths):
+            batches.append(rsub_paths)
+            for rsub, target_path in rsub_paths:
+                yield rsub, target_path
+        provider.iter_write_subtitles = iter_write_subtitles
+
+        rsubs = [create_remote_subtitle(str(i)) for i in range(3)]
+        rsub_unavailable = create_remote_subtitle('3')
+        rsub_unavailable.get_provider = lambda: UnavailableProvider
+        rsub_paths = [(rsub, self.tempdir.path / '{}.srt'.format(i))
+                      for i, rsub in enumerate(rsubs[:2] + [rsub_unavailable] + rsubs[2:])]
+        written = list(self.state.providers.iter_write_subtitles(rsub_paths))
+        # The subtitle of the unavailable provider is yielded without local subtitle.
+        map_rsub_path = dict(rsub_paths)
+        self.assertEqual(written, [(rsub, map_rsub_path[rsub]) for rsub in rsubs] + [(rsub_unavailable, None)])
+        # All subtitles of a provider are passed at once.
+        self.assertEqual(len(batches), 1)
+        self.assertEqual([rsub for rsub, _ in batches[0]], rsubs)
+
+
+class FakeProviderState(object):
+    def __init__(self, name):
+        class FakeProvider(object):
+            @staticmethod
+            def get_name():
+                return name
+        self.provider = FakeProvider()
+
+
+class TestProviderFanOut(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+
+    def test_parallel(self):
+        provider_states = [FakeProviderState(str(i)) for i in range(4)]
+
+        def operation(provider_state, callback):
+            time.sleep(.3)
+            return provider_state.provider.get_name()
+
+        start = time.monotonic()
+        results, failures = ProviderFanOut().run(provider_states, operation)
+        self.assertLess(time.monotonic() - start, 1.)
+        self.assertListEqual([(state, state.provider.get_name()) for state in provider_states], results)
+        self.assertListEqual([], failures)
+
+    def test_failure_isolated(self):
+        provider_states = [FakeProviderState(str(i)) for i in range(3)]
+
+        def operation(provider_state, callback):
+            name = provider_state.provider.get_name()
+            if name == '0':
+                raise ProviderConnectionError('failed')
+            if name == '1':
+                raise ValueError()
+            return name
+
+        results, failures = ProviderFanOut().run(provider_states, operation)
+        self.assertListEqual([(provider_states[2], '2')], results)
+        self.assertListEqual(provider_states[:2], [state for state, _ in failures])
+        self.assertIsInstance(failures[0][1], ProviderConnectionError)
+        self.assertIsInstance(failures[1][1], ValueError)
+
+    def test_timeout(self):
+        provider_states = [FakeProviderState('slow'), FakeProviderState('fast')]
+        callbacks = []
+
+        def operation(provider_state, callback):
+            if provider_state.provider.get_name() == 'slow':
+                callbacks.append(callback)
+                self.release.wait(10)
+            return provider_state.provider.get_name()
+
+        start = time.monotonic()
+        results, failures = ProviderFanOut(timeout=.2).run(provider_states, operation)
+        self.assertLess(time.monotonic() - start, 2.)
+        self.assertListEqual([(provider_states[1], 'fast')], results)
+        self.assertEqual(1, len(failures))
+        self.assertIs(provider_states[0], failures[0][0])
+        self.assertIsInstance(failures[0][1], ProviderTimeoutError)
+        # The abandoned operation is asked to stop.
+        self.assertTrue(callbacks[0].canceled())
+
+    def test_canceled_in_calling_thread(self):
+        provider_states = [FakeProviderState(str(i)) for i in range(2)]
+        canceled_threads = set()
+
+        class ThreadProgressCallback(ProgressCallback):
+            def canceled(self):
+                canceled_threads.add(threading.current_thread())
+                return ProgressCallback.canceled(self)
+
+        def operation(provider_state, callback):
+            deadline = time.monotonic() + 5.
+            while not callback.canceled() and time.monotonic() < deadline:
+                time.sleep(.01)
+            return callback.canceled()
+
+        callback = ThreadProgressCallback()
+        callback.cancel()
+        results, failures = ProviderFanOut().run(provider_states, operation, callback=callback)
+        self.assertListEqual([True, True], [result for state, result in results])
+        self.assertSetEqual({threading.current_thread()}, canceled_threads)
+
+    def test_progress_in_calling_thread(self):
+        provider_states = [FakeProviderState(str(i)) for i in range(2)]
+        update_threads = set()
+
+        class ThreadProgressCallback(ProgressCallback):
+            def on_update(self, value, *args, **kwargs):
+                update_threads.add(threading.current_thread())
+
+        def operation(provider_state, callback):
+            callback.set_range(0, 2)
+            for i in range(3):
+                callback.update(i)
+                time.sleep(.15)
+
+        callback = ThreadProgressCallback()
+        ProviderFanOut().run(provider_states, operation, callback=callback)
+        self.assertSetEqual({threading.current_thread()}, update_threads)
+
+
+class TestBaseStateFanOut(unittest.TestCase):
+    def setUp(self):
+        self.state = BaseState()
+        self.provider = self.state.providers.get(OpenSubtitles).provider
+        self.tempdir = create_temporary_directory()
+        video_path = self.tempdir.path / 'video.avi'
+        video_path.write_bytes(b'video')
+        self.video = VideoFile(video_path)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+        del self.tempdir
+
+    def test_search_timeout_default(self):
+        self.assertEqual(BaseState.DEFAULT_SEARCH_TIMEOUT, self.state.get_search_timeout())
+
+    def test_search_videos_merged(self):
+        rsub = create_remote_subtitle('1')
+
+        def search_videos(videos, callback):
+            self.assertIsNot(self.video, videos[0])
+            self.assertEqual(self.video.get_filepath(), videos[0].get_filepath())
+            videos[0].add_subtitle(rsub)
+            return [rsub]
+        self.provider.search_videos = search_videos
+        prov_rsubs = self.state.search_videos([self.video], ProgressCallback())
+        self.assertDictEqual({self.provider: [rsub]}, prov_rsubs)
+        self.assertEqual(1, self.video.get_subtitles().get_nb_subtitles())
+        self.assertIs(self.video, rsub.get_parent().get_parent().get_parent())
+
+    def test_search_videos_timeout(self):
+        slow_state = ProviderState(OpenSubtitles(), ProviderStateCallback())
+        self.state.providers._providerStates.append(slow_state)
+        finished = threading.Event()
+
+        def slow_search_videos(videos, callback):
+            self.release.wait()
+            videos[0].add_subtitle(create_remote_subtitle('1'))
+            finished.set()
+            return []
+        slow_state.provider.search_videos = slow_search_videos
+        self.provider.search_videos = lambda videos, callback: []
+        self.state.set_search_timeout(.2)
+        prov_rsubs = self.state.search_videos([self.video], ProgressCallback())
+        self.assertDictEqual({self.provider: []}, prov_rsubs)
+        # The abandoned search does not modify the video after search_videos returned.
+        self.release.set()
+        self.assertTrue(finished.wait(1.))
+        self.assertEqual(0, self.video.get_subtitles().get_nb_subtitles())
+
+    def test_search_videos(self):
+        self.provider.search_videos = lambda videos, callback: ['rsub']
+        prov_rsubs = self.state.search_videos([], ProgressCallback())
+        self.assertDictEqual({self.provider: ['rsub']}, prov_rsubs)
+
+    def test_search_videos_failed(self):
+        def search_videos(videos, callback):
+            raise ProviderConnectionError('failed')
+        self.provider.search_videos = search_videos
+        with self.assertRaises(ProviderConnectionError):
+            self.state.search_videos([], ProgressCallback())
+
+    def test_login_failed(self):
+        def login():
+            raise ProviderConnectionError('failed')
+        self.provider.login = login
+        self.state.providers.login()
+        self.assertFalse(self.state.providers.logged_in())
+
+    def test_ping_failed(self):
+        def ping():
+            raise ProviderConnectionError('failed')
+        self.provider.ping = ping
+        with self.assertRaises(ProviderConnectionError):
+            self.state.providers.ping()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+
+import hashlib
+import os
+import unittest
+
+from tests.util import create_temporary_directory
+
+from subdownloader.cache import FileHashCache, set_default_file_hash_cache
+from subdownloader.callback import ProgressCallback
+from subdownloader.subtitle2 import LocalSubtitleFile, hash_subtitles
+
+
+class TestLocalSubtitleFileHash(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = create_temporary_directory()
+        self.paths = []
+        for i in range(20):
+            path = self.tempdir.path / 'movie{}.en.srt'.format(i)
+            path.write_bytes(os.urandom((i + 1) << 10))
+            self.paths.append(path)
+
+    def tearDown(self):
+        set_default_file_hash_cache(None)
+        del self.tempdir
+
+    def test_lazy(self):
+        subtitle = LocalSubtitleFile(self.paths[0])
+        expected = hashlib.md5(self.paths[0].read_bytes()).hexdigest()
+        # The file is only read when the hash is requested.
+        self.paths[0].write_bytes(b'')
+        self.assertNotEqual(subtitle.get_md5_hash(), expected)
+
+        subtitle = LocalSubtitleFile(self.paths[1])
+        expected = hashlib.md5(self.paths[1].read_bytes()).hexdigest()
+        self.assertEqual(subtitle.get_md5_hash(), expected)
+        self.paths[1].write_bytes(b'')
+        self.assertEqual(subtitle.get_md5_hash(), expected)
+
+    def test_equals_different_size(self):
+        subtitle1 = LocalSubtitleFile(self.paths[0])
+        subtitle2 = LocalSubtitleFile(self.paths[1])
+        self.assertFalse(subtitle1.equals_subtitle_file(subtitle2))
+        self.assertIsNone(subtitle1._md5_hash)
+        self.assertIsNone(subtitle2._md5_hash)
+
+    def test_cache(self):
+        cache = FileHashCache(self.tempdir.path / 'hashes.sqlite')
+        set_default_file_hash_cache(cache)
+        expected = LocalSubtitleFile(self.paths[0]).get_md5_hash()
+        self.assertEqual(len(cache), 1)
+        # Overwrite the contents without changing the identity: the cached hash must be returned.
+        st = self.paths[0].stat()
+        self.paths[0].write_bytes(os.urandom(st.st_size))
+        os.utime(str(self.paths[0]), ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertEqual(LocalSubtitleFile(self.paths[0]).get_md5_hash(), expected)
+        cache.close()
+
+    def test_hash_subtitles(self):
+        subtitles = [LocalSubtitleFile(path) for path in self.paths]
+        self.assertTrue(hash_subtitles(subtitles, ProgressCallback(), workers=4))
+        for subtitle, path in zip(subtitles, self.paths):
+            self.assertEqual(subtitle.get_md5_hash(), hashlib.md5(path.read_bytes()).hexdigest())
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+
+import asyncio
+import gzip
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socket import timeout as SocketTimeout
+from socketserver import ThreadingMixIn
+import threading
+import time
+import unittest
+from xmlrpc.client import Fault, ServerProxy
+from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+
+from subdownloader.cache import HttpResponseCache
+from subdownloader.provider.retry import RetryPolicy
+from subdownloader.provider.transport import AsyncXmlRpcClient, create_transport, fetch_url, KeepAliveTransport, \
+    SafeKeepAliveTransport
+
+
+class KeepAliveRequestHandler(SimpleXMLRPCRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Close idle connections quickly, to test stale connections.
+    timeout = .2
+
+    def setup(self):
+        SimpleXMLRPCRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.nb_connections += 1
+
+    def do_POST(self):
+        with self.server.lock:
+            self.server.accept_encodings.append(self.headers.get('Accept-Encoding'))
+            self.server.content_encodings.append(self.headers.get('Content-Encoding'))
+        SimpleXMLRPCRequestHandler.do_POST(self)
+
+
+class KeepAliveXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+    def __init__(self):
+        SimpleXMLRPCServer.__init__(self, ('127.0.0.1', 0), requestHandler=KeepAliveRequestHandler,
+                                    logRequests=False, allow_none=True)
+        self.lock = threading.Lock()
+        self.nb_connections = 0
+        self.accept_encodings = []
+        self.content_encodings = []
+        self.register_function(lambda data: data, 'Echo')
+        self.register_function(lambda duration: time.sleep(duration), 'Sleep')
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def get_url(self):
+        return 'http://{}:{}/RPC2'.format(*self.server_address)
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+
+class TestKeepAliveTransport(unittest.TestCase):
+    def setUp(self):
+        self.server = KeepAliveXMLRPCServer()
+
+    def tearDown(self):
+        self.server.close()
+
+    def _create_proxy(self, **kwargs):
+        return ServerProxy(self.server.get_url(), transport=create_transport(self.server.get_url(), **kwargs),
+                           allow_none=True)
+
+    def test_create_transport(self):
+        self.assertIsInstance(create_transport('http://localhost/xml-rpc'), KeepAliveTransport)
+        self.assertIsInstance(create_transport('https://localhost/xml-rpc'), SafeKeepAliveTransport)
+
+    def test_reuse_connection(self):
+        proxy = self._create_proxy()
+        for i in range(10):
+            self.assertEqual(proxy.Echo(i), i)
+        self.assertEqual(self.server.nb_connections, 1)
+        proxy('close')()
+
+    def test_gzip(self):
+        proxy = self._create_proxy(gzip_request_threshold=0)
+        data = 'subtitle' * 1000
+        self.assertEqual(proxy.Echo(data), data)
+        self.assertEqual(self.server.accept_encodings, ['gzip'])
+        self.assertEqual(self.server.content_encodings, ['gzip'])
+        proxy('close')()
+
+    def test_no_gzip_request(self):
+        proxy = self._create_proxy()
+        proxy.Echo('subtitle' * 1000)
+        self.assertEqual(self.server.content_encodings, [None])
+        proxy('close')()
+
+    def test_stale_connection(self):
+        proxy = self._create_proxy()
+        self.assertEqual(proxy.Echo(1), 1)
+        # The server closes the idle connection.
+        time.sleep(.5)
+        self.assertEqual(proxy.Echo(2), 2)
+        self.assertEqual(self.server.nb_connections, 2)
+        proxy('close')()
+
+    def test_read_timeout(self):
+        proxy = self._create_proxy(read_timeout=.05)
+        with self.assertRaises(SocketTimeout):
+            proxy.Sleep(.15)
+        proxy('close')()
+
+
+class TestAsyncXmlRpcClient(unittest.TestCase):
+    def setUp(self):
+        self.server = KeepAliveXMLRPCServer()
+        self.addCleanup(self.server.close)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def _create_client(self, **kwargs):
+        client = AsyncXmlRpcClient(self.server.get_url(), **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_reuse_connection(self):
+        client = self._create_client()
+        for i in range(10):
+            self.assertEqual(self.loop.run_until_complete(client.call('Echo', i)), i)
+        self.assertEqual(self.server.nb_connections, 1)
+
+    def test_concurrent(self):
+        client = self._create_client(max_connections=3)
+
+        async def call_all():
+            return await asyncio.gather(*[client.call('Echo', i) for i in range(10)])
+        results = self.loop.run_until_complete(call_all())
+        self.assertEqual(results, list(range(10)))
+        self.assertLessEqual(self.server.nb_connections, 3)
+
+    def test_gzip(self):
+        client = self._create_client()
+        data = 'subtitle' * 1000
+        self.assertEqual(self.loop.run_until_complete(client.call('Echo', data)), data)
+        self.assertEqual(self.server.accept_encodings, ['gzip'])
+
+    def test_stale_connection(self):
+        client = self._create_client()
+        self.assertEqual(self.loop.run_until_complete(client.call('Echo', 1)), 1)
+        # The server closes the idle connection.
+        time.sleep(.5)
+        self.assertEqual(self.loop.run_until_complete(client.call('Echo', 2)), 2)
+        self.assertEqual(self.server.nb_connections, 2)
+
+    def test_read_timeout(self):
+        client = self._create_client(read_timeout=.05)
+        with self.assertRaises(asyncio.TimeoutError):
+            self.loop.run_until_complete(client.call('Sleep', .15))
+
+    def test_fault(self):
+        client = self._create_client()
+        with self.assertRaises(Fault):
+            self.loop.run_until_complete(client.call('Unknown'))
+
+
+class PageRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(dict(self.headers))
+        if self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = server.body
+        self.send_response(200)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('ETag', server.etag)
+        self.send_header('Last-Modified', 'Mon, 01 Apr 2019 10:00:00 GMT')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PageServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), PageRequestHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.body = b'<xml>page</xml>'
+        self.etag = '"1"'
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def get_url(self):
+        return 'http://{}:{}/page'.format(*self.server_address)
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+
+class FixedTimeHttpResponseCache(HttpResponseCache):
+    time = 0.
+
+    @staticmethod
+    def _now():
+        return FixedTimeHttpResponseCache.time
+
+
+class TestFetchUrl(unittest.TestCase):
+    def setUp(self):
+        self.server = PageServer()
+        self.addCleanup(self.server.close)
+        FixedTimeHttpResponseCache.time = 0.
+        self.cache = FixedTimeHttpResponseCache(':memory:', ttl=100.)
+        self.addCleanup(self.cache.close)
+        self.retry_policy = RetryPolicy(max_attempts=1)
+
+    def _fetch(self, cache=None):
+        return fetch_url(self.server.get_url(), self.retry_policy, cache=cache, timeout=5.)
+
+    def test_gzip(self):
+        self.assertEqual(self._fetch(), b'<xml>page</xml>')
+        self.assertEqual(self.server.requests[0]['Accept-Encoding'], 'gzip')
+
+    def test_cache(self):
+        self.assertEqual(self._fetch(self.cache), b'<xml>page</xml>')
+        self.assertEqual(self._fetch(self.cache), b'<xml>page</xml>')
+        # A fresh response is used without contacting the server.
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertNotIn('If-None-Match', self.server.requests[0])
+
+    def test_revalidate(self):
+        self._fetch(self.cache)
+        FixedTimeHttpResponseCache.time = 150.
+        self.assertEqual(self._fetch(self.cache), b'<xml>page</xml>')
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.requests[1]['If-None-Match'], '"1"')
+        self.assertEqual(self.server.requests[1]['If-Modified-Since'], 'Mon, 01 Apr 2019 10:00:00 GMT')
+        # The server told the response is still valid.
+        self.assertTrue(self.cache.get_response(self.server.get_url()).fresh)
+
+    def test_revalidate_modified(self):
+        self._fetch(self.cache)
+        FixedTimeHttpResponseCache.time = 150.
+        self.server.body = b'<xml>new page</xml>'
+        self.server.etag = '"2"'
+        self.assertEqual(self._fetch(self.cache), b'<xml>new page</xml>')
+        self.assertEqual(self.cache.get_response(self.server.get_url()).etag, '"2"')
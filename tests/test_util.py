@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
+
+import base64
+import gzip
+import unittest
+
+from subdownloader.util import iter_unzip_base64
+
+
+class TestUnzipBase64(unittest.TestCase):
+    CONTENTS = b''.join('{} subtitle line\n'.format(i).encode() for i in range(1000))
+
+    def _decode(self, data, chunk_size):
+        compressed_chunks, chunks = zip(*iter_unzip_base64(data, chunk_size=chunk_size))
+        return b''.join(compressed_chunks), b''.join(chunks)
+
+    def test_chunks(self):
+        compressed = gzip.compress(self.CONTENTS)
+        data = base64.b64encode(compressed).decode()
+        for chunk_size in (1, 7, 64, len(data), 2 * len(data)):
+            self.assertEqual(self._decode(data, chunk_size), (compressed, self.CONTENTS))
+
+    def test_whitespace(self):
+        compressed = gzip.compress(self.CONTENTS)
+        data = base64.encodebytes(compressed).decode()
+        self.assertIn('\n', data)
+        self.assertEqual(self._decode(data, 10), (compressed, self.CONTENTS))
+
+    def test_truncated(self):
+        data = base64.b64encode(gzip.compress(self.CONTENTS)[:-20]).decode()
+        with self.assertRaises(EOFError):
+            self._decode(data, 64)
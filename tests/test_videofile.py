@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 # Copyright (c) 2019 SubDownloader Developers - See COPYING - GPLv3
 
+import os
 import unittest
 
 from tests.resources import resources_init, RESOURCE_AVI, RESOURCE_PATH
+from tests.util import create_temporary_directory
 
-from subdownloader.video2 import VideoFile, NotAVideoException
+from subdownloader.callback import ProgressCallback
+from subdownloader.video2 import VideoFile, NotAVideoException, hash_videos
 from subdownloader.metadata import available as metadata_available
 
 
@@ -40,3 +43,32 @@ class TestVideofile(unittest.TestCase):
 
     def test_subtitles_initial(self):
         self.assertListEqual(self.v.get_subtitles().get_subtitle_networks(), [])
+
+
+class TestHashVideos(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = create_temporary_directory()
+        self.paths = []
+        for i in range(20):
+            path = self.tempdir.path / 'movie{}.avi'.format(i)
+            path.write_bytes(os.urandom((i + 1) << 13))
+            self.paths.append(path)
+
+    def tearDown(self):
+        del self.tempdir
+
+    def test_hash_videos(self):
+        videos = [VideoFile(path) for path in self.paths]
+        self.assertTrue(hash_videos(videos, ProgressCallback(), workers=4))
+        for video, path in zip(videos, self.paths):
+            self.assertEqual(video.get_size(), path.stat().st_size)
+            self.assertEqual(video.get_osdb_hash(), VideoFile(path).calculate_osdb_hash())
+
+    def test_hash_videos_cancel(self):
+        class CancelCallback(ProgressCallback):
+            def on_update(self, value, *args, **kwargs):
+                if value:
+                    self.cancel()
+
+        videos = [VideoFile(path) for path in self.paths]
+        self.assertFalse(hash_videos(videos, CancelCallback(), workers=1))